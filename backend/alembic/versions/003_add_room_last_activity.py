@@ -0,0 +1,40 @@
+"""Add last_activity_at column to messenger_room_mappings
+
+Revision ID: 003_room_activity
+Revises: 002_ext_client
+Create Date: 2026-10-19
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+revision: str = "003_room_activity"
+down_revision: Union[str, None] = "002_ext_client"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    conn = op.get_bind()
+    inspector = sa.inspect(conn)
+    columns = [c["name"] for c in inspector.get_columns("messenger_room_mappings")]
+    indexes = [i["name"] for i in inspector.get_indexes("messenger_room_mappings")]
+
+    if "last_activity_at" not in columns:
+        op.add_column(
+            "messenger_room_mappings",
+            sa.Column("last_activity_at", sa.DateTime(timezone=True), nullable=True),
+        )
+    if "ix_messenger_room_mappings_last_activity_at" not in indexes:
+        op.create_index(
+            "ix_messenger_room_mappings_last_activity_at",
+            "messenger_room_mappings",
+            ["last_activity_at"],
+        )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_messenger_room_mappings_last_activity_at", table_name="messenger_room_mappings")
+    op.drop_column("messenger_room_mappings", "last_activity_at")
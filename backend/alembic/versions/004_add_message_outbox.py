@@ -0,0 +1,56 @@
+"""Add messenger_message_outbox table for asynchronous sends
+
+Revision ID: 004_message_outbox
+Revises: 003_room_activity
+Create Date: 2026-10-19
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+revision: str = "004_message_outbox"
+down_revision: Union[str, None] = "003_room_activity"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    conn = op.get_bind()
+    inspector = sa.inspect(conn)
+    if "messenger_message_outbox" in inspector.get_table_names():
+        return
+
+    op.create_table(
+        "messenger_message_outbox",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("provisional_id", sa.String(255), nullable=False),
+        sa.Column("room_id", sa.String(255), nullable=False),
+        sa.Column("sender_hub_user_id", sa.String(255), nullable=False),
+        sa.Column("content", sa.Text(), nullable=False),
+        sa.Column(
+            "status",
+            sa.Enum("pending", "sent", "failed", name="outboxstatus"),
+            nullable=False,
+            server_default="pending",
+        ),
+        sa.Column("matrix_event_id", sa.String(255), nullable=True),
+        sa.Column("attempts", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("error_message", sa.Text(), nullable=True),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+        sa.Column("delivered_at", sa.DateTime(timezone=True), nullable=True),
+    )
+    op.create_index("ix_messenger_message_outbox_id", "messenger_message_outbox", ["id"])
+    op.create_index(
+        "ix_messenger_message_outbox_provisional_id",
+        "messenger_message_outbox",
+        ["provisional_id"],
+        unique=True,
+    )
+    op.create_index("ix_messenger_message_outbox_status", "messenger_message_outbox", ["status"])
+
+
+def downgrade() -> None:
+    op.drop_table("messenger_message_outbox")
+    sa.Enum(name="outboxstatus").drop(op.get_bind(), checkfirst=True)
@@ -0,0 +1,43 @@
+"""Add target_user and status index to messenger_notification_log
+
+Notifications are now accepted into the log as an outbox and routed by
+background workers, which need the DM target and a cheap pending lookup.
+
+Revision ID: 005_notification_outbox
+Revises: 004_message_outbox
+Create Date: 2026-10-19
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+revision: str = "005_notification_outbox"
+down_revision: Union[str, None] = "004_message_outbox"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    conn = op.get_bind()
+    inspector = sa.inspect(conn)
+    columns = [c["name"] for c in inspector.get_columns("messenger_notification_log")]
+    indexes = [i["name"] for i in inspector.get_indexes("messenger_notification_log")]
+
+    if "target_user" not in columns:
+        op.add_column(
+            "messenger_notification_log",
+            sa.Column("target_user", sa.String(255), nullable=True),
+        )
+    if "ix_messenger_notification_log_status" not in indexes:
+        op.create_index(
+            "ix_messenger_notification_log_status",
+            "messenger_notification_log",
+            ["status"],
+        )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_messenger_notification_log_status", table_name="messenger_notification_log")
+    op.drop_column("messenger_notification_log", "target_user")
@@ -0,0 +1,58 @@
+"""Add retry bookkeeping and the dead-letter status to messenger_notification_log
+
+Revision ID: 006_notification_retry
+Revises: 005_notification_outbox
+Create Date: 2026-10-19
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+revision: str = "006_notification_retry"
+down_revision: Union[str, None] = "005_notification_outbox"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    conn = op.get_bind()
+    inspector = sa.inspect(conn)
+    columns = [c["name"] for c in inspector.get_columns("messenger_notification_log")]
+    indexes = [i["name"] for i in inspector.get_indexes("messenger_notification_log")]
+
+    if conn.dialect.name == "postgresql":
+        # New ENUM values cannot be added inside a transaction block on older PostgreSQL
+        with op.get_context().autocommit_block():
+            op.execute("ALTER TYPE notificationstatus ADD VALUE IF NOT EXISTS 'dead'")
+
+    if "attempts" not in columns:
+        op.add_column(
+            "messenger_notification_log",
+            sa.Column("attempts", sa.Integer(), nullable=False, server_default="0"),
+        )
+    if "max_attempts" not in columns:
+        op.add_column(
+            "messenger_notification_log",
+            sa.Column("max_attempts", sa.Integer(), nullable=True),
+        )
+    if "next_attempt_at" not in columns:
+        op.add_column(
+            "messenger_notification_log",
+            sa.Column("next_attempt_at", sa.DateTime(timezone=True), nullable=True),
+        )
+    if "ix_messenger_notification_log_next_attempt_at" not in indexes:
+        op.create_index(
+            "ix_messenger_notification_log_next_attempt_at",
+            "messenger_notification_log",
+            ["next_attempt_at"],
+        )
+
+
+def downgrade() -> None:
+    # The 'dead' ENUM value is left in place (PostgreSQL cannot drop ENUM values)
+    op.drop_index("ix_messenger_notification_log_next_attempt_at", table_name="messenger_notification_log")
+    op.drop_column("messenger_notification_log", "next_attempt_at")
+    op.drop_column("messenger_notification_log", "max_attempts")
+    op.drop_column("messenger_notification_log", "attempts")
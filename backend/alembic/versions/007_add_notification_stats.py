@@ -0,0 +1,57 @@
+"""Add messenger_notification_stats hourly rollup table
+
+Revision ID: 007_notification_stats
+Revises: 006_notification_retry
+Create Date: 2026-10-19
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+revision: str = "007_notification_stats"
+down_revision: Union[str, None] = "006_notification_retry"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    conn = op.get_bind()
+    inspector = sa.inspect(conn)
+    if "messenger_notification_stats" in inspector.get_table_names():
+        return
+
+    op.create_table(
+        "messenger_notification_stats",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("bucket", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("source_app", sa.String(100), nullable=False),
+        sa.Column("event_type", sa.String(100), nullable=False),
+        sa.Column("status", sa.String(20), nullable=False),
+        sa.Column("count", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("latency_sum_seconds", sa.Float(), nullable=False, server_default="0"),
+        sa.Column("latency_max_seconds", sa.Float(), nullable=False, server_default="0"),
+        sa.UniqueConstraint(
+            "bucket", "source_app", "event_type", "status", name="uq_notification_stats_key"
+        ),
+    )
+    op.create_index("ix_messenger_notification_stats_id", "messenger_notification_stats", ["id"])
+    op.create_index("ix_messenger_notification_stats_bucket", "messenger_notification_stats", ["bucket"])
+
+    if conn.dialect.name == "postgresql":
+        # Backfill final outcomes already in the log (failed attempts were not recorded)
+        op.execute(
+            """
+            INSERT INTO messenger_notification_stats
+                (bucket, source_app, event_type, status, count, latency_sum_seconds, latency_max_seconds)
+            SELECT date_trunc('hour', created_at), source_app, event_type, status::text, count(*), 0, 0
+            FROM messenger_notification_log
+            WHERE status::text IN ('sent', 'failed', 'dead') AND created_at IS NOT NULL
+            GROUP BY 1, 2, 3, 4
+            """
+        )
+
+
+def downgrade() -> None:
+    op.drop_table("messenger_notification_stats")
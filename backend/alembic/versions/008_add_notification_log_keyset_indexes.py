@@ -0,0 +1,48 @@
+"""Add composite indexes for keyset pagination of messenger_notification_log
+
+Revision ID: 008_notification_log_keyset
+Revises: 007_notification_stats
+Create Date: 2026-10-19
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+revision: str = "008_notification_log_keyset"
+down_revision: Union[str, None] = "007_notification_stats"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+INDEXES = {
+    "ix_notification_log_created_id": ["created_at", "id"],
+    "ix_notification_log_source_created_id": ["source_app", "created_at", "id"],
+    "ix_notification_log_status_created_id": ["status", "created_at", "id"],
+}
+
+
+def upgrade() -> None:
+    conn = op.get_bind()
+    inspector = sa.inspect(conn)
+    indexes = [i["name"] for i in inspector.get_indexes("messenger_notification_log")]
+
+    for name, columns in INDEXES.items():
+        if name in indexes:
+            continue
+        if conn.dialect.name == "postgresql":
+            # Build without blocking writes to the (possibly large) log table
+            with op.get_context().autocommit_block():
+                op.create_index(
+                    name,
+                    "messenger_notification_log",
+                    columns,
+                    postgresql_concurrently=True,
+                )
+        else:
+            op.create_index(name, "messenger_notification_log", columns)
+
+
+def downgrade() -> None:
+    for name in INDEXES:
+        op.drop_index(name, table_name="messenger_notification_log")
@@ -0,0 +1,81 @@
+"""Add unique room_key to messenger_room_mappings
+
+Revision ID: 009_room_key
+Revises: 008_notification_log_keyset
+Create Date: 2026-10-19
+
+"""
+from typing import Optional, Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+revision: str = "009_room_key"
+down_revision: Union[str, None] = "008_notification_log_keyset"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _room_key(room_type, display_name, tenant_id, entity_type, entity_id) -> Optional[str]:
+    """Same keys as app.services.room_manager assigns to new rooms."""
+    room_type = getattr(room_type, "value", room_type)
+    if room_type == "general" and display_name == "Allgemein" and tenant_id is not None:
+        return f"general:{tenant_id}"
+    if room_type == "service" and entity_type:
+        return f"service:{entity_type}"
+    if room_type == "entity" and entity_type and entity_id is not None:
+        return f"entity:{entity_type}:{entity_id}"
+    if room_type == "dm" and display_name:
+        if display_name.startswith("notification_dm:"):
+            return display_name
+        # "dm:@user1:server:@user2:server"
+        parts = display_name.split(":")
+        if parts[0] == "dm" and len(parts) == 5:
+            users = sorted((f"{parts[1]}:{parts[2]}", f"{parts[3]}:{parts[4]}"))
+            return "dm:" + ":".join(users)
+    return None
+
+
+def upgrade() -> None:
+    conn = op.get_bind()
+    inspector = sa.inspect(conn)
+    columns = [c["name"] for c in inspector.get_columns("messenger_room_mappings")]
+    indexes = [i["name"] for i in inspector.get_indexes("messenger_room_mappings")]
+
+    if "room_key" not in columns:
+        op.add_column(
+            "messenger_room_mappings",
+            sa.Column("room_key", sa.String(255), nullable=True),
+        )
+
+        # Backfill; of duplicates created by earlier races the oldest keeps the key
+        rows = conn.execute(sa.text(
+            "SELECT id, room_type, display_name, tenant_id, entity_type, entity_id "
+            "FROM messenger_room_mappings ORDER BY id"
+        )).all()
+        seen = set()
+        updates = []
+        for row in rows:
+            key = _room_key(*row[1:])
+            if key is None or key in seen:
+                continue
+            seen.add(key)
+            updates.append({"id": row[0], "room_key": key})
+        if updates:
+            conn.execute(
+                sa.text("UPDATE messenger_room_mappings SET room_key = :room_key WHERE id = :id"),
+                updates,
+            )
+
+    if "ix_messenger_room_mappings_room_key" not in indexes:
+        op.create_index(
+            "ix_messenger_room_mappings_room_key",
+            "messenger_room_mappings",
+            ["room_key"],
+            unique=True,
+        )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_messenger_room_mappings_room_key", table_name="messenger_room_mappings")
+    op.drop_column("messenger_room_mappings", "room_key")
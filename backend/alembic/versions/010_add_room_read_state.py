@@ -0,0 +1,44 @@
+"""Add message_count to messenger_room_mappings and messenger_room_read_state
+
+Revision ID: 010_room_read_state
+Revises: 009_room_key
+Create Date: 2026-10-19
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+revision: str = "010_room_read_state"
+down_revision: Union[str, None] = "009_room_key"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    conn = op.get_bind()
+    inspector = sa.inspect(conn)
+    columns = [c["name"] for c in inspector.get_columns("messenger_room_mappings")]
+
+    if "message_count" not in columns:
+        op.add_column(
+            "messenger_room_mappings",
+            sa.Column("message_count", sa.Integer(), nullable=False, server_default="0"),
+        )
+
+    if "messenger_room_read_state" not in inspector.get_table_names():
+        op.create_table(
+            "messenger_room_read_state",
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("hub_user_id", sa.String(255), nullable=False),
+            sa.Column("matrix_room_id", sa.String(255), nullable=False),
+            sa.Column("read_count", sa.Integer(), nullable=False, server_default="0"),
+            sa.Column("read_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+            sa.UniqueConstraint("hub_user_id", "matrix_room_id", name="uq_room_read_state_user_room"),
+        )
+
+
+def downgrade() -> None:
+    op.drop_table("messenger_room_read_state")
+    op.drop_column("messenger_room_mappings", "message_count")
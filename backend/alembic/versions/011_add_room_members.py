@@ -0,0 +1,37 @@
+"""Add messenger_room_members
+
+Revision ID: 011_room_members
+Revises: 010_room_read_state
+Create Date: 2026-10-19
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+revision: str = "011_room_members"
+down_revision: Union[str, None] = "010_room_read_state"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    conn = op.get_bind()
+    inspector = sa.inspect(conn)
+
+    # Filled lazily from Conduit's joined_rooms on each user's next room list
+    if "messenger_room_members" not in inspector.get_table_names():
+        op.create_table(
+            "messenger_room_members",
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("matrix_user_id", sa.String(255), nullable=False),
+            sa.Column("matrix_room_id", sa.String(255), nullable=False),
+            sa.UniqueConstraint("matrix_user_id", "matrix_room_id", name="uq_room_members_user_room"),
+        )
+        op.create_index("ix_messenger_room_members_matrix_user_id", "messenger_room_members", ["matrix_user_id"])
+        op.create_index("ix_messenger_room_members_matrix_room_id", "messenger_room_members", ["matrix_room_id"])
+
+
+def downgrade() -> None:
+    op.drop_table("messenger_room_members")
@@ -0,0 +1,45 @@
+"""Scope message outbox provisional IDs (client txn_ids) per sender
+
+Revision ID: 012_outbox_txn_scope
+Revises: 011_room_members
+Create Date: 2026-10-19
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+revision: str = "012_outbox_txn_scope"
+down_revision: Union[str, None] = "011_room_members"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+TABLE = "messenger_message_outbox"
+
+
+def upgrade() -> None:
+    conn = op.get_bind()
+    inspector = sa.inspect(conn)
+    indexes = {i["name"]: i for i in inspector.get_indexes(TABLE)}
+
+    old = indexes.get("ix_messenger_message_outbox_provisional_id")
+    if old is not None and old.get("unique"):
+        op.drop_index("ix_messenger_message_outbox_provisional_id", table_name=TABLE)
+        old = None
+    if old is None:
+        op.create_index("ix_messenger_message_outbox_provisional_id", TABLE, ["provisional_id"])
+
+    if "ix_messenger_message_outbox_sender_provisional_id" not in indexes:
+        op.create_index(
+            "ix_messenger_message_outbox_sender_provisional_id",
+            TABLE,
+            ["sender_hub_user_id", "provisional_id"],
+            unique=True,
+        )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_messenger_message_outbox_sender_provisional_id", table_name=TABLE)
+    op.drop_index("ix_messenger_message_outbox_provisional_id", table_name=TABLE)
+    op.create_index("ix_messenger_message_outbox_provisional_id", TABLE, ["provisional_id"], unique=True)
@@ -21,6 +21,7 @@ async def _get_or_create_hub_shadow_user(hub_info: dict, db: Session) -> models.
     Automatically provisions the user on Matrix if not yet provisioned.
     """
     from app.hub_sso import map_hub_role
+    from app.services.user_directory import user_directory
     from app.services.user_provisioning import provision_matrix_user
 
     username = hub_info["username"]
@@ -57,6 +58,7 @@ async def _get_or_create_hub_shadow_user(hub_info: dict, db: Session) -> models.
             db.add(mapping)
             db.commit()
             db.refresh(mapping)
+            user_directory.update(mapping)
     else:
         changed = False
         if hub_info.get("display_name") and mapping.display_name != hub_info["display_name"]:
@@ -71,6 +73,7 @@ async def _get_or_create_hub_shadow_user(hub_info: dict, db: Session) -> models.
         if changed:
             db.commit()
             db.refresh(mapping)
+            user_directory.update(mapping)
 
         # Provision on Matrix if not yet done
         if not mapping.matrix_access_token_encrypted:
@@ -60,6 +60,93 @@ MATRIX_HS_TOKEN = os.getenv("MATRIX_HS_TOKEN", "messenger-hs-token-change-me")
 
 # Cross-App Notification
 MESSENGER_SERVICE_TOKEN = os.getenv("MESSENGER_SERVICE_TOKEN", "messenger-service-token-change-me")
+# Per-satellite service tokens "source_app=token,..." (bound to that source_app; the shared token stays valid)
+MESSENGER_SERVICE_TOKENS = {
+    token.strip(): source.strip()
+    for source, _, token in (
+        part.partition("=") for part in os.getenv("MESSENGER_SERVICE_TOKENS", "").split(",")
+    )
+    if source.strip() and token.strip()
+}
+# Tenants a bound token may address by role/tenant fan-out: "source_app=1|2,..." (unlisted sources: none)
+MESSENGER_SERVICE_TOKEN_TENANTS = {
+    source.strip(): {int(tenant) for tenant in tenants.split("|") if tenant.strip()}
+    for source, _, tenants in (
+        part.partition("=") for part in os.getenv("MESSENGER_SERVICE_TOKEN_TENANTS", "").split(",")
+    )
+    if source.strip()
+}
+# Token bucket per source_app (0 disables); overrides as "source_app=rate[:burst],..."
+NOTIFICATION_RATE_PER_SECOND = float(os.getenv("NOTIFICATION_RATE_PER_SECOND", "0"))
+NOTIFICATION_RATE_BURST = float(os.getenv("NOTIFICATION_RATE_BURST", "0"))
+NOTIFICATION_RATE_LIMITS = os.getenv("NOTIFICATION_RATE_LIMITS", "")
+# Workers draining the notification outbox (0 routes notifications inside the request)
+NOTIFICATION_WORKERS = int(os.getenv("NOTIFICATION_WORKERS", "4"))
+# Batch ingest (POST /notifications/send-batch)
+NOTIFICATION_BATCH_MAX_ITEMS = int(os.getenv("NOTIFICATION_BATCH_MAX_ITEMS", "500"))
+NOTIFICATION_BATCH_CONCURRENCY = int(os.getenv("NOTIFICATION_BATCH_CONCURRENCY", "8"))
+# Failed notifications are retried with exponential backoff, then dead-lettered
+NOTIFICATION_MAX_ATTEMPTS = int(os.getenv("NOTIFICATION_MAX_ATTEMPTS", "5"))
+NOTIFICATION_RETRY_BASE_SECONDS = float(os.getenv("NOTIFICATION_RETRY_BASE_SECONDS", "10"))
+NOTIFICATION_RETRY_MAX_DELAY_SECONDS = float(os.getenv("NOTIFICATION_RETRY_MAX_DELAY_SECONDS", "900"))
+# Retry scheduler: at most BATCH_SIZE rows per INTERVAL (0 disables); pending rows older than STALE are picked up too
+NOTIFICATION_RETRY_INTERVAL_SECONDS = float(os.getenv("NOTIFICATION_RETRY_INTERVAL_SECONDS", "5"))
+NOTIFICATION_RETRY_BATCH_SIZE = int(os.getenv("NOTIFICATION_RETRY_BATCH_SIZE", "50"))
+NOTIFICATION_RETRY_STALE_SECONDS = int(os.getenv("NOTIFICATION_RETRY_STALE_SECONDS", "600"))
+# Bot accounts notifications are spread over, sharded by room (1 = only notification_bot)
+NOTIFICATION_BOT_POOL_SIZE = max(1, int(os.getenv("NOTIFICATION_BOT_POOL_SIZE", "1")))
+# Resolved notification targets (target -> room ID) kept in memory
+NOTIFICATION_TARGET_CACHE_SIZE = int(os.getenv("NOTIFICATION_TARGET_CACHE_SIZE", "10000"))
+# Collapse non-urgent notifications per (source_app, event_type, target) into one digest per window (0 disables)
+NOTIFICATION_AGGREGATE_WINDOW_SECONDS = float(os.getenv("NOTIFICATION_AGGREGATE_WINDOW_SECONDS", "0"))
+# Delete sent/dead notification log rows older than RETENTION_DAYS (0 keeps everything), in chunks of BATCH_SIZE;
+# with an ARCHIVE_DIR they are appended to daily JSONL files there first
+NOTIFICATION_LOG_RETENTION_DAYS = int(os.getenv("NOTIFICATION_LOG_RETENTION_DAYS", "0"))
+NOTIFICATION_LOG_RETENTION_BATCH_SIZE = int(os.getenv("NOTIFICATION_LOG_RETENTION_BATCH_SIZE", "1000"))
+NOTIFICATION_LOG_RETENTION_INTERVAL_SECONDS = float(os.getenv("NOTIFICATION_LOG_RETENTION_INTERVAL_SECONDS", "3600"))
+NOTIFICATION_LOG_ARCHIVE_DIR = os.getenv("NOTIFICATION_LOG_ARCHIVE_DIR", "")
+# Write-behind of notification delivery results: flushed in bulk every INTERVAL ms or at MAX_ROWS (0 writes them inline)
+NOTIFICATION_STATUS_FLUSH_INTERVAL_MS = int(os.getenv("NOTIFICATION_STATUS_FLUSH_INTERVAL_MS", "200"))
+NOTIFICATION_STATUS_FLUSH_MAX_ROWS = int(os.getenv("NOTIFICATION_STATUS_FLUSH_MAX_ROWS", "500"))
+
+# Recipients of a room's notification SSE events (DM target, tenant or members) are cached this long
+SSE_AUDIENCE_TTL_SECONDS = int(os.getenv("SSE_AUDIENCE_TTL_SECONDS", "60"))
+
+# Joined rooms per user are stored in the database; re-read from Conduit after this long (external clients)
+ROOM_MEMBERSHIP_SYNC_SECONDS = int(os.getenv("ROOM_MEMBERSHIP_SYNC_SECONDS", "300"))
+# Concurrent provision/invite/join of one bulk invite (POST /rooms/{room_id}/invite-bulk)
+ROOM_INVITE_CONCURRENCY = int(os.getenv("ROOM_INVITE_CONCURRENCY", "8"))
+# Entities per request of the room/unread-badge lookup (POST /rooms/entities/lookup)
+ROOM_LOOKUP_MAX_ITEMS = int(os.getenv("ROOM_LOOKUP_MAX_ITEMS", "1000"))
+# Concurrent Matrix joins of the background membership reconciler for service rooms
+ROOM_RECONCILE_CONCURRENCY = int(os.getenv("ROOM_RECONCILE_CONCURRENCY", "20"))
+# Bulk pre-provisioning of entity rooms (POST /notifications/entity-rooms): items per request, concurrent room creations
+ROOM_PROVISION_MAX_ITEMS = int(os.getenv("ROOM_PROVISION_MAX_ITEMS", "5000"))
+ROOM_PROVISION_CONCURRENCY = int(os.getenv("ROOM_PROVISION_CONCURRENCY", "8"))
+
+# Recent-message ring buffer serving the first history page (0 disables)
+MESSAGE_CACHE_ROOM_SIZE = int(os.getenv("MESSAGE_CACHE_ROOM_SIZE", "200"))
+MESSAGE_CACHE_MAX_ROOMS = int(os.getenv("MESSAGE_CACHE_MAX_ROOMS", "500"))
+# Re-check Conduit after this long, to pick up messages sent by external Matrix clients
+MESSAGE_CACHE_TTL_SECONDS = int(os.getenv("MESSAGE_CACHE_TTL_SECONDS", "300"))
+
+# Asynchronous message delivery ("Prefer: respond-async" or always when enabled)
+MESSAGE_SEND_ASYNC = os.getenv("MESSAGE_SEND_ASYNC", "false").strip().lower() in ("1", "true", "yes")
+MESSAGE_SEND_WORKERS = int(os.getenv("MESSAGE_SEND_WORKERS", "4"))
+MESSAGE_SEND_MAX_ATTEMPTS = int(os.getenv("MESSAGE_SEND_MAX_ATTEMPTS", "3"))
+
+# Batch message sends
+MESSAGE_BATCH_MAX_ITEMS = int(os.getenv("MESSAGE_BATCH_MAX_ITEMS", "100"))
+MESSAGE_BATCH_CONCURRENCY = int(os.getenv("MESSAGE_BATCH_CONCURRENCY", "8"))
+
+# Client transaction IDs remembered for idempotent send retries
+TXN_CACHE_TTL_SECONDS = int(os.getenv("TXN_CACHE_TTL_SECONDS", "600"))
+TXN_CACHE_MAX_ENTRIES = int(os.getenv("TXN_CACHE_MAX_ENTRIES", "10000"))
+# Delete delivered/failed message outbox rows this long after they were queued (0 keeps them);
+# never sooner than TXN_CACHE_TTL_SECONDS, since the rows also answer retried txn_ids
+MESSAGE_OUTBOX_RETENTION_SECONDS = int(os.getenv("MESSAGE_OUTBOX_RETENTION_SECONDS", "86400"))
+if 0 < MESSAGE_OUTBOX_RETENTION_SECONDS < TXN_CACHE_TTL_SECONDS:
+    MESSAGE_OUTBOX_RETENTION_SECONDS = TXN_CACHE_TTL_SECONDS
 
 # CORS - use whitelist in production
 ALLOWED_ORIGINS = os.getenv("ALLOWED_ORIGINS", "")
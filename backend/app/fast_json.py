@@ -0,0 +1,41 @@
+"""Fast JSON encoding for hot response paths.
+
+Uses orjson when it is installed and falls back to the standard
+library otherwise. Datetimes are written like Pydantic writes them
+(ISO 8601, UTC as ``Z``), so clients see the same format either way.
+"""
+
+import json
+from datetime import datetime
+from typing import Any
+
+from fastapi.responses import Response
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional speedup
+    orjson = None
+
+
+def _default(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return value.isoformat().replace("+00:00", "Z")
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(content: Any) -> bytes:
+    """Serialize plain dicts/lists (with datetimes) to JSON bytes."""
+    if orjson is not None:
+        return orjson.dumps(content, option=orjson.OPT_UTC_Z)
+    return json.dumps(
+        content, default=_default, ensure_ascii=False, separators=(",", ":")
+    ).encode("utf-8")
+
+
+class FastJSONResponse(Response):
+    """JSON response for pre-shaped payloads that skips model validation."""
+
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
@@ -13,6 +13,12 @@ from app.routers import admin, auth, messages, rooms, users, notifications, heal
 from app.services.user_provisioning import provision_bot_user
 from app.services.matrix_client import matrix_client
 from app.services.encryption import migrate_encrypt_if_needed
+from app.services.notification_router import aggregator as notification_aggregator
+from app.services.notification_router import bot_pool as notification_bot_pool
+from app.services.jobs import jobs as background_jobs
+from app.services.notification_writer import status_writer as notification_status_writer
+from app.services.user_directory import user_directory
+from app.services import notification_pipeline, notification_retention, notification_retry, send_pipeline
 
 # Logging
 _level_map = {
@@ -199,23 +205,58 @@ async def on_startup():
     finally:
         db.close()
 
-    # Provision notification bot
+    # Provision notification bot (and the extra accounts of the bot pool)
     db = SessionLocal()
     try:
-        try:
-            await provision_bot_user(
-                bot_name="notification_bot",
-                display_name="Notification Bot",
-                db=db,
-            )
-            logger.info("Notification bot provisioned.")
-        except Exception as e:
-            logger.warning(
-                "Could not provision notification bot (Conduit may not be ready): %s", e
-            )
+        for bot_name in notification_bot_pool.names:
+            try:
+                await provision_bot_user(
+                    bot_name=bot_name,
+                    display_name="Notification Bot",
+                    db=db,
+                )
+                logger.info("Notification bot %s provisioned.", bot_name)
+            except Exception as e:
+                logger.warning(
+                    "Could not provision notification bot %s (Conduit may not be ready): %s",
+                    bot_name, e,
+                )
+        notification_bot_pool.load(db)
+    except Exception as e:
+        logger.warning("Could not load notification bot pool (non-fatal): %s", e)
     finally:
         db.close()
 
+    # Warm the in-process user directory
+    db = SessionLocal()
+    try:
+        user_directory.load(db)
+    except Exception as e:
+        logger.warning("Could not load user directory (non-fatal): %s", e)
+    finally:
+        db.close()
+
+    # Start asynchronous message delivery
+    try:
+        await send_pipeline.start()
+    except Exception as e:
+        logger.warning("Could not start message send pipeline: %s", e)
+
+    # Bulk writes of notification delivery results
+    notification_status_writer.start()
+
+    # Start the notification outbox workers
+    try:
+        await notification_pipeline.start()
+    except Exception as e:
+        logger.warning("Could not start notification pipeline: %s", e)
+
+    # Retry failed notifications in the background
+    notification_retry.start()
+
+    # Expire old notification log rows in the background
+    notification_retention.start()
+
 
 def _migrate_enum_types() -> None:
     """Ensure PostgreSQL ENUM types have all required values.
@@ -224,31 +265,36 @@ def _migrate_enum_types() -> None:
     so we need to add new values manually.
     """
     from sqlalchemy import text
-    from app.models import RoomType
+    from app.models import NotificationStatus, RoomType
 
     with engine.connect() as conn:
-        # Get existing ENUM values
-        result = conn.execute(text(
-            "SELECT enumlabel FROM pg_enum "
-            "WHERE enumtypid = (SELECT oid FROM pg_type WHERE typname = 'roomtype')"
-        ))
-        existing_values = {row[0] for row in result}
-
-        if not existing_values:
-            # ENUM doesn't exist yet, will be created by create_all()
-            return
-
-        # Add missing values
-        for room_type in RoomType:
-            if room_type.value not in existing_values:
-                try:
-                    conn.execute(text(
-                        f"ALTER TYPE roomtype ADD VALUE '{room_type.value}'"
-                    ))
-                    conn.commit()
-                    logger.info("Added ENUM value 'roomtype.%s'", room_type.value)
-                except Exception as e:
-                    logger.warning("Could not add ENUM value '%s': %s", room_type.value, e)
+        for type_name, enum_cls in (
+            ("roomtype", RoomType),
+            ("notificationstatus", NotificationStatus),
+        ):
+            # Get existing ENUM values
+            result = conn.execute(text(
+                "SELECT enumlabel FROM pg_enum "
+                "WHERE enumtypid = (SELECT oid FROM pg_type WHERE typname = :name)"
+            ), {"name": type_name})
+            existing_values = {row[0] for row in result}
+
+            if not existing_values:
+                # ENUM doesn't exist yet, will be created by create_all()
+                continue
+
+            # Add missing values
+            for member in enum_cls:
+                if member.value not in existing_values:
+                    try:
+                        conn.execute(text(
+                            f"ALTER TYPE {type_name} ADD VALUE '{member.value}'"
+                        ))
+                        conn.commit()
+                        logger.info("Added ENUM value '%s.%s'", type_name, member.value)
+                    except Exception as e:
+                        conn.rollback()
+                        logger.warning("Could not add ENUM value '%s': %s", member.value, e)
 
 
 def _migrate_plaintext_tokens(db) -> None:
@@ -287,6 +333,13 @@ def _migrate_plaintext_tokens(db) -> None:
 
 @app.on_event("shutdown")
 async def on_shutdown():
+    await notification_retention.stop()
+    await notification_retry.stop()
+    await notification_pipeline.stop()
+    await notification_aggregator.flush_all()
+    await notification_status_writer.stop()
+    await background_jobs.stop()
+    await send_pipeline.stop()
     await matrix_client.close()
 
 
@@ -1,11 +1,17 @@
 from app.models.user_mapping import UserMapping
-from app.models.room import RoomMapping, RoomType
-from app.models.notification import NotificationLog, NotificationStatus
+from app.models.room import RoomMapping, RoomMember, RoomReadState, RoomType
+from app.models.notification import NotificationLog, NotificationStat, NotificationStatus
+from app.models.message_outbox import MessageOutbox, OutboxStatus
 
 __all__ = [
     "UserMapping",
     "RoomMapping",
+    "RoomMember",
+    "RoomReadState",
     "RoomType",
     "NotificationLog",
     "NotificationStatus",
+    "NotificationStat",
+    "MessageOutbox",
+    "OutboxStatus",
 ]
@@ -0,0 +1,38 @@
+import enum
+
+from sqlalchemy import Column, Integer, String, Text, DateTime, Enum, Index, func
+
+from app.database import Base
+
+
+class OutboxStatus(str, enum.Enum):
+    pending = "pending"
+    sent = "sent"
+    failed = "failed"
+
+
+class MessageOutbox(Base):
+    """Messages accepted for asynchronous delivery to Matrix."""
+
+    __tablename__ = "messenger_message_outbox"
+    __table_args__ = (
+        # Client txn_ids are scoped per sender, like Matrix scopes them per access token
+        Index(
+            "ix_messenger_message_outbox_sender_provisional_id",
+            "sender_hub_user_id",
+            "provisional_id",
+            unique=True,
+        ),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    provisional_id = Column(String(255), nullable=False, index=True)
+    room_id = Column(String(255), nullable=False)
+    sender_hub_user_id = Column(String(255), nullable=False)
+    content = Column(Text, nullable=False)  # JSON-encoded m.room.message content
+    status = Column(Enum(OutboxStatus), default=OutboxStatus.pending, nullable=False, index=True)
+    matrix_event_id = Column(String(255), nullable=True)
+    attempts = Column(Integer, default=0, nullable=False)
+    error_message = Column(Text, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    delivered_at = Column(DateTime(timezone=True), nullable=True)
@@ -1,6 +1,6 @@
 import enum
 
-from sqlalchemy import Column, Integer, String, Text, DateTime, Enum, func
+from sqlalchemy import Column, Integer, Float, String, Text, DateTime, Enum, Index, UniqueConstraint, func
 
 from app.database import Base
 
@@ -9,10 +9,17 @@ class NotificationStatus(str, enum.Enum):
     pending = "pending"
     sent = "sent"
     failed = "failed"
+    dead = "dead"  # retries exhausted
 
 
 class NotificationLog(Base):
     __tablename__ = "messenger_notification_log"
+    __table_args__ = (
+        # Keyset pagination of the log (newest first), optionally per source or status
+        Index("ix_notification_log_created_id", "created_at", "id"),
+        Index("ix_notification_log_source_created_id", "source_app", "created_at", "id"),
+        Index("ix_notification_log_status_created_id", "status", "created_at", "id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     source_app = Column(String(100), nullable=False)
@@ -22,9 +29,36 @@ class NotificationLog(Base):
     target_type = Column(String(50), nullable=True)
     entity_type = Column(String(100), nullable=True)
     entity_id = Column(Integer, nullable=True)
+    target_user = Column(String(255), nullable=True)
     priority = Column(String(20), default="normal")
     matrix_room_id = Column(String(255), nullable=True)
     matrix_event_id = Column(String(255), nullable=True)
-    status = Column(Enum(NotificationStatus), default=NotificationStatus.pending)
+    status = Column(Enum(NotificationStatus), default=NotificationStatus.pending, index=True)
     error_message = Column(Text, nullable=True)
+    attempts = Column(Integer, default=0, nullable=False)
+    max_attempts = Column(Integer, nullable=True)
+    next_attempt_at = Column(DateTime(timezone=True), nullable=True, index=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
+class NotificationStat(Base):
+    """Hourly rollup of notification delivery outcomes.
+
+    One row per (hour, source_app, event_type, status); ``count`` counts
+    delivery outcomes (every failed attempt, the final sent or dead), the
+    latency sum is measured from acceptance to the outcome.
+    """
+
+    __tablename__ = "messenger_notification_stats"
+    __table_args__ = (
+        UniqueConstraint("bucket", "source_app", "event_type", "status", name="uq_notification_stats_key"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    bucket = Column(DateTime(timezone=True), nullable=False, index=True)
+    source_app = Column(String(100), nullable=False)
+    event_type = Column(String(100), nullable=False)
+    status = Column(String(20), nullable=False)
+    count = Column(Integer, default=0, nullable=False)
+    latency_sum_seconds = Column(Float, default=0.0, nullable=False)
+    latency_max_seconds = Column(Float, default=0.0, nullable=False)
@@ -1,6 +1,6 @@
 import enum
 
-from sqlalchemy import Column, Integer, String, DateTime, Enum, func
+from sqlalchemy import Column, Integer, String, DateTime, Enum, UniqueConstraint, func
 
 from app.database import Base
 
@@ -24,3 +24,35 @@ class RoomMapping(Base):
     entity_type = Column(String(100), nullable=True)
     entity_id = Column(Integer, nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+    last_activity_at = Column(DateTime(timezone=True), nullable=True, index=True)
+    # Identity of rooms that must exist once (general:<tenant>, entity:<type>:<id>, dm pair, ...);
+    # NULL for free-form rooms. The unique index makes concurrent get-or-create safe across processes.
+    room_key = Column(String(255), nullable=True, unique=True, index=True)
+    # Messages sent through the API (user messages and notifications); drives unread counts
+    message_count = Column(Integer, nullable=False, default=0, server_default="0")
+
+
+class RoomReadState(Base):
+    """How far a user has read a room, as the room's message_count at that time."""
+    __tablename__ = "messenger_room_read_state"
+    __table_args__ = (
+        UniqueConstraint("hub_user_id", "matrix_room_id", name="uq_room_read_state_user_room"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    hub_user_id = Column(String(255), nullable=False)
+    matrix_room_id = Column(String(255), nullable=False)
+    read_count = Column(Integer, nullable=False, default=0)
+    read_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
+class RoomMember(Base):
+    """Rooms a user has joined, mirrored from Matrix (see app.services.room_membership)."""
+    __tablename__ = "messenger_room_members"
+    __table_args__ = (
+        UniqueConstraint("matrix_user_id", "matrix_room_id", name="uq_room_members_user_room"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    matrix_user_id = Column(String(255), nullable=False, index=True)
+    matrix_room_id = Column(String(255), nullable=False, index=True)
@@ -13,8 +13,14 @@ from app.auth import get_admin_user
 from app.config import MATRIX_SERVER_NAME
 from app.database import get_db
 from app.models import UserMapping, RoomMapping, RoomType
+from app.schemas.jobs import JobOut
+from app.services import notification_pipeline, room_reconciler, send_pipeline
+from app.services.jobs import jobs
 from app.services.sse_broker import broker
 from app.services.matrix_client import matrix_client, MatrixClientError
+from app.services.message_events import forget_room_audience
+from app.services.notification_router import forget_target_room
+from app.services.user_directory import user_directory
 
 logger = logging.getLogger("admin")
 
@@ -56,6 +62,7 @@ class SystemStats(BaseModel):
     rooms_by_type: dict
     sse_connections: int
     conduit_status: str
+    queues: dict
 
 
 # ── User management ────────────────────────────────────────────────
@@ -100,6 +107,7 @@ async def admin_update_user(
     mapping.display_name = body.display_name
     db.commit()
     db.refresh(mapping)
+    user_directory.update(mapping)
     return {"ok": True, "display_name": mapping.display_name}
 
 
@@ -211,9 +219,56 @@ async def admin_delete_room(
 
     db.delete(mapping)
     db.commit()
+    forget_target_room(room_id)
+    forget_room_audience(room_id)
     return {"ok": True, "deleted": room_id}
 
 
+@router.post("/rooms/{room_id}/reconcile", response_model=JobOut, status_code=status.HTTP_202_ACCEPTED)
+async def admin_reconcile_room(
+    room_id: str,
+    admin: UserMapping = Depends(get_admin_user),
+    db: Session = Depends(get_db),
+):
+    """Join all provisioned users missing from a service room (background job)."""
+    mapping = (
+        db.query(RoomMapping)
+        .filter(RoomMapping.matrix_room_id == room_id)
+        .first()
+    )
+    if not mapping:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Room not found")
+    if mapping.room_type != RoomType.service:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Only service rooms are reconciled",
+        )
+    return room_reconciler.reconcile_room(room_id).as_dict()
+
+
+# ── Background jobs ────────────────────────────────────────────────
+
+@router.get("/jobs", response_model=List[JobOut])
+async def admin_list_jobs(
+    kind: Optional[str] = None,
+    admin: UserMapping = Depends(get_admin_user),
+):
+    """Running and recently finished background jobs, newest first."""
+    return [job.as_dict() for job in jobs.list(kind)]
+
+
+@router.get("/jobs/{job_id}", response_model=JobOut)
+async def admin_get_job(
+    job_id: str,
+    admin: UserMapping = Depends(get_admin_user),
+):
+    """Progress of one background job."""
+    job = jobs.get(job_id)
+    if not job:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Job not found")
+    return job.as_dict()
+
+
 # ── System stats ───────────────────────────────────────────────────
 
 @router.get("/stats", response_model=SystemStats)
@@ -258,4 +313,9 @@ async def admin_stats(
         rooms_by_type=rooms_by_type,
         sse_connections=sse_connections,
         conduit_status=conduit_status,
+        queues={
+            "message_send": send_pipeline.stats(),
+            "notifications": notification_pipeline.stats(),
+            "jobs": jobs.stats(),
+        },
     )
@@ -1,43 +1,137 @@
 """Message send/receive/history endpoints."""
 
+import asyncio
+import json
 import logging
 from datetime import datetime, timezone
+from typing import Optional
 
-from fastapi import APIRouter, Depends, HTTPException, Request, status, Query, UploadFile, File, Form
-from fastapi.responses import StreamingResponse
+import httpx
+from fastapi import APIRouter, Depends, HTTPException, Header, Request, status, Query, UploadFile, File, Form
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, StreamingResponse
 from sqlalchemy.orm import Session
 
 from app.auth import get_current_user
-from app.config import MATRIX_HOMESERVER_URL
+from app.config import MATRIX_HOMESERVER_URL, MESSAGE_BATCH_CONCURRENCY, MESSAGE_SEND_ASYNC
 from app.database import get_db
-from app.models import UserMapping, RoomMapping
-from app.schemas.messages import MessageSend, MessageOut, MessageHistory
+from app.fast_json import FastJSONResponse
+from app.models import RoomMapping, UserMapping
+from app.schemas.messages import (
+    TXN_ID_PATTERN,
+    MessageAccepted,
+    MessageBatchOut,
+    MessageBatchResult,
+    MessageBatchSend,
+    MessageHistory,
+    MessageOut,
+    MessageSend,
+)
+from app.services import send_pipeline
 from app.services.matrix_client import matrix_client, MatrixClientError
-from app.services.sse_broker import broker
+from app.services.message_cache import CACHE_TOKEN_PREFIX, CachedPage, message_cache
+from app.services.message_events import notify_room_members, notify_room_messages
+from app.services.room_manager import touch_room_activity
+from app.services.txn_registry import TransactionConflict, txn_registry
+from app.services.user_directory import user_directory, user_label
 
 logger = logging.getLogger("messages")
 router = APIRouter(prefix="/api/v1/messages", tags=["messages"])
 
+# Let Conduit drop state/membership events so every page is full of messages
+HISTORY_EVENT_FILTER = {"types": ["m.room.message"], "lazy_load_members": True}
 
-@router.post("/send", response_model=MessageOut)
+
+TXN_CONFLICT_DETAIL = "txn_id already used for a different message"
+
+
+def _txn_fingerprint(room_id: str, *request: str) -> str:
+    """What a txn_id stands for: a retry must repeat it, otherwise it is a conflict."""
+    return json.dumps([room_id, *request])
+
+
+def _txn_conflict() -> HTTPException:
+    return HTTPException(status_code=status.HTTP_409_CONFLICT, detail=TXN_CONFLICT_DETAIL)
+
+
+def _previous_response(current_user: UserMapping, txn_id: str, fingerprint: str):
+    """The remembered (status, payload) of the user's txn_id; 409 if it was another request."""
+    try:
+        return txn_registry.get(current_user.hub_user_id, txn_id, fingerprint)
+    except TransactionConflict:
+        raise _txn_conflict()
+
+
+@router.post(
+    "/send",
+    response_model=MessageOut,
+    responses={202: {"model": MessageAccepted, "description": "Queued for asynchronous delivery"}},
+)
 async def send_message(
     msg: MessageSend,
+    prefer: Optional[str] = Header(None),
     current_user: UserMapping = Depends(get_current_user),
     db: Session = Depends(get_db),
 ):
-    """Send a message to a room."""
+    """Send a message to a room.
+
+    With ``Prefer: respond-async`` (or MESSAGE_SEND_ASYNC enabled) the
+    message is queued in the outbox and 202 is returned immediately with
+    a provisional ID; the real event ID follows via SSE.
+    """
     if not current_user.matrix_access_token_encrypted:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="User not provisioned on Matrix",
         )
 
+    # A retried transaction gets the original response without another send
+    fingerprint = _txn_fingerprint(msg.room_id, msg.msg_type, msg.body)
+    if msg.txn_id:
+        previous = _previous_response(current_user, msg.txn_id, fingerprint)
+        if previous is not None:
+            status_code, payload = previous
+            return JSONResponse(status_code=status_code, content=payload)
+
+    wants_async = MESSAGE_SEND_ASYNC or "respond-async" in (prefer or "").lower()
+    if wants_async and send_pipeline.is_enabled():
+        content = {"msgtype": msg.msg_type, "body": msg.body}
+        try:
+            entry = send_pipeline.enqueue_message(
+                room_id=msg.room_id,
+                sender=current_user,
+                content=content,
+                db=db,
+                provisional_id=msg.txn_id,
+            )
+        except send_pipeline.DuplicateTransaction as e:
+            entry = e.entry
+            if entry.room_id != msg.room_id or json.loads(entry.content) != content:
+                raise _txn_conflict()
+        # Built from the stored entry, so a retry gets the original message back
+        content = json.loads(entry.content)
+        accepted = jsonable_encoder(MessageAccepted(
+            provisional_id=entry.provisional_id,
+            room_id=entry.room_id,
+            sender=current_user.matrix_user_id,
+            sender_display_name=user_label(current_user),
+            body=content.get("body", ""),
+            msg_type=content.get("msgtype", "m.text"),
+            timestamp=entry.created_at or datetime.now(timezone.utc),
+        ))
+        if msg.txn_id:
+            txn_registry.record(
+                current_user.hub_user_id, msg.txn_id, accepted, status.HTTP_202_ACCEPTED, fingerprint
+            )
+        return JSONResponse(status_code=status.HTTP_202_ACCEPTED, content=accepted)
+
     try:
         event_id = await matrix_client.send_message(
             access_token=current_user.get_matrix_access_token(),
             room_id=msg.room_id,
             body=msg.body,
             msg_type=msg.msg_type,
+            txn_id=msg.txn_id,
         )
     except MatrixClientError as e:
         raise HTTPException(
@@ -49,18 +143,25 @@ async def send_message(
         event_id=event_id,
         room_id=msg.room_id,
         sender=current_user.matrix_user_id,
-        sender_display_name=current_user.display_name,
+        sender_display_name=user_label(current_user),
         body=msg.body,
         msg_type=msg.msg_type,
         timestamp=datetime.now(timezone.utc),
     )
 
+    if msg.txn_id:
+        txn_registry.record(
+            current_user.hub_user_id, msg.txn_id, jsonable_encoder(message_out), fingerprint=fingerprint
+        )
+    message_cache.append(message_out.model_dump())
+    touch_room_activity(msg.room_id, db)
+
     # Notify room members via SSE
-    await _notify_room_members(
+    await notify_room_members(
         room_id=msg.room_id,
         event_id=event_id,
         sender=current_user.matrix_user_id,
-        sender_display_name=current_user.display_name,
+        sender_display_name=user_label(current_user),
         body=msg.body,
         msg_type=msg.msg_type,
         db=db,
@@ -69,6 +170,121 @@ async def send_message(
     return message_out
 
 
+@router.post("/send-batch", response_model=MessageBatchOut)
+async def send_message_batch(
+    batch: MessageBatchSend,
+    current_user: UserMapping = Depends(get_current_user),
+    db: Session = Depends(get_db),
+):
+    """Send several messages in one request.
+
+    Rooms are served concurrently (bounded by MESSAGE_BATCH_CONCURRENCY)
+    while messages for the same room keep their order. Each room gets a
+    single SSE event for all of its new messages. Returns one result per
+    item; a failed item does not abort the rest of the batch.
+    """
+    if not current_user.matrix_access_token_encrypted:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="User not provisioned on Matrix",
+        )
+
+    access_token = current_user.get_matrix_access_token()
+    results: list[MessageBatchResult | None] = [None] * len(batch.messages)
+    sent: dict[str, list[MessageOut]] = {}
+
+    by_room: dict[str, list[int]] = {}
+    for index, item in enumerate(batch.messages):
+        by_room.setdefault(item.room_id, []).append(index)
+
+    semaphore = asyncio.Semaphore(MESSAGE_BATCH_CONCURRENCY)
+
+    async def send_room(room_id: str, indexes: list[int]) -> None:
+        async with semaphore:
+            for index in indexes:
+                item = batch.messages[index]
+                fingerprint = _txn_fingerprint(room_id, item.msg_type, item.body)
+                if item.txn_id:
+                    try:
+                        previous = txn_registry.get(current_user.hub_user_id, item.txn_id, fingerprint)
+                    except TransactionConflict:
+                        results[index] = MessageBatchResult(
+                            index=index,
+                            room_id=room_id,
+                            status="failed",
+                            txn_id=item.txn_id,
+                            error=TXN_CONFLICT_DETAIL,
+                        )
+                        continue
+                    if previous is not None and previous[1].get("event_id"):
+                        results[index] = MessageBatchResult(
+                            index=index,
+                            room_id=room_id,
+                            status="sent",
+                            event_id=previous[1]["event_id"],
+                            txn_id=item.txn_id,
+                        )
+                        continue
+                try:
+                    event_id = await matrix_client.send_message(
+                        access_token=access_token,
+                        room_id=room_id,
+                        body=item.body,
+                        msg_type=item.msg_type,
+                        txn_id=item.txn_id,
+                    )
+                except (MatrixClientError, httpx.HTTPError) as e:
+                    results[index] = MessageBatchResult(
+                        index=index,
+                        room_id=room_id,
+                        status="failed",
+                        txn_id=item.txn_id,
+                        error=str(e)[:500],
+                    )
+                    continue
+
+                message = MessageOut(
+                    event_id=event_id,
+                    room_id=room_id,
+                    sender=current_user.matrix_user_id,
+                    sender_display_name=user_label(current_user),
+                    body=item.body,
+                    msg_type=item.msg_type,
+                    timestamp=datetime.now(timezone.utc),
+                )
+                if item.txn_id:
+                    txn_registry.record(
+                        current_user.hub_user_id, item.txn_id, jsonable_encoder(message),
+                        fingerprint=fingerprint,
+                    )
+                sent.setdefault(room_id, []).append(message)
+                results[index] = MessageBatchResult(
+                    index=index,
+                    room_id=room_id,
+                    status="sent",
+                    event_id=event_id,
+                    txn_id=item.txn_id,
+                )
+
+    await asyncio.gather(*(send_room(room_id, idx) for room_id, idx in by_room.items()))
+
+    for room_id, messages in sent.items():
+        for message in messages:
+            message_cache.append(message.model_dump())
+        touch_room_activity(room_id, db, commit=False, messages=len(messages))
+    db.commit()
+
+    for room_id, messages in sent.items():
+        await notify_room_messages(room_id, jsonable_encoder(messages), db)
+
+    sent_count = sum(1 for r in results if r.status == "sent")
+    return MessageBatchOut(
+        results=results,
+        sent=sent_count,
+        failed=len(results) - sent_count,
+    )
+
+
 @router.get("/history/{room_id}", response_model=MessageHistory)
 async def get_history(
     room_id: str,
@@ -77,19 +293,87 @@ async def get_history(
     current_user: UserMapping = Depends(get_current_user),
     db: Session = Depends(get_db),
 ):
-    """Get message history for a room."""
+    """Get message history for a room.
+
+    The newest pages are served from the in-memory message cache when it
+    holds them; everything else is fetched from Conduit. Payloads are
+    built as plain dicts in the MessageHistory shape and encoded directly,
+    skipping per-message model validation.
+    """
     if not current_user.matrix_access_token_encrypted:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="User not provisioned on Matrix",
         )
 
+    reader = current_user.matrix_user_id
+    before = None
+    if from_token and from_token.startswith(CACHE_TOKEN_PREFIX):
+        before = from_token[len(CACHE_TOKEN_PREFIX):]
+        from_token = None
+
+    message_count = None
+    if from_token is None:
+        message_count = _room_message_count(room_id, db)
+        cached = message_cache.page(room_id, limit, reader, before=before, message_count=message_count)
+        if cached is None and before is not None and message_cache.enabled:
+            # Buffer was evicted or reseeded meanwhile: reload the newest window and retry
+            messages, end_token, has_more = await _fetch_history(
+                current_user, room_id, message_cache.room_size, None, db
+            )
+            message_cache.seed(room_id, messages, end_token, has_more, reader, message_count)
+            cached = message_cache.page(room_id, limit, reader, before=before, message_count=message_count)
+            if cached is None:
+                cached = CachedPage(messages=[], end_token=end_token, has_more=has_more)
+        if cached is not None:
+            if cached.messages or not cached.has_more or not cached.end_token:
+                return _history_response(cached.messages, cached.end_token, cached.has_more)
+            # Cached tail exhausted: continue on Conduit from the buffer's token
+            from_token = cached.end_token
+
+    messages, end_token, has_more = await _fetch_history(
+        current_user, room_id, limit, from_token, db
+    )
+    if from_token is None:
+        message_cache.seed(room_id, messages, end_token, has_more, reader, message_count)
+    else:
+        message_cache.add_reader(room_id, reader)
+
+    return _history_response(messages, end_token, has_more)
+
+
+def _room_message_count(room_id: str, db: Session) -> Optional[int]:
+    """Messages sent to the room through the API by any worker process."""
+    return (
+        db.query(RoomMapping.message_count)
+        .filter(RoomMapping.matrix_room_id == room_id)
+        .scalar()
+    )
+
+
+def _history_response(
+    messages: list[dict], end_token: str | None, has_more: bool
+) -> FastJSONResponse:
+    return FastJSONResponse(
+        {"messages": messages, "end_token": end_token, "has_more": has_more}
+    )
+
+
+async def _fetch_history(
+    current_user: UserMapping,
+    room_id: str,
+    limit: int,
+    from_token: str | None,
+    db: Session,
+) -> tuple[list[dict], str | None, bool]:
+    """Fetch one page of room history from Conduit (newest first)."""
     try:
         result = await matrix_client.get_room_messages(
             access_token=current_user.get_matrix_access_token(),
             room_id=room_id,
             limit=limit,
             from_token=from_token,
+            event_filter=HISTORY_EVENT_FILTER,
         )
     except MatrixClientError as e:
         raise HTTPException(
@@ -97,55 +381,57 @@ async def get_history(
             detail=f"Failed to get messages: {e}",
         )
 
+    chunk = result.get("chunk", [])
+
     # Build a cache of sender matrix_id -> display_name
-    sender_ids = set()
-    for event in result.get("chunk", []):
-        if event.get("type") == "m.room.message":
-            sender_ids.add(event.get("sender", ""))
+    sender_ids = {event.get("sender", "") for event in chunk}
     sender_ids.discard("")
+    display_name_map = {
+        mid: entry.label
+        for mid, entry in user_directory.resolve_many(sender_ids, db).items()
+    }
+
+    messages = build_history_payloads(chunk, room_id, display_name_map)
+
+    # Matrix omits "end" once the start of the timeline is reached
+    end_token = result.get("end")
+    has_more = bool(end_token) and bool(chunk) and end_token != result.get("start")
+    return messages, end_token, has_more
 
-    display_name_map = {}
-    if sender_ids:
-        user_mappings = (
-            db.query(UserMapping)
-            .filter(UserMapping.matrix_user_id.in_(list(sender_ids)))
-            .all()
-        )
-        for um in user_mappings:
-            display_name_map[um.matrix_user_id] = um.display_name or um.hub_user_id
 
+def build_history_payloads(
+    chunk: list[dict], room_id: str, display_name_map: dict[str, str]
+) -> list[dict]:
+    """Turn a Matrix /messages chunk into MessageOut-shaped dicts."""
     messages = []
-    for event in result.get("chunk", []):
+    append = messages.append
+    for event in chunk:
         if event.get("type") != "m.room.message":
             continue
-        content = event.get("content", {})
-        file_info = content.get("info", {})
+        content = event.get("content") or {}
+        body = content.get("body", "")
         file_url = content.get("url")
-        filename = content.get("filename") or content.get("body", "")
+        if file_url:
+            filename = content.get("filename") or body
+            file_size = (content.get("info") or {}).get("size")
+        else:
+            filename = file_size = None
         sender = event.get("sender", "")
-        messages.append(
-            MessageOut(
-                event_id=event["event_id"],
-                room_id=room_id,
-                sender=sender,
-                sender_display_name=display_name_map.get(sender),
-                body=content.get("body", ""),
-                msg_type=content.get("msgtype", "m.text"),
-                timestamp=datetime.fromtimestamp(
-                    event.get("origin_server_ts", 0) / 1000,
-                    tz=timezone.utc,
-                ),
-                file_url=file_url,
-                filename=filename if file_url else None,
-                file_size=file_info.get("size") if file_url else None,
-            )
-        )
-
-    return MessageHistory(
-        messages=messages,
-        end_token=result.get("end"),
-        has_more=len(messages) == limit,
-    )
+        append({
+            "event_id": event["event_id"],
+            "room_id": room_id,
+            "sender": sender,
+            "sender_display_name": display_name_map.get(sender),
+            "body": body,
+            "msg_type": content.get("msgtype", "m.text"),
+            "timestamp": datetime.fromtimestamp(
+                event.get("origin_server_ts", 0) / 1000, tz=timezone.utc
+            ),
+            "file_url": file_url,
+            "filename": filename,
+            "file_size": file_size,
+        })
+    return messages
 
 
 @router.post("/upload", response_model=MessageOut)
@@ -153,16 +439,28 @@ async def upload_file(
     room_id: str = Form(...),
     file: UploadFile = File(...),
     body: str = Form(""),
+    txn_id: Optional[str] = Form(None, pattern=TXN_ID_PATTERN),
     current_user: UserMapping = Depends(get_current_user),
     db: Session = Depends(get_db),
 ):
-    """Upload a file and send it as a message to a room."""
+    """Upload a file and send it as a message to a room.
+
+    An optional ``txn_id`` makes retries idempotent: a repeated upload
+    with the same ID returns the original message without re-uploading.
+    """
     if not current_user.matrix_access_token_encrypted:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="User not provisioned on Matrix",
         )
 
+    fingerprint = _txn_fingerprint(room_id, "upload", file.filename or "", body)
+    if txn_id:
+        previous = _previous_response(current_user, txn_id, fingerprint)
+        if previous is not None:
+            status_code, payload = previous
+            return JSONResponse(status_code=status_code, content=payload)
+
     file_data = await file.read()
     content_type = file.content_type or "application/octet-stream"
     filename = file.filename or "file"
@@ -212,6 +510,7 @@ async def upload_file(
             access_token=current_user.get_matrix_access_token(),
             room_id=room_id,
             content=event_content,
+            txn_id=txn_id,
         )
     except MatrixClientError as e:
         raise HTTPException(
@@ -223,7 +522,7 @@ async def upload_file(
         event_id=event_id,
         room_id=room_id,
         sender=current_user.matrix_user_id,
-        sender_display_name=current_user.display_name,
+        sender_display_name=user_label(current_user),
         body=body or filename,
         msg_type=msg_type,
         timestamp=datetime.now(timezone.utc),
@@ -232,11 +531,18 @@ async def upload_file(
         file_size=file_size,
     )
 
-    await _notify_room_members(
+    if txn_id:
+        txn_registry.record(
+            current_user.hub_user_id, txn_id, jsonable_encoder(message_out), fingerprint=fingerprint
+        )
+    message_cache.append(message_out.model_dump())
+    touch_room_activity(room_id, db)
+
+    await notify_room_members(
         room_id=room_id,
         event_id=event_id,
         sender=current_user.matrix_user_id,
-        sender_display_name=current_user.display_name,
+        sender_display_name=user_label(current_user),
         body=body or filename,
         msg_type=msg_type,
         db=db,
@@ -248,78 +554,6 @@ async def upload_file(
     return message_out
 
 
-async def _notify_room_members(
-    room_id: str,
-    event_id: str,
-    sender: str,
-    sender_display_name: str | None,
-    body: str,
-    msg_type: str,
-    db: Session,
-    file_url: str | None = None,
-    filename: str | None = None,
-    file_size: int | None = None,
-) -> None:
-    """Send SSE notification to all members of a room."""
-    event_data = {
-        "type": "new_message",
-        "room_id": room_id,
-        "event_id": event_id,
-        "sender": sender,
-        "sender_display_name": sender_display_name,
-        "body": body,
-        "msg_type": msg_type,
-    }
-    if file_url:
-        event_data["file_url"] = file_url
-        event_data["filename"] = filename
-        event_data["file_size"] = file_size
-
-    # Find room members via RoomMapping + UserMapping
-    room_mapping = (
-        db.query(RoomMapping)
-        .filter(RoomMapping.matrix_room_id == room_id)
-        .first()
-    )
-    if not room_mapping:
-        # Unknown room - do NOT broadcast to all users (security risk)
-        # Only log for debugging; SSE notification will be skipped
-        logger.warning(
-            "SSE: Unknown room %s - skipping notification (no broadcast to prevent data leak)",
-            room_id,
-        )
-        return
-
-    # For DM rooms, extract participant user IDs from the display_name key
-    if room_mapping.room_type == "dm" and room_mapping.display_name:
-        # display_name format: "dm:@user1:server:@user2:server"
-        parts = room_mapping.display_name.split(":")
-        # Reconstruct matrix user IDs from the pair key
-        matrix_user_ids = []
-        if len(parts) >= 5:
-            matrix_user_ids.append(f"{parts[1]}:{parts[2]}")
-            matrix_user_ids.append(f"{parts[3]}:{parts[4]}")
-        if matrix_user_ids:
-            users = (
-                db.query(UserMapping)
-                .filter(UserMapping.matrix_user_id.in_(matrix_user_ids))
-                .all()
-            )
-            logger.info(
-                "SSE: DM room %s — notifying %d users: %s",
-                room_id,
-                len(users),
-                [u.hub_user_id for u in users],
-            )
-            for user in users:
-                await broker.publish_to_user(user.hub_user_id, event_data)
-            return
-
-    # For non-DM rooms, broadcast to all (room membership tracking not available)
-    logger.info("SSE: Non-DM room %s, broadcasting to all", room_id)
-    await broker.broadcast(event_data)
-
-
 @router.get("/media/{server_name}/{media_id}")
 async def get_media(
     server_name: str,
@@ -333,7 +567,6 @@ async def get_media(
     Supports auth via query param (?token=...) or Authorization header,
     since <img> and <a> tags cannot set custom headers.
     """
-    import httpx
     from app.hub_sso import is_sso_enabled, validate_hub_token
     from app.auth import _get_or_create_hub_shadow_user
     from app.config import SECRET_KEY, ALGORITHM
@@ -4,66 +4,198 @@ Other satellites call this endpoint with a service token to send
 notifications into Matrix rooms.
 """
 
+import base64
+import json
 import logging
-from typing import Optional
+import math
+import time
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
 
-from fastapi import APIRouter, Depends, HTTPException, Header, Query, status
+from fastapi import APIRouter, Depends, HTTPException, Header, Query, Request, Response, status
+from fastapi.encoders import jsonable_encoder
+from pydantic import ValidationError
+from sqlalchemy import tuple_
 from sqlalchemy.orm import Session
 
-from app.config import MESSENGER_SERVICE_TOKEN
+from app.config import (
+    MESSENGER_SERVICE_TOKEN,
+    MESSENGER_SERVICE_TOKENS,
+    MESSENGER_SERVICE_TOKEN_TENANTS,
+    NOTIFICATION_BATCH_MAX_ITEMS,
+    ROOM_PROVISION_MAX_ITEMS,
+)
 from app.database import get_db
-from app.models import NotificationLog, UserMapping
-from app.schemas.notifications import NotificationSend, NotificationOut
-from app.services.notification_router import route_notification
-from app.services.sse_broker import broker
+from app.models import NotificationLog, NotificationStatus
+from app.schemas.notifications import (
+    NotificationSend,
+    NotificationOut,
+    NotificationBatchOut,
+    NotificationStatBucket,
+    NotificationStatsOut,
+)
+from app.schemas.jobs import JobOut
+from app.schemas.rooms import EntityRoomSpec
+from app.services import notification_pipeline, notification_retention, notification_retry
+from app.services.jobs import jobs
+from app.services.message_events import publish_notification
+from app.services.notification_limits import source_limiter
+from app.services.notification_stats import default_since, query_stats
+from app.services.notification_writer import status_writer
+from app.services.notification_router import (
+    NOTIFICATION_BOT,
+    ENTITY_ROOMS_JOB,
+    FANOUT_TARGET_TYPES,
+    BotUnavailable,
+    aggregator,
+    bot_pool,
+    expand_recipients,
+    load_bot_token,
+    provision_entity_rooms,
+    route_notification,
+    route_notifications,
+)
+from app.services.user_directory import user_directory
 
 logger = logging.getLogger("notifications")
 router = APIRouter(prefix="/api/v1/notifications", tags=["notifications"])
 
 
-def _verify_service_token(x_service_token: str = Header(...)) -> str:
-    """Verify the cross-app service token."""
+def _verify_service_token(x_service_token: str = Header(...)) -> Optional[str]:
+    """Verify the cross-app service token.
+
+    Returns the source_app a per-satellite token is bound to, or None
+    for the shared MESSENGER_SERVICE_TOKEN.
+    """
+    if x_service_token in MESSENGER_SERVICE_TOKENS:
+        return MESSENGER_SERVICE_TOKENS[x_service_token]
     if x_service_token != MESSENGER_SERVICE_TOKEN:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Invalid service token",
         )
-    return x_service_token
+    return None
+
+
+def _check_source(notifications: List[NotificationSend], token_source: Optional[str]) -> None:
+    """Reject notifications whose source_app the service token is not bound to."""
+    if not token_source:
+        return
+    for notification in notifications:
+        if notification.source_app != token_source:
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail=f"Service token is not valid for source_app '{notification.source_app}'",
+            )
+
+
+def _check_tenant(tenant_id: Optional[int], token_source: Optional[str]) -> None:
+    """Reject a tenant outside MESSENGER_SERVICE_TOKEN_TENANTS of the token's source.
+
+    None (all tenants) is only open to the shared token.
+    """
+    if not token_source or tenant_id in MESSENGER_SERVICE_TOKEN_TENANTS.get(token_source, ()):
+        return
+    raise HTTPException(
+        status_code=status.HTTP_403_FORBIDDEN,
+        detail=(
+            f"Service token is not valid for tenant {tenant_id}"
+            if tenant_id is not None
+            else "Service token is not valid for all tenants; set target_tenant_id"
+        ),
+    )
+
+
+def _source_scope(source_app: Optional[str], token_source: Optional[str]) -> Optional[str]:
+    """The source_app filter of a read: a bound token only sees its own source."""
+    if not token_source:
+        return source_app
+    if source_app and source_app != token_source:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail=f"Service token is not valid for source_app '{source_app}'",
+        )
+    return token_source
+
+
+def _admit(notifications: List[NotificationSend], token_source: Optional[str]) -> None:
+    """Check the token's source binding and charge the per-source rate limit."""
+    _check_source(notifications, token_source)
+    costs: Dict[str, int] = {}
+    for notification in notifications:
+        costs[notification.source_app] = costs.get(notification.source_app, 0) + 1
+    retry_after = source_limiter.admit(costs)
+    if retry_after > 0:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Notification rate limit exceeded",
+            headers={"Retry-After": str(math.ceil(retry_after))},
+        )
+
+
+def _require_notification_bot(db: Session) -> None:
+    """503 unless the notification bot exists (in the directory, else in the database)."""
+    bot = user_directory.get_by_hub_id(NOTIFICATION_BOT, db)
+    if not bot or not bot.is_bot:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Notification bot not provisioned. Run startup provisioning first.",
+        )
+
+
+def _record_inline_deliveries(log_entries: List[NotificationLog], started_at: float) -> None:
+    latency = time.monotonic() - started_at
+    for log_entry in log_entries:
+        if log_entry.status != NotificationStatus.pending:
+            source_limiter.record_delivery(
+                log_entry.source_app, latency, log_entry.status == NotificationStatus.sent
+            )
 
 
-@router.post("/send", response_model=NotificationOut)
+@router.post(
+    "/send",
+    response_model=NotificationOut,
+    responses={202: {"description": "Notification accepted and queued for delivery"}},
+)
 async def send_notification(
     notification: NotificationSend,
+    response: Response,
     db: Session = Depends(get_db),
-    _token: str = Depends(_verify_service_token),
+    token_source: Optional[str] = Depends(_verify_service_token),
 ):
     """Send a cross-app notification.
 
-    Requires X-Service-Token header matching MESSENGER_SERVICE_TOKEN.
-    Routes the notification to the appropriate Matrix room via a bot user.
+    Requires X-Service-Token header matching MESSENGER_SERVICE_TOKEN or a
+    per-satellite token bound to the notification's source_app. Sources
+    over their rate limit get 429 with Retry-After.
+    The notification is stored as pending and routed to its Matrix room
+    by the notification workers (202); urgent ones skip ahead of queued
+    normal traffic. With NOTIFICATION_WORKERS=0 it is routed inside the
+    request instead. Multi-recipient targets (users, role, tenant) go
+    through /send-batch.
     """
-    # Get or create bot user token
-    bot = (
-        db.query(UserMapping)
-        .filter(UserMapping.hub_user_id == "notification_bot", UserMapping.is_bot == True)
-        .first()
-    )
-
-    if not bot or not bot.matrix_access_token_encrypted:
+    if notification.target_type in FANOUT_TARGET_TYPES:
         raise HTTPException(
-            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-            detail="Notification bot not provisioned. Run startup provisioning first.",
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=f"target_type '{notification.target_type}' has several recipients; use /send-batch",
         )
+    _admit([notification], token_source)
+
+    if notification_pipeline.is_enabled():
+        _require_notification_bot(db)
+        log_entry = notification_pipeline.enqueue_notification(notification, db)
+        response.status_code = status.HTTP_202_ACCEPTED
+        return NotificationOut.model_validate(log_entry)
 
     try:
-        bot_token = bot.get_matrix_access_token()
-    except ValueError as e:
-        logger.error("Failed to decrypt bot token: %s", e)
+        bot_token = load_bot_token(db)
+    except BotUnavailable as e:
         raise HTTPException(
             status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-            detail="Notification bot token decryption failed. Re-provision the bot.",
+            detail=str(e),
         )
 
+    started_at = time.monotonic()
     try:
         log_entry = await route_notification(
             notification=notification,
@@ -77,40 +209,298 @@ async def send_notification(
             detail=f"Failed to route notification: {str(e)[:200]}",
         )
 
-    # Broadcast to SSE subscribers
+    _record_inline_deliveries([log_entry], started_at)
+    await publish_notification(log_entry, db)
+    return NotificationOut.model_validate(log_entry)
+
+
+def _parse_notification_batch(raw: bytes, content_type: str) -> List[NotificationSend]:
+    """Parse a JSON array or an NDJSON stream (one object per line)."""
     try:
-        await broker.broadcast({
-            "type": "notification",
-            "source_app": notification.source_app,
-            "event_type": notification.event_type,
-            "title": notification.title,
-            "body": notification.body,
-            "priority": notification.priority,
-            "room_id": log_entry.matrix_room_id,
-        })
+        if "ndjson" in content_type or "jsonlines" in content_type:
+            items = [json.loads(line) for line in raw.splitlines() if line.strip()]
+        else:
+            items = json.loads(raw or b"null")
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Invalid JSON: {e}",
+        )
+    if not isinstance(items, list):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Expected a JSON array or NDJSON stream of notifications",
+        )
+    if len(items) > NOTIFICATION_BATCH_MAX_ITEMS:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"At most {NOTIFICATION_BATCH_MAX_ITEMS} notifications per batch",
+        )
+    notifications = []
+    for index, item in enumerate(items):
+        try:
+            notifications.append(NotificationSend.model_validate(item))
+        except ValidationError as e:
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail={"index": index, "errors": jsonable_encoder(e.errors())},
+            )
+    return notifications
+
+
+def _batch_out(log_entries: List[NotificationLog]) -> NotificationBatchOut:
+    results = [NotificationOut.model_validate(entry) for entry in log_entries]
+    return NotificationBatchOut(
+        notifications=results,
+        sent=sum(1 for r in results if r.status == NotificationStatus.sent),
+        failed=sum(
+            1 for r in results
+            if r.status in (NotificationStatus.failed, NotificationStatus.dead)
+        ),
+        pending=sum(1 for r in results if r.status == NotificationStatus.pending),
+    )
+
+
+@router.post(
+    "/send-batch",
+    response_model=NotificationBatchOut,
+    responses={202: {"description": "Notifications accepted and queued for delivery"}},
+)
+async def send_notification_batch(
+    request: Request,
+    response: Response,
+    db: Session = Depends(get_db),
+    token_source: Optional[str] = Depends(_verify_service_token),
+):
+    """Send many cross-app notifications in one request.
+
+    Requires X-Service-Token header (see /send); the whole batch counts
+    against each source's rate limit. The body is a JSON array of NotificationSend objects, or NDJSON
+    (Content-Type: application/x-ndjson) with one object per line. Rows
+    are inserted in bulk and each distinct target is resolved once;
+    targets are served concurrently while notifications for the same
+    target keep their order.
+
+    Items with target_type "users" (target_users), "role" (target_role,
+    optionally narrowed by target_tenant_id) or "tenant"
+    (target_tenant_id) are expanded to one DM notification per
+    recipient; the response lists one entry per recipient and each
+    recipient counts against the rate limit. A per-satellite token may
+    only address the tenants listed for its source in
+    MESSENGER_SERVICE_TOKEN_TENANTS this way (403 otherwise).
+    """
+    notifications = _parse_notification_batch(
+        await request.body(), request.headers.get("content-type", "")
+    )
+    _check_source(notifications, token_source)
+    for notification in notifications:
+        if notification.target_type in ("role", "tenant"):
+            _check_tenant(notification.target_tenant_id, token_source)
+    notifications = expand_recipients(notifications, db)
+    if not notifications:
+        return NotificationBatchOut(notifications=[])
+    _admit(notifications, token_source)
+
+    if notification_pipeline.is_enabled():
+        _require_notification_bot(db)
+        log_entries = notification_pipeline.enqueue_notifications(notifications, db)
+        response.status_code = status.HTTP_202_ACCEPTED
+        return _batch_out(log_entries)
+
+    try:
+        bot_token = load_bot_token(db)
+    except BotUnavailable as e:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=str(e),
+        )
+
+    started_at = time.monotonic()
+    try:
+        log_entries = await route_notifications(
+            notifications=notifications,
+            bot_token=bot_token,
+            db=db,
+        )
     except Exception as e:
-        logger.warning("SSE broadcast failed (non-fatal): %s", e)
+        logger.exception("Failed to route notification batch")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to route notifications: {str(e)[:200]}",
+        )
 
-    return NotificationOut.model_validate(log_entry)
+    _record_inline_deliveries(log_entries, started_at)
+    for log_entry in log_entries:
+        await publish_notification(log_entry, db)
+    return _batch_out(log_entries)
+
+
+@router.post("/entity-rooms", response_model=JobOut, status_code=status.HTTP_202_ACCEPTED)
+async def provision_entity_rooms_endpoint(
+    specs: List[EntityRoomSpec],
+    db: Session = Depends(get_db),
+    token_source: Optional[str] = Depends(_verify_service_token),
+):
+    """Create the rooms of many entities ahead of their first notification.
+
+    Requires X-Service-Token header. Meant for onboarding (e.g. all
+    machines of a new plant): missing rooms are created concurrently in
+    a background job and inserted in bulk, existing ones are skipped.
+    A per-satellite token may only assign the tenants listed for its
+    source in MESSENGER_SERVICE_TOKEN_TENANTS (403 otherwise).
+    Follow the progress with GET /jobs/{job_id}.
+    """
+    if len(specs) > ROOM_PROVISION_MAX_ITEMS:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"At most {ROOM_PROVISION_MAX_ITEMS} entities per request",
+        )
+    for spec in specs:
+        # Rooms without a tenant are what an entity_room notification creates anyway
+        if spec.tenant_id is not None:
+            _check_tenant(spec.tenant_id, token_source)
+    _require_notification_bot(db)
+    job = jobs.start(
+        ENTITY_ROOMS_JOB,
+        f"{len(specs)} entities",
+        lambda job: provision_entity_rooms(specs, job),
+    )
+    return job.as_dict()
+
+
+@router.get("/jobs/{job_id}", response_model=JobOut)
+async def get_notification_job(
+    job_id: str,
+    _token: Optional[str] = Depends(_verify_service_token),
+):
+    """Progress of a background job started through this API."""
+    job = jobs.get(job_id)
+    if not job or job.kind != ENTITY_ROOMS_JOB:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Job not found")
+    return job.as_dict()
+
+
+@router.get("/queue")
+async def get_notification_queue(
+    token_source: Optional[str] = Depends(_verify_service_token),
+    source_app: Optional[str] = Query(None, description="Only this source's counters"),
+):
+    """Depth and lag of the notification outbox workers, plus per-source and per-bot counters.
+
+    A per-satellite token gets the worker depth and its own source's
+    counters only.
+    """
+    source_app = _source_scope(source_app, token_source)
+    if source_app:
+        sources = source_limiter.stats()
+        return {
+            **notification_pipeline.stats(),
+            "sources": {source_app: sources[source_app]} if source_app in sources else {},
+        }
+    return {
+        **notification_pipeline.stats(),
+        "aggregation": aggregator.stats(),
+        "sources": source_limiter.stats(),
+        "retry": notification_retry.stats(),
+        "bots": bot_pool.stats(),
+        "retention": notification_retention.stats(),
+        "writer": status_writer.stats(),
+    }
+
+
+@router.get("/stats", response_model=NotificationStatsOut)
+async def get_notification_stats(
+    db: Session = Depends(get_db),
+    token_source: Optional[str] = Depends(_verify_service_token),
+    hours: int = Query(24, ge=1, le=24 * 90, description="Window ending now, in hours (ignored with since)"),
+    since: Optional[datetime] = Query(None, description="Start of the window (inclusive, hour precision)"),
+    until: Optional[datetime] = Query(None, description="End of the window (exclusive)"),
+    source_app: Optional[str] = Query(None, description="Filter by source app"),
+    event_type: Optional[str] = Query(None, description="Filter by event type"),
+):
+    """Hourly delivery counts per source_app, event_type and status.
+
+    Served from the pre-aggregated rollup table, so the cost depends on
+    the window and the number of sources, not on the size of the log.
+    ``failed`` counts failed attempts (retried later), ``sent`` and
+    ``dead`` final outcomes. A per-satellite token only sees its own source.
+    """
+    source_app = _source_scope(source_app, token_source)
+    since = since or default_since(hours)
+    rows = query_stats(db, since, until, source_app, event_type)
+    totals: Dict[str, int] = {}
+    buckets = []
+    for row in rows:
+        totals[row.status] = totals.get(row.status, 0) + row.count
+        buckets.append(NotificationStatBucket(
+            bucket=row.bucket,
+            source_app=row.source_app,
+            event_type=row.event_type,
+            status=row.status,
+            count=row.count,
+            latency_avg_seconds=round(row.latency_sum_seconds / row.count, 3) if row.count else 0.0,
+            latency_max_seconds=round(row.latency_max_seconds, 3),
+        ))
+    return NotificationStatsOut(since=since, until=until, totals=totals, buckets=buckets)
+
+
+def _encode_cursor(log_entry: NotificationLog) -> str:
+    raw = f"{log_entry.created_at.isoformat()}|{log_entry.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def _decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        created_at, _, log_id = raw.rpartition("|")
+        return datetime.fromisoformat(created_at), int(log_id)
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor",
+        )
 
 
 @router.get("/log", response_model=list[NotificationOut])
 async def get_notification_log(
+    response: Response,
     db: Session = Depends(get_db),
-    _token: str = Depends(_verify_service_token),
+    token_source: Optional[str] = Depends(_verify_service_token),
     source_app: Optional[str] = Query(None, description="Filter by source app"),
+    status_filter: Optional[NotificationStatus] = Query(
+        None, alias="status", description="Filter by status (e.g. dead for exhausted retries)"
+    ),
     limit: int = Query(100, ge=1, le=500, description="Max number of results"),
-    offset: int = Query(0, ge=0, description="Offset for pagination"),
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor of the previous page"),
+    offset: int = Query(0, ge=0, description="Offset for pagination (deprecated, use cursor)"),
 ):
-    """Get notification log entries.
+    """Get notification log entries, newest first.
 
     Requires X-Service-Token header matching MESSENGER_SERVICE_TOKEN.
-    Returns notification history filtered by source_app if provided.
+    Returns notification history filtered by source_app if provided; a
+    per-satellite token only sees its own source.
+    Pages are keyed on (created_at, id): pass the X-Next-Cursor header
+    of a full page as ``cursor`` to get the next one, which costs the
+    same no matter how deep it is. ``offset`` still works for old clients.
     """
-    query = db.query(NotificationLog).order_by(NotificationLog.created_at.desc())
+    source_app = _source_scope(source_app, token_source)
+    query = db.query(NotificationLog).order_by(
+        NotificationLog.created_at.desc(), NotificationLog.id.desc()
+    )
 
     if source_app:
         query = query.filter(NotificationLog.source_app == source_app)
+    if status_filter:
+        query = query.filter(NotificationLog.status == status_filter)
+    if cursor:
+        created_at, log_id = _decode_cursor(cursor)
+        query = query.filter(
+            tuple_(NotificationLog.created_at, NotificationLog.id) < tuple_(created_at, log_id)
+        )
+    elif offset:
+        query = query.offset(offset)
 
-    logs = query.offset(offset).limit(limit).all()
+    logs = query.limit(limit).all()
+    if len(logs) == limit and logs[-1].created_at is not None:
+        response.headers["X-Next-Cursor"] = _encode_cursor(logs[-1])
     return [NotificationOut.model_validate(log) for log in logs]
@@ -1,22 +1,42 @@
 """Room listing, creation, and joining endpoints."""
 
+import asyncio
+import base64
+import json
 import logging
-from typing import Optional
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, List, Optional
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy import and_, exists, or_, func as sa_func
 from sqlalchemy.orm import Session
 
 from app.auth import get_current_user
-from app.database import get_db
-from app.models import UserMapping, RoomMapping, RoomType
-from app.schemas.rooms import RoomCreate, RoomOut, RoomListOut
+from app.config import ROOM_INVITE_CONCURRENCY, ROOM_LOOKUP_MAX_ITEMS
+from app.database import SessionLocal, get_db
+from app.models import UserMapping, RoomMapping, RoomMember, RoomReadState, RoomType
+from app.schemas.rooms import (
+    RoomCreate,
+    RoomOut,
+    RoomListOut,
+    RoomBulkInvite,
+    EntityRoomLookup,
+    EntityRoomLookupOut,
+    EntityRoomStatus,
+)
 from app.services.matrix_client import matrix_client, MatrixClientError
+from app.services.message_events import forget_room_audience
 from app.services.room_manager import (
     create_custom_room,
+    entity_room_key,
     get_or_create_general_room,
     get_or_create_dm_room,
     ensure_user_in_room,
+    mark_room_read,
 )
+from app.services.room_membership import forget_user, record_join, sync_user_rooms
+from app.services.user_directory import user_directory, fallback_name
 from app.services.user_provisioning import provision_matrix_user
 
 logger = logging.getLogger("rooms")
@@ -25,46 +45,133 @@ router = APIRouter(prefix="/api/v1/rooms", tags=["rooms"])
 
 @router.get("", response_model=RoomListOut)
 async def list_rooms(
+    limit: Optional[int] = Query(None, ge=1, le=500, description="Page size (omit for all rooms)"),
+    cursor: Optional[str] = Query(None, description="next_cursor of the previous page"),
+    room_type: Optional[RoomType] = Query(None, description="Filter by room type"),
+    entity_type: Optional[str] = Query(None, description="Filter by entity type"),
     current_user: UserMapping = Depends(get_current_user),
     db: Session = Depends(get_db),
 ):
-    """List all rooms the user has access to."""
+    """List the user's rooms, most recently active first.
+
+    Supports cursor pagination: pass ``limit`` and then the returned
+    ``next_cursor`` to fetch the following page.
+    """
     if not current_user.matrix_access_token_encrypted:
         return RoomListOut(rooms=[])
 
-    try:
-        joined_room_ids = await matrix_client.list_joined_rooms(
-            current_user.get_matrix_access_token()
-        )
-    except MatrixClientError:
-        joined_room_ids = []
+    await sync_user_rooms(current_user, db)
+    membership = and_(
+        RoomMember.matrix_room_id == RoomMapping.matrix_room_id,
+        RoomMember.matrix_user_id == current_user.matrix_user_id,
+    )
 
-    rooms = []
-    for room_id in joined_room_ids:
-        mapping = (
-            db.query(RoomMapping)
-            .filter(RoomMapping.matrix_room_id == room_id)
-            .first()
+    activity = sa_func.coalesce(RoomMapping.last_activity_at, RoomMapping.created_at)
+    query = (
+        db.query(RoomMapping, activity, RoomReadState.read_count)
+        .join(RoomMember, membership)
+        .outerjoin(RoomReadState, _read_state_of(current_user))
+    )
+    if room_type:
+        query = query.filter(RoomMapping.room_type == room_type)
+    if entity_type:
+        query = query.filter(RoomMapping.entity_type == entity_type)
+    if cursor:
+        cursor_ts, cursor_id = _decode_room_cursor(cursor)
+        query = query.filter(
+            or_(
+                activity < cursor_ts,
+                and_(activity == cursor_ts, RoomMapping.id < cursor_id),
+            )
         )
-        display_name = mapping.display_name if mapping else room_id
+    query = query.order_by(activity.desc(), RoomMapping.id.desc())
 
-        # For DM rooms, resolve pair key to the chat partner's display name
-        if mapping and mapping.room_type == RoomType.dm and display_name and display_name.startswith("dm:"):
-            display_name = _resolve_dm_display_name(
-                display_name, current_user.matrix_user_id, db
-            )
+    rows = query.limit(limit + 1).all() if limit else query.all()
+    has_more = bool(limit) and len(rows) > limit
+    rows = rows[:limit] if limit else rows
 
-        rooms.append(
-            RoomOut(
-                matrix_room_id=room_id,
-                display_name=display_name,
-                room_type=mapping.room_type if mapping else RoomType.general,
-                entity_type=mapping.entity_type if mapping else None,
-                entity_id=mapping.entity_id if mapping else None,
+    rooms = [
+        _room_out(mapping, last_activity, current_user.matrix_user_id, db, _unread(mapping.message_count, read_count))
+        for mapping, last_activity, read_count in rows
+    ]
+
+    # Rooms without a mapping have no activity data; list them once, after the last page
+    if not has_more and not room_type and not entity_type:
+        rooms.extend(
+            RoomOut(matrix_room_id=room_id, display_name=room_id, room_type=RoomType.general)
+            for (room_id,) in db.query(RoomMember.matrix_room_id)
+            .outerjoin(RoomMapping, RoomMapping.matrix_room_id == RoomMember.matrix_room_id)
+            .filter(
+                RoomMember.matrix_user_id == current_user.matrix_user_id,
+                RoomMapping.id.is_(None),
             )
+            .order_by(RoomMember.id)
         )
 
-    return RoomListOut(rooms=rooms)
+    next_cursor = None
+    if has_more:
+        last_mapping, last_activity, _read_count = rows[-1]
+        next_cursor = _encode_room_cursor(last_activity, last_mapping.id)
+
+    return RoomListOut(rooms=rooms, next_cursor=next_cursor, has_more=has_more)
+
+
+def _room_out(
+    mapping: RoomMapping,
+    last_activity: Optional[datetime],
+    current_matrix_id: str,
+    db: Session,
+    unread_count: int = 0,
+) -> RoomOut:
+    display_name = mapping.display_name or mapping.matrix_room_id
+
+    # For DM rooms, resolve pair key to the chat partner's display name
+    if mapping.room_type == RoomType.dm and display_name.startswith("dm:"):
+        display_name = _resolve_dm_display_name(display_name, current_matrix_id, db)
+
+    return RoomOut(
+        matrix_room_id=mapping.matrix_room_id,
+        display_name=display_name,
+        room_type=mapping.room_type,
+        entity_type=mapping.entity_type,
+        entity_id=mapping.entity_id,
+        last_message_ts=mapping.last_activity_at,
+        unread_count=unread_count,
+    )
+
+
+def _read_state_of(user: UserMapping):
+    """Join condition for the user's read state of a room."""
+    return and_(
+        RoomReadState.matrix_room_id == RoomMapping.matrix_room_id,
+        RoomReadState.hub_user_id == user.hub_user_id,
+    )
+
+
+def _joined_by(user: UserMapping):
+    """Condition: the user is a stored member of the mapped room."""
+    return exists().where(
+        RoomMember.matrix_room_id == RoomMapping.matrix_room_id,
+        RoomMember.matrix_user_id == user.matrix_user_id,
+    )
+
+
+def _unread(message_count: Optional[int], read_count: Optional[int]) -> int:
+    return max(0, (message_count or 0) - (read_count or 0))
+
+
+def _encode_room_cursor(last_activity: Optional[datetime], room_pk: int) -> str:
+    raw = f"{last_activity.isoformat() if last_activity else ''}|{room_pk}"
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+
+def _decode_room_cursor(cursor: str) -> tuple[Optional[datetime], int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8")
+        ts, room_pk = raw.rsplit("|", 1)
+        return (datetime.fromisoformat(ts) if ts else None), int(room_pk)
+    except (ValueError, UnicodeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
 
 
 def _resolve_dm_display_name(
@@ -90,17 +197,92 @@ def _resolve_dm_display_name(
     if not partner_matrix_id:
         partner_matrix_id = matrix_user_ids[0]
 
-    partner = (
-        db.query(UserMapping)
-        .filter(UserMapping.matrix_user_id == partner_matrix_id)
-        .first()
-    )
-    if partner and partner.display_name:
-        return partner.display_name
-    if partner:
-        return partner.hub_user_id
-    # Fallback: extract username from Matrix ID (@user:server -> user)
-    return partner_matrix_id.split(":")[0].lstrip("@")
+    return user_directory.display_name(partner_matrix_id, db)
+
+
+@router.post("/entities/lookup", response_model=EntityRoomLookupOut)
+async def lookup_entity_rooms(
+    body: EntityRoomLookup,
+    current_user: UserMapping = Depends(get_current_user),
+    db: Session = Depends(get_db),
+):
+    """Rooms, last activity and the user's unread counts of many entities.
+
+    Meant for satellite lists that show a chat badge per machine,
+    project, ...: one request and one indexed query for the whole list.
+    Rooms are not created; entities without a room, and rooms outside
+    the user's tenant that the user has not joined, come back with
+    ``matrix_room_id`` null.
+    """
+    if len(body.entities) > ROOM_LOOKUP_MAX_ITEMS:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"At most {ROOM_LOOKUP_MAX_ITEMS} entities per lookup",
+        )
+    keys = {entity_room_key(e.entity_type, e.entity_id) for e in body.entities}
+    found = {}
+    if keys:
+        found = {
+            room_key: (room_id, last_activity, _unread(message_count, read_count))
+            for room_key, room_id, last_activity, message_count, read_count in db.query(
+                RoomMapping.room_key,
+                RoomMapping.matrix_room_id,
+                RoomMapping.last_activity_at,
+                RoomMapping.message_count,
+                RoomReadState.read_count,
+            )
+            .outerjoin(RoomReadState, _read_state_of(current_user))
+            .filter(
+                RoomMapping.room_key.in_(list(keys)),
+                or_(RoomMapping.tenant_id == current_user.tenant_id, _joined_by(current_user)),
+            )
+        }
+
+    rooms = []
+    for entity in body.entities:
+        room_id, last_activity, unread = found.get(
+            entity_room_key(entity.entity_type, entity.entity_id), (None, None, 0)
+        )
+        rooms.append(EntityRoomStatus(
+            entity_type=entity.entity_type,
+            entity_id=entity.entity_id,
+            matrix_room_id=room_id,
+            last_activity_at=last_activity,
+            unread_count=unread,
+        ))
+    return EntityRoomLookupOut(rooms=rooms)
+
+
+@router.post("/{room_id}/read")
+async def mark_read(
+    room_id: str,
+    current_user: UserMapping = Depends(get_current_user),
+    db: Session = Depends(get_db),
+):
+    """Mark everything currently in the room as read by the user.
+
+    Only rooms the user has joined can be marked; others answer 404.
+    """
+    def joined_room():
+        return (
+            db.query(RoomMapping.message_count)
+            .filter(RoomMapping.matrix_room_id == room_id, _joined_by(current_user))
+            .first()
+        )
+
+    row = joined_room()
+    known = row is not None or db.query(
+        exists().where(RoomMapping.matrix_room_id == room_id)
+    ).scalar()
+    if row is None and known and current_user.matrix_access_token_encrypted:
+        # Maybe joined with another client since the last sync
+        forget_user(current_user.matrix_user_id)
+        await sync_user_rooms(current_user, db)
+        row = joined_room()
+    if row is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Room not found")
+    mark_room_read(current_user.hub_user_id, room_id, row.message_count or 0, db)
+    return {"ok": True, "read_count": row.message_count or 0}
 
 
 @router.post("", response_model=RoomOut, status_code=status.HTTP_201_CREATED)
@@ -130,6 +312,7 @@ async def create_room(
             status_code=status.HTTP_502_BAD_GATEWAY,
             detail=f"Failed to create room: {e}",
         )
+    record_join(current_user.matrix_user_id, mapping.matrix_room_id, db)
 
     return RoomOut(
         matrix_room_id=mapping.matrix_room_id,
@@ -163,6 +346,8 @@ async def join_room(
             detail=f"Failed to join room: {e}",
         )
 
+    record_join(current_user.matrix_user_id, room_id, db)
+    forget_room_audience(room_id)
     return {"status": "joined", "room_id": room_id}
 
 
@@ -271,9 +456,11 @@ async def invite_to_room(
             await matrix_client.join_room(
                 target.get_matrix_access_token(), room_id
             )
+            record_join(target.matrix_user_id, room_id, db)
     except MatrixClientError as e:
         raise HTTPException(status_code=502, detail=f"Failed to invite: {e}")
 
+    forget_room_audience(room_id)
     return {
         "status": "invited",
         "hub_user_id": hub_user_id,
@@ -281,6 +468,115 @@ async def invite_to_room(
     }
 
 
+@router.post("/{room_id}/invite-bulk")
+async def bulk_invite_to_room(
+    room_id: str,
+    invite: RoomBulkInvite,
+    current_user: UserMapping = Depends(get_current_user),
+    db: Session = Depends(get_db),
+):
+    """Invite a user list, a role and/or a tenant into a room.
+
+    All users are resolved with one query. Unprovisioned users are
+    provisioned, and everyone is invited and joined concurrently
+    (ROOM_INVITE_CONCURRENCY at a time). The response is streamed as
+    NDJSON: one line per user as soon as it is done
+    (``{"hub_user_id", "status": "joined" | "failed" | "not_found"}``),
+    then a summary line (``{"done": true, "joined", "failed", "not_found"}``).
+    Non-admins can only invite users of their own tenant.
+    """
+    if not current_user.matrix_access_token_encrypted:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="User not provisioned on Matrix",
+        )
+    if not invite.hub_user_ids and not invite.role and invite.tenant_id is None:
+        raise HTTPException(status_code=400, detail="hub_user_ids, role or tenant_id required")
+    is_admin = current_user.role == "admin"
+    if not is_admin and invite.tenant_id is not None and invite.tenant_id != current_user.tenant_id:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Cannot invite users of another tenant",
+        )
+
+    selectors = []
+    if invite.hub_user_ids:
+        selectors.append(UserMapping.hub_user_id.in_(invite.hub_user_ids))
+    if invite.role:
+        by_role = UserMapping.role == invite.role
+        if invite.tenant_id is not None:
+            by_role = and_(by_role, UserMapping.tenant_id == invite.tenant_id)
+        selectors.append(by_role)
+    elif invite.tenant_id is not None:
+        selectors.append(UserMapping.tenant_id == invite.tenant_id)
+    query = db.query(UserMapping).filter(UserMapping.is_bot == False, or_(*selectors))
+    if not is_admin:
+        # Users of other tenants are reported as not_found
+        query = query.filter(UserMapping.tenant_id == current_user.tenant_id)
+    targets = query.order_by(UserMapping.hub_user_id).all()
+    found = {target.hub_user_id for target in targets}
+    not_found = [h for h in dict.fromkeys(invite.hub_user_ids or []) if h not in found]
+
+    return StreamingResponse(
+        _bulk_invite_results(room_id, targets, not_found, current_user.get_matrix_access_token()),
+        media_type="application/x-ndjson",
+    )
+
+
+async def _bulk_invite_results(
+    room_id: str,
+    targets: List[UserMapping],
+    not_found: List[str],
+    inviter_token: str,
+) -> AsyncIterator[bytes]:
+    counts = {"joined": 0, "failed": 0, "not_found": len(not_found)}
+    for hub_user_id in not_found:
+        yield _ndjson({"hub_user_id": hub_user_id, "status": "not_found"})
+
+    semaphore = asyncio.Semaphore(max(1, ROOM_INVITE_CONCURRENCY))
+
+    async def add(target: UserMapping) -> Dict[str, Any]:
+        hub_user_id = target.hub_user_id
+        async with semaphore:
+            try:
+                if not target.matrix_access_token_encrypted:
+                    # Own session: provisioning commits, and runs concurrently
+                    db = SessionLocal()
+                    try:
+                        target = await provision_matrix_user(
+                            hub_user_id=hub_user_id,
+                            display_name=target.display_name or hub_user_id,
+                            tenant_id=target.tenant_id,
+                            db=db,
+                        )
+                    finally:
+                        db.close()
+                if await ensure_user_in_room(target, room_id, inviter_token):
+                    return {"hub_user_id": hub_user_id, "status": "joined", "display_name": target.display_name}
+                error = "Could not join room"
+            except Exception as e:
+                logger.warning("Bulk invite of %s into %s failed: %s", hub_user_id, room_id, e)
+                error = str(e)[:200]
+            return {"hub_user_id": hub_user_id, "status": "failed", "error": error}
+
+    tasks = [asyncio.create_task(add(target)) for target in targets]
+    try:
+        for next_result in asyncio.as_completed(tasks):
+            result = await next_result
+            counts[result["status"]] += 1
+            yield _ndjson(result)
+    finally:
+        # Client gone: don't keep inviting in the background
+        for task in tasks:
+            task.cancel()
+        forget_room_audience(room_id)
+    yield _ndjson({"done": True, **counts})
+
+
+def _ndjson(data: Dict[str, Any]) -> bytes:
+    return (json.dumps(data) + "\n").encode("utf-8")
+
+
 @router.get("/{room_id}/members")
 async def get_room_members(
     room_id: str,
@@ -301,19 +597,16 @@ async def get_room_members(
     except MatrixClientError as e:
         raise HTTPException(status_code=502, detail=f"Failed to get members: {e}")
 
-    # Resolve display names from our DB
+    # Resolve display names from the shared user directory
+    entries = user_directory.resolve_many(members, db)
     result = []
     for matrix_user_id in members:
-        user = (
-            db.query(UserMapping)
-            .filter(UserMapping.matrix_user_id == matrix_user_id)
-            .first()
-        )
+        user = entries.get(matrix_user_id)
         result.append({
             "matrix_user_id": matrix_user_id,
             "hub_user_id": user.hub_user_id if user else None,
             "display_name": (user.display_name if user else None)
-                or matrix_user_id.split(":")[0].lstrip("@"),
+                or fallback_name(matrix_user_id),
         })
 
     return result
@@ -1,7 +1,32 @@
 from app.schemas.users import UserOut, TokenData, TokenResponse
-from app.schemas.messages import MessageSend, MessageOut, MessageHistory
-from app.schemas.rooms import RoomCreate, RoomOut, RoomListOut
-from app.schemas.notifications import NotificationSend, NotificationOut
+from app.schemas.messages import (
+    MessageSend,
+    MessageOut,
+    MessageAccepted,
+    MessageHistory,
+    MessageBatchSend,
+    MessageBatchResult,
+    MessageBatchOut,
+)
+from app.schemas.rooms import (
+    RoomCreate,
+    RoomOut,
+    RoomListOut,
+    RoomBulkInvite,
+    EntityRef,
+    EntityRoomSpec,
+    EntityRoomLookup,
+    EntityRoomStatus,
+    EntityRoomLookupOut,
+)
+from app.schemas.jobs import JobOut
+from app.schemas.notifications import (
+    NotificationSend,
+    NotificationOut,
+    NotificationBatchOut,
+    NotificationStatBucket,
+    NotificationStatsOut,
+)
 
 __all__ = [
     "UserOut",
@@ -9,10 +34,24 @@ __all__ = [
     "TokenResponse",
     "MessageSend",
     "MessageOut",
+    "MessageAccepted",
     "MessageHistory",
+    "MessageBatchSend",
+    "MessageBatchResult",
+    "MessageBatchOut",
     "RoomCreate",
     "RoomOut",
     "RoomListOut",
+    "RoomBulkInvite",
+    "EntityRef",
+    "EntityRoomSpec",
+    "EntityRoomLookup",
+    "EntityRoomStatus",
+    "EntityRoomLookupOut",
+    "JobOut",
     "NotificationSend",
     "NotificationOut",
+    "NotificationBatchOut",
+    "NotificationStatBucket",
+    "NotificationStatsOut",
 ]
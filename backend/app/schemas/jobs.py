@@ -0,0 +1,18 @@
+from typing import Optional
+
+from pydantic import BaseModel
+
+
+class JobOut(BaseModel):
+    """Progress of a background job (see app.services.jobs)."""
+    id: str
+    kind: str
+    subject: str
+    status: str  # running, finished, failed, cancelled
+    total: int
+    done: int
+    failed: int
+    skipped: int
+    error: Optional[str] = None
+    started_at: str
+    finished_at: Optional[str] = None
@@ -1,13 +1,19 @@
 from datetime import datetime
 from typing import Optional, List
 
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
+
+from app.config import MESSAGE_BATCH_MAX_ITEMS
+
+# Client transaction IDs end up in a Matrix URL path segment
+TXN_ID_PATTERN = r"^[A-Za-z0-9._~-]{1,64}$"
 
 
 class MessageSend(BaseModel):
     room_id: str
     body: str
     msg_type: str = "m.text"
+    txn_id: Optional[str] = Field(None, pattern=TXN_ID_PATTERN)  # client ID for idempotent retries
 
 
 class MessageOut(BaseModel):
@@ -23,7 +29,38 @@ class MessageOut(BaseModel):
     file_size: Optional[int] = None
 
 
+class MessageAccepted(BaseModel):
+    """Local echo for a message queued for asynchronous delivery (HTTP 202)."""
+    provisional_id: str
+    room_id: str
+    sender: str
+    sender_display_name: Optional[str] = None
+    body: str
+    msg_type: str = "m.text"
+    timestamp: datetime
+    status: str = "queued"
+
+
 class MessageHistory(BaseModel):
     messages: List[MessageOut]
     end_token: Optional[str] = None
     has_more: bool = False
+
+
+class MessageBatchSend(BaseModel):
+    messages: List[MessageSend] = Field(..., min_length=1, max_length=MESSAGE_BATCH_MAX_ITEMS)
+
+
+class MessageBatchResult(BaseModel):
+    index: int
+    room_id: str
+    status: str  # sent, failed
+    event_id: Optional[str] = None
+    txn_id: Optional[str] = None
+    error: Optional[str] = None
+
+
+class MessageBatchOut(BaseModel):
+    results: List[MessageBatchResult]
+    sent: int = 0
+    failed: int = 0
@@ -1,5 +1,5 @@
 from datetime import datetime
-from typing import Optional
+from typing import Dict, List, Optional
 
 from pydantic import BaseModel
 
@@ -9,10 +9,14 @@ class NotificationSend(BaseModel):
     event_type: str
     title: str
     body: Optional[str] = None
-    target_type: str = "general"  # general, entity_room, dm, service_room
+    target_type: str = "general"  # general, entity_room, dm, service_room, users, role, tenant
     entity_type: Optional[str] = None
     entity_id: Optional[int] = None
     target_user: Optional[str] = None  # for DM notifications
+    # Multi-recipient targets, delivered as one DM per recipient
+    target_users: Optional[List[str]] = None  # for target_type "users"
+    target_role: Optional[str] = None  # for target_type "role"
+    target_tenant_id: Optional[int] = None  # for target_type "tenant"; narrows "role"
     priority: str = "normal"  # normal, urgent
 
 
@@ -26,7 +30,34 @@ class NotificationOut(BaseModel):
     status: str
     matrix_room_id: Optional[str] = None
     matrix_event_id: Optional[str] = None
+    error_message: Optional[str] = None
+    attempts: int = 0
+    next_attempt_at: Optional[datetime] = None
     created_at: datetime
 
     class Config:
         from_attributes = True
+
+
+class NotificationBatchOut(BaseModel):
+    notifications: List[NotificationOut]
+    sent: int = 0
+    failed: int = 0
+    pending: int = 0
+
+
+class NotificationStatBucket(BaseModel):
+    bucket: datetime
+    source_app: str
+    event_type: str
+    status: str
+    count: int
+    latency_avg_seconds: float
+    latency_max_seconds: float
+
+
+class NotificationStatsOut(BaseModel):
+    since: datetime
+    until: Optional[datetime] = None
+    totals: Dict[str, int]  # count per status over the whole window
+    buckets: List[NotificationStatBucket]
@@ -29,3 +29,36 @@ class RoomOut(BaseModel):
 
 class RoomListOut(BaseModel):
     rooms: List[RoomOut]
+    next_cursor: Optional[str] = None
+    has_more: bool = False
+
+
+class RoomBulkInvite(BaseModel):
+    """Users to add to a room; the union of all given selectors."""
+    hub_user_ids: Optional[List[str]] = None
+    role: Optional[str] = None  # all users with this role (narrowed by tenant_id if given)
+    tenant_id: Optional[int] = None  # all users of this tenant
+
+
+class EntityRef(BaseModel):
+    entity_type: str
+    entity_id: int
+
+
+class EntityRoomSpec(EntityRef):
+    display_name: Optional[str] = None  # defaults to "<entity_type> #<entity_id>"
+    tenant_id: Optional[int] = None
+
+
+class EntityRoomLookup(BaseModel):
+    entities: List[EntityRef]
+
+
+class EntityRoomStatus(EntityRef):
+    matrix_room_id: Optional[str] = None  # None if the entity has no room yet
+    last_activity_at: Optional[datetime] = None
+    unread_count: int = 0
+
+
+class EntityRoomLookupOut(BaseModel):
+    rooms: List[EntityRoomStatus]
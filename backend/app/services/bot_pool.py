@@ -0,0 +1,149 @@
+"""Pool of notification bot accounts.
+
+Conduit rate-limits per user and effectively serializes one user's
+sends to a room, so notifications can be spread over several bot
+accounts. Rooms are assigned to bots by a stable hash of the room ID:
+all notifications for one room go out through the same bot and stay in
+order. A bot that fails repeatedly is paused for a cool-down period.
+Its rooms do not fall over to another bot: Matrix deduplicates txn_ids
+per access token, so a resend through a second bot could post a message
+twice, and it would overtake the room's queued sends. Sends to those
+rooms are deferred until the cool-down ends instead (BotCoolingDown).
+"""
+
+import collections
+import logging
+import time
+import zlib
+from dataclasses import dataclass, field
+from typing import Any, Deque, Dict, List, Optional
+
+from sqlalchemy.orm import Session
+
+from app.models import UserMapping
+
+logger = logging.getLogger("bot_pool")
+
+FAILURE_THRESHOLD = 3
+COOLDOWN_SECONDS = 60.0
+
+
+def pool_bot_names(primary: str, size: int) -> List[str]:
+    """Hub user IDs of a pool: the primary bot plus <primary>_2..<primary>_N."""
+    return [primary] + [f"{primary}_{i}" for i in range(2, size + 1)]
+
+
+@dataclass
+class PoolBot:
+    hub_user_id: str
+    matrix_user_id: str
+    access_token: str
+    sent: int = 0
+    failed: int = 0
+    consecutive_failures: int = 0
+    unhealthy_until: float = 0.0
+    send_seconds: float = 0.0
+    last_error: Optional[str] = None
+    recent_sends: Deque[float] = field(default_factory=lambda: collections.deque(maxlen=10000))
+
+    def healthy(self, now: float) -> bool:
+        return now >= self.unhealthy_until
+
+
+class BotCoolingDown(Exception):
+    """The room's bot is paused; nothing was sent, try again in ``seconds``."""
+
+    def __init__(self, hub_user_id: str, seconds: float):
+        super().__init__(f"Bot {hub_user_id} is cooling down after repeated failures")
+        self.seconds = seconds
+
+
+class BotPool:
+    """Room-sharded notification senders with per-bot health and throughput."""
+
+    def __init__(self, names: List[str]):
+        self.names = names
+        self._bots: List[PoolBot] = []
+
+    def __len__(self) -> int:
+        return len(self._bots)
+
+    def load(self, db: Session) -> int:
+        """(Re)load tokens of all provisioned pool bots, keeping their counters."""
+        mappings = {
+            m.hub_user_id: m
+            for m in db.query(UserMapping)
+            .filter(UserMapping.hub_user_id.in_(self.names), UserMapping.is_bot == True)
+            .all()
+        }
+        previous = {bot.hub_user_id: bot for bot in self._bots}
+        bots = []
+        for name in self.names:
+            mapping = mappings.get(name)
+            if not mapping or not mapping.matrix_access_token_encrypted:
+                continue
+            try:
+                token = mapping.get_matrix_access_token()
+            except ValueError as e:
+                logger.error("Failed to decrypt token of bot %s: %s", name, e)
+                continue
+            bot = previous.get(name) or PoolBot(
+                hub_user_id=name,
+                matrix_user_id=mapping.matrix_user_id,
+                access_token=token,
+            )
+            bot.access_token = token
+            bots.append(bot)
+        self._bots = bots
+        logger.info("Bot pool loaded with %d of %d bot(s).", len(bots), len(self.names))
+        return len(bots)
+
+    def ensure_loaded(self, db: Session) -> None:
+        if not self._bots:
+            self.load(db)
+
+    def for_room(self, room_id: str) -> Optional[PoolBot]:
+        """The bot serving a room, healthy or not (see check_ready)."""
+        if not self._bots:
+            return None
+        return self._bots[zlib.crc32(room_id.encode("utf-8")) % len(self._bots)]
+
+    @staticmethod
+    def check_ready(bot: PoolBot) -> None:
+        """Raise BotCoolingDown while the bot is paused."""
+        now = time.monotonic()
+        if not bot.healthy(now):
+            raise BotCoolingDown(bot.hub_user_id, bot.unhealthy_until - now)
+
+    def record(self, bot: PoolBot, ok: bool, seconds: float, error: Optional[str] = None) -> None:
+        bot.send_seconds += seconds
+        if ok:
+            bot.sent += 1
+            bot.consecutive_failures = 0
+            bot.recent_sends.append(time.monotonic())
+            return
+        bot.failed += 1
+        bot.consecutive_failures += 1
+        bot.last_error = (error or "")[:200]
+        if bot.consecutive_failures >= FAILURE_THRESHOLD:
+            bot.unhealthy_until = time.monotonic() + COOLDOWN_SECONDS
+            logger.warning(
+                "Bot %s failed %d times in a row, pausing it for %.0fs",
+                bot.hub_user_id, bot.consecutive_failures, COOLDOWN_SECONDS,
+            )
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        result = {}
+        for bot in self._bots:
+            attempts = bot.sent + bot.failed
+            result[bot.hub_user_id] = {
+                "healthy": bot.healthy(now),
+                "sent": bot.sent,
+                "failed": bot.failed,
+                "sent_last_minute": sum(1 for t in bot.recent_sends if now - t <= 60),
+                "avg_send_seconds": round(bot.send_seconds / attempts, 3) if attempts else 0.0,
+                "consecutive_failures": bot.consecutive_failures,
+                "last_error": bot.last_error,
+            }
+        return result
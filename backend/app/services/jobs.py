@@ -0,0 +1,127 @@
+"""In-process registry of background jobs and their progress.
+
+Bulk work that should not run inside a request (joining all users to a
+room, ...) is started as an asyncio task through the registry. The job
+keeps simple progress counters that the admin API exposes. Only the
+last KEEP_FINISHED finished jobs are remembered; nothing is persisted,
+so jobs interrupted by a restart have to be started again.
+"""
+
+import asyncio
+import itertools
+import logging
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+logger = logging.getLogger("jobs")
+
+KEEP_FINISHED = 200
+
+
+@dataclass
+class Job:
+    id: str
+    kind: str
+    subject: str
+    total: int = 0
+    done: int = 0
+    failed: int = 0
+    skipped: int = 0
+    status: str = "running"
+    error: Optional[str] = None
+    started_at: datetime = field(default_factory=lambda: datetime.now(timezone.utc))
+    finished_at: Optional[datetime] = None
+
+    @property
+    def running(self) -> bool:
+        return self.status == "running"
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "subject": self.subject,
+            "status": self.status,
+            "total": self.total,
+            "done": self.done,
+            "failed": self.failed,
+            "skipped": self.skipped,
+            "error": self.error,
+            "started_at": self.started_at.isoformat(),
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+        }
+
+
+class JobRegistry:
+    """Starts jobs as tasks and keeps their progress for monitoring."""
+
+    def __init__(self, keep_finished: int = KEEP_FINISHED):
+        self.keep_finished = keep_finished
+        self._jobs: Dict[str, Job] = {}
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._ids = itertools.count(1)
+
+    def start(self, kind: str, subject: str, run: Callable[[Job], Awaitable[None]]) -> Job:
+        """Run ``run(job)`` in the background; returns the job right away."""
+        job = Job(id=f"{kind}-{next(self._ids)}", kind=kind, subject=subject)
+        self._jobs[job.id] = job
+        self._tasks[job.id] = asyncio.create_task(self._run(job, run), name=job.id)
+        self._prune()
+        return job
+
+    def active(self, kind: str, subject: str) -> Optional[Job]:
+        """The running job of this kind for a subject, if any."""
+        for job in self._jobs.values():
+            if job.running and job.kind == kind and job.subject == subject:
+                return job
+        return None
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self._jobs.get(job_id)
+
+    def list(self, kind: Optional[str] = None) -> List[Job]:
+        """Jobs, newest first."""
+        jobs = [j for j in self._jobs.values() if kind is None or j.kind == kind]
+        return sorted(jobs, key=lambda j: j.started_at, reverse=True)
+
+    async def _run(self, job: Job, run: Callable[[Job], Awaitable[None]]) -> None:
+        try:
+            await run(job)
+            job.status = "finished"
+        except asyncio.CancelledError:
+            job.status = "cancelled"
+            raise
+        except Exception as e:
+            job.status = "failed"
+            job.error = str(e)[:200]
+            logger.exception("Job %s failed", job.id)
+        finally:
+            job.finished_at = datetime.now(timezone.utc)
+            self._tasks.pop(job.id, None)
+            logger.info(
+                "Job %s %s: %d/%d done, %d failed, %d skipped",
+                job.id, job.status, job.done, job.total, job.failed, job.skipped,
+            )
+
+    def _prune(self) -> None:
+        finished = [j for j in self._jobs.values() if not j.running]
+        finished.sort(key=lambda j: j.started_at)
+        for job in finished[:max(0, len(finished) - self.keep_finished)]:
+            del self._jobs[job.id]
+
+    async def stop(self) -> None:
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def stats(self) -> Dict[str, Any]:
+        running = [j for j in self._jobs.values() if j.running]
+        return {
+            "running": len(running),
+            "remembered": len(self._jobs),
+        }
+
+
+jobs = JobRegistry()
@@ -4,6 +4,7 @@ Uses direct HTTP calls to Conduit's CS API instead of matrix-nio
 for simpler dependency management and better async support.
 """
 
+import json
 import logging
 from datetime import datetime
 from typing import Optional, List, Dict, Any
@@ -16,7 +17,32 @@ logger = logging.getLogger("matrix_client")
 
 
 class MatrixClientError(Exception):
-    pass
+    """A Matrix API call failed; carries the HTTP status and Matrix errcode if known."""
+
+    def __init__(
+        self,
+        message: str,
+        status_code: Optional[int] = None,
+        errcode: Optional[str] = None,
+    ):
+        super().__init__(message)
+        self.status_code = status_code
+        self.errcode = errcode
+
+    @classmethod
+    def from_response(cls, prefix: str, resp: httpx.Response) -> "MatrixClientError":
+        errcode = None
+        try:
+            data = resp.json()
+            if isinstance(data, dict):
+                errcode = data.get("errcode")
+        except ValueError:
+            pass
+        return cls(
+            f"{prefix}: {resp.status_code} {resp.text}",
+            status_code=resp.status_code,
+            errcode=errcode,
+        )
 
 
 class MatrixClient:
@@ -63,7 +89,7 @@ class MatrixClient:
             if data.get("errcode") == "M_USER_IN_USE":
                 return await self.login(username, password)
             raise MatrixClientError(f"Register failed: {data}")
-        raise MatrixClientError(f"Register failed: {resp.status_code} {resp.text}")
+        raise MatrixClientError.from_response("Register failed", resp)
 
     async def login(self, username: str, password: str) -> Dict[str, Any]:
         """Login and get access token."""
@@ -76,7 +102,18 @@ class MatrixClient:
         resp = await client.post("/_matrix/client/v3/login", json=body)
         if resp.status_code == 200:
             return resp.json()
-        raise MatrixClientError(f"Login failed: {resp.status_code} {resp.text}")
+        raise MatrixClientError.from_response("Login failed", resp)
+
+    async def whoami(self, access_token: str) -> str:
+        """Matrix user ID an access token belongs to."""
+        client = await self._client()
+        resp = await client.get(
+            "/_matrix/client/v3/account/whoami",
+            headers=self._auth_headers(access_token),
+        )
+        if resp.status_code == 200:
+            return resp.json()["user_id"]
+        raise MatrixClientError.from_response("Whoami failed", resp)
 
     async def change_password(
         self, access_token: str, new_password: str, logout_devices: bool = False
@@ -94,9 +131,7 @@ class MatrixClient:
             headers=self._auth_headers(access_token),
         )
         if resp.status_code != 200:
-            raise MatrixClientError(
-                f"Change password failed: {resp.status_code} {resp.text}"
-            )
+            raise MatrixClientError.from_response("Change password failed", resp)
 
     # --- Rooms ---
 
@@ -129,7 +164,7 @@ class MatrixClient:
         )
         if resp.status_code == 200:
             return resp.json()["room_id"]
-        raise MatrixClientError(f"Create room failed: {resp.status_code} {resp.text}")
+        raise MatrixClientError.from_response("Create room failed", resp)
 
     async def join_room(self, access_token: str, room_id: str) -> None:
         """Join a room."""
@@ -140,20 +175,53 @@ class MatrixClient:
             headers=self._auth_headers(access_token),
         )
         if resp.status_code != 200:
-            raise MatrixClientError(f"Join room failed: {resp.status_code} {resp.text}")
+            raise MatrixClientError.from_response("Join room failed", resp)
+
+    async def leave_room(self, access_token: str, room_id: str) -> None:
+        """Leave a room and forget it, so it drops out of the user's room list."""
+        client = await self._client()
+        for action in ("leave", "forget"):
+            resp = await client.post(
+                f"/_matrix/client/v3/rooms/{room_id}/{action}",
+                json={},
+                headers=self._auth_headers(access_token),
+            )
+            if resp.status_code != 200:
+                raise MatrixClientError.from_response(f"Room {action} failed", resp)
+
+    async def kick_user(
+        self, access_token: str, room_id: str, user_id: str, reason: Optional[str] = None
+    ) -> None:
+        """Remove a member from a room (also withdraws a pending invite)."""
+        client = await self._client()
+        body: Dict[str, Any] = {"user_id": user_id}
+        if reason:
+            body["reason"] = reason
+        resp = await client.post(
+            f"/_matrix/client/v3/rooms/{room_id}/kick",
+            json=body,
+            headers=self._auth_headers(access_token),
+        )
+        if resp.status_code != 200:
+            raise MatrixClientError.from_response("Kick failed", resp)
 
     async def invite_user(
         self, access_token: str, room_id: str, user_id: str
     ) -> None:
-        """Invite a user to a room."""
+        """Invite a user to a room (no-op if they are already invited or joined)."""
         client = await self._client()
         resp = await client.post(
             f"/_matrix/client/v3/rooms/{room_id}/invite",
             json={"user_id": user_id},
             headers=self._auth_headers(access_token),
         )
-        if resp.status_code not in (200, 403):
-            raise MatrixClientError(f"Invite failed: {resp.status_code} {resp.text}")
+        if resp.status_code == 200:
+            return
+        # The homeserver refuses inviting members with a 403 "already ..."; any
+        # other 403 (e.g. missing invite power level) is a real failure
+        if resp.status_code == 403 and "already" in resp.text.lower():
+            return
+        raise MatrixClientError.from_response("Invite failed", resp)
 
     async def list_joined_rooms(self, access_token: str) -> List[str]:
         """List all rooms the user has joined."""
@@ -164,7 +232,7 @@ class MatrixClient:
         )
         if resp.status_code == 200:
             return resp.json().get("joined_rooms", [])
-        raise MatrixClientError(f"List rooms failed: {resp.status_code} {resp.text}")
+        raise MatrixClientError.from_response("List rooms failed", resp)
 
     # --- Room members ---
 
@@ -179,7 +247,23 @@ class MatrixClient:
         )
         if resp.status_code == 200:
             return list(resp.json().get("joined", {}).keys())
-        raise MatrixClientError(f"Get members failed: {resp.status_code} {resp.text}")
+        raise MatrixClientError.from_response("Get members failed", resp)
+
+    async def get_room_memberships(
+        self, access_token: str, room_id: str
+    ) -> Dict[str, str]:
+        """Membership ("join", "invite", "leave", ...) of everyone in a room's member list."""
+        client = await self._client()
+        resp = await client.get(
+            f"/_matrix/client/v3/rooms/{room_id}/members",
+            headers=self._auth_headers(access_token),
+        )
+        if resp.status_code == 200:
+            return {
+                event["state_key"]: event.get("content", {}).get("membership", "")
+                for event in resp.json().get("chunk", [])
+            }
+        raise MatrixClientError.from_response("Get memberships failed", resp)
 
     # --- Messages ---
 
@@ -205,7 +289,7 @@ class MatrixClient:
         )
         if resp.status_code == 200:
             return resp.json()["event_id"]
-        raise MatrixClientError(f"Send failed: {resp.status_code} {resp.text}")
+        raise MatrixClientError.from_response("Send failed", resp)
 
     async def get_room_messages(
         self,
@@ -214,12 +298,19 @@ class MatrixClient:
         limit: int = 50,
         from_token: Optional[str] = None,
         direction: str = "b",  # b=backwards, f=forwards
+        event_filter: Optional[Dict[str, Any]] = None,
     ) -> Dict[str, Any]:
-        """Get message history for a room."""
+        """Get message history for a room.
+
+        ``event_filter`` is a Matrix RoomEventFilter applied server-side,
+        so ``limit`` counts only matching events.
+        """
         client = await self._client()
         params: Dict[str, Any] = {"dir": direction, "limit": limit}
         if from_token:
             params["from"] = from_token
+        if event_filter:
+            params["filter"] = json.dumps(event_filter, separators=(",", ":"))
         resp = await client.get(
             f"/_matrix/client/v3/rooms/{room_id}/messages",
             params=params,
@@ -227,7 +318,7 @@ class MatrixClient:
         )
         if resp.status_code == 200:
             return resp.json()
-        raise MatrixClientError(f"Get messages failed: {resp.status_code} {resp.text}")
+        raise MatrixClientError.from_response("Get messages failed", resp)
 
     # --- File upload ---
 
@@ -260,7 +351,7 @@ class MatrixClient:
                 return content_uri
             logger.debug("Upload via %s failed: %d %s", media_path, resp.status_code, resp.text[:200])
 
-        raise MatrixClientError(f"Upload failed: {resp.status_code} {resp.text}")
+        raise MatrixClientError.from_response("Upload failed", resp)
 
     async def send_message_event(
         self,
@@ -282,7 +373,7 @@ class MatrixClient:
         )
         if resp.status_code == 200:
             return resp.json()["event_id"]
-        raise MatrixClientError(f"Send event failed: {resp.status_code} {resp.text}")
+        raise MatrixClientError.from_response("Send event failed", resp)
 
     # --- Sync ---
 
@@ -308,7 +399,7 @@ class MatrixClient:
         )
         if resp.status_code == 200:
             return resp.json()
-        raise MatrixClientError(f"Sync failed: {resp.status_code} {resp.text}")
+        raise MatrixClientError.from_response("Sync failed", resp)
 
     # --- Profile ---
 
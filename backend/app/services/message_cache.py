@@ -0,0 +1,203 @@
+"""Bounded per-room ring buffer of recently seen messages.
+
+Opening a chat always asks for the newest page of history. This cache
+keeps the most recent messages of each room in memory so that page can
+be answered without a Conduit round trip.
+
+A room buffer is *complete* once it has been seeded from a Conduit
+history response: it then holds a contiguous tail of the room plus the
+Matrix pagination token pointing just before its oldest message.
+Messages sent through this process are appended as they happen. When a
+buffer overflows it loses that continuity and is marked incomplete
+until the next Conduit fetch reseeds it.
+
+The buffers are per process. Messages sent through another uvicorn
+worker are detected with the room's message_count in the database,
+which every API send increments: a buffer remembers the count it
+accounts for and is not served once the stored count differs. Messages
+posted by external Matrix clients (and rooms without a mapping) are
+only picked up when the buffer goes stale after
+MESSAGE_CACHE_TTL_SECONDS.
+
+Messages are stored as the plain dicts the history endpoint serializes
+(the shape of MessageOut), so cached pages need no further conversion.
+
+Cached pages are only served to users Conduit has let read or write the
+room since the buffer was last seeded, so the cache never widens room
+visibility for longer than the TTL.
+"""
+
+import logging
+import time
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from typing import Any, Deque, Dict, List, Optional, Set
+
+from app.config import (
+    MESSAGE_CACHE_MAX_ROOMS,
+    MESSAGE_CACHE_ROOM_SIZE,
+    MESSAGE_CACHE_TTL_SECONDS,
+)
+
+logger = logging.getLogger("message_cache")
+
+# Prefix for pagination tokens that point into a cached buffer
+CACHE_TOKEN_PREFIX = "cache:"
+
+
+@dataclass
+class CachedPage:
+    messages: List[Dict[str, Any]]  # newest first, like Matrix dir=b
+    end_token: Optional[str]
+    has_more: bool
+
+
+@dataclass
+class _RoomBuffer:
+    messages: Deque[Dict[str, Any]]  # oldest first
+    end_token: Optional[str] = None
+    has_more: bool = False
+    complete: bool = False
+    seeded_at: float = field(default_factory=time.monotonic)
+    readers: Set[str] = field(default_factory=set)
+    # RoomMapping.message_count covered by the buffer; None if the room has no mapping
+    message_count: Optional[int] = None
+
+
+class RecentMessageCache:
+    """LRU of room buffers, each holding up to ``room_size`` messages."""
+
+    def __init__(
+        self,
+        room_size: int = MESSAGE_CACHE_ROOM_SIZE,
+        max_rooms: int = MESSAGE_CACHE_MAX_ROOMS,
+        ttl_seconds: int = MESSAGE_CACHE_TTL_SECONDS,
+    ):
+        self.room_size = room_size
+        self.max_rooms = max_rooms
+        self.ttl_seconds = ttl_seconds
+        self._rooms: "OrderedDict[str, _RoomBuffer]" = OrderedDict()
+
+    @property
+    def enabled(self) -> bool:
+        return self.room_size > 0 and self.max_rooms > 0
+
+    def _touch(self, room_id: str) -> Optional[_RoomBuffer]:
+        buf = self._rooms.get(room_id)
+        if buf is not None:
+            self._rooms.move_to_end(room_id)
+        return buf
+
+    def seed(
+        self,
+        room_id: str,
+        messages: List[Dict[str, Any]],
+        end_token: Optional[str],
+        has_more: bool,
+        reader: str,
+        message_count: Optional[int] = None,
+    ) -> None:
+        """Replace a room's buffer with the newest page fetched from Conduit.
+
+        ``messages`` are newest first, as returned by ``/messages?dir=b``.
+        ``message_count`` is the room's stored count read before the fetch.
+        """
+        if not self.enabled:
+            return
+        newest = messages[: self.room_size]
+        buf = _RoomBuffer(
+            messages=deque(reversed(newest), maxlen=self.room_size),
+            end_token=end_token,
+            has_more=has_more or len(messages) > len(newest),
+            complete=len(newest) == len(messages),
+            # Readers are only trusted until the next reseed, so a user who
+            # left the room loses access within MESSAGE_CACHE_TTL_SECONDS
+            readers={reader},
+            message_count=message_count,
+        )
+        self._rooms[room_id] = buf
+        self._rooms.move_to_end(room_id)
+        while len(self._rooms) > self.max_rooms:
+            evicted, _ = self._rooms.popitem(last=False)
+            logger.debug("Evicted message buffer for room %s", evicted)
+
+    def append(self, message: Dict[str, Any]) -> None:
+        """Record a message that was just sent to a buffered room."""
+        buf = self._touch(message["room_id"])
+        if buf is None:
+            return
+        buf.readers.add(message["sender"])
+        if any(m["event_id"] == message["event_id"] for m in buf.messages):
+            return
+        if len(buf.messages) == self.room_size:
+            # Dropping the oldest entry breaks continuity with end_token
+            buf.complete = False
+        buf.messages.append(message)
+        if buf.message_count is not None:
+            buf.message_count += 1
+
+    def add_reader(self, room_id: str, reader: str) -> None:
+        buf = self._rooms.get(room_id)
+        if buf is not None:
+            buf.readers.add(reader)
+
+    def invalidate(self, room_id: str) -> None:
+        self._rooms.pop(room_id, None)
+
+    def page(
+        self,
+        room_id: str,
+        limit: int,
+        reader: str,
+        before: Optional[str] = None,
+        message_count: Optional[int] = None,
+    ) -> Optional[CachedPage]:
+        """Serve a history page from the buffer, or None if it cannot.
+
+        ``before`` is the event ID a previous cached page ended at. When
+        the buffer is exhausted the page carries the Matrix token so the
+        next request continues on Conduit. ``message_count`` is the room's
+        current stored count; a different count means messages arrived
+        through another process.
+        """
+        buf = self._touch(room_id)
+        if buf is None or not buf.complete or reader not in buf.readers:
+            return None
+        if time.monotonic() - buf.seeded_at > self.ttl_seconds:
+            return None
+        if buf.message_count != message_count:
+            return None
+
+        messages = list(buf.messages)
+        if before is not None:
+            idx = next(
+                (i for i, m in enumerate(messages) if m["event_id"] == before), None
+            )
+            if idx is None:
+                return None
+            messages = messages[:idx]
+
+        if len(messages) > limit:
+            page = messages[-limit:]
+            return CachedPage(
+                messages=list(reversed(page)),
+                end_token=CACHE_TOKEN_PREFIX + page[0]["event_id"],
+                has_more=True,
+            )
+        if before is None and buf.has_more and len(messages) < limit:
+            # Buffer holds less than a full first page of a longer history
+            return None
+        return CachedPage(
+            messages=list(reversed(messages)),
+            end_token=buf.end_token,
+            has_more=buf.has_more,
+        )
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "rooms": len(self._rooms),
+            "messages": sum(len(b.messages) for b in self._rooms.values()),
+        }
+
+
+message_cache = RecentMessageCache()
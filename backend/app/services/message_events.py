@@ -0,0 +1,245 @@
+"""Real-time (SSE) fan-out of new room messages and notifications."""
+
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Dict, FrozenSet, List, Tuple
+
+import httpx
+from sqlalchemy.orm import Session
+
+from app.config import SSE_AUDIENCE_TTL_SECONDS
+from app.models import NotificationLog, NotificationStatus, RoomMapping, RoomType, UserMapping
+from app.services.matrix_client import matrix_client, MatrixClientError
+from app.services.sse_broker import broker
+from app.services.user_directory import user_directory
+
+logger = logging.getLogger("message_events")
+
+
+async def notify_room_members(
+    room_id: str,
+    event_id: str,
+    sender: str,
+    sender_display_name: str | None,
+    body: str,
+    msg_type: str,
+    db: Session,
+    file_url: str | None = None,
+    filename: str | None = None,
+    file_size: int | None = None,
+    provisional_id: str | None = None,
+) -> None:
+    """Send SSE notification to all members of a room.
+
+    ``provisional_id`` links an asynchronously delivered message to the
+    local echo its sender got from the 202 response.
+    """
+    event_data = {
+        "type": "new_message",
+        "room_id": room_id,
+        "event_id": event_id,
+        "sender": sender,
+        "sender_display_name": sender_display_name,
+        "body": body,
+        "msg_type": msg_type,
+    }
+    if file_url:
+        event_data["file_url"] = file_url
+        event_data["filename"] = filename
+        event_data["file_size"] = file_size
+    if provisional_id:
+        event_data["provisional_id"] = provisional_id
+
+    await _publish_to_room(room_id, event_data, db)
+
+
+async def notify_room_messages(
+    room_id: str,
+    messages: List[Dict[str, Any]],
+    db: Session,
+) -> None:
+    """Send several new messages of one room as a single SSE event.
+
+    ``messages`` are MessageOut-shaped dicts in send order.
+    """
+    if not messages:
+        return
+    event_data = {
+        "type": "new_messages",
+        "room_id": room_id,
+        "messages": messages,
+    }
+    await _publish_to_room(room_id, event_data, db)
+
+
+async def publish_notification(
+    log_entry: NotificationLog, db: Session, count: int = 1
+) -> None:
+    """Announce a routed cross-app notification to the users who can see it.
+
+    DM notifications (including fanned-out ones) go to their recipient
+    only; others to the audience of the target room (see _room_audience).
+    Entries still pending (held for an aggregation digest) are skipped;
+    the digest is announced once with ``count`` set.
+    """
+    if log_entry.status == NotificationStatus.pending:
+        return
+    event_data = {
+        "type": "notification",
+        "source_app": log_entry.source_app,
+        "event_type": log_entry.event_type,
+        "title": log_entry.title,
+        "body": log_entry.body,
+        "priority": log_entry.priority,
+        "room_id": log_entry.matrix_room_id,
+    }
+    if count > 1:
+        event_data["count"] = count
+    try:
+        if log_entry.target_type == "dm" and log_entry.target_user:
+            await broker.publish_to_user(log_entry.target_user, event_data)
+            return
+        audience = await _room_audience(log_entry.matrix_room_id, db) if log_entry.matrix_room_id else None
+        if audience is None:
+            logger.warning(
+                "SSE: No audience for notification %s (room %s) - not published",
+                log_entry.id, log_entry.matrix_room_id,
+            )
+            return
+        await broker.publish_to_users(audience, event_data)
+    except Exception as e:
+        logger.warning("SSE notification publish failed (non-fatal): %s", e)
+
+
+# room ID -> (expires at, hub user IDs allowed to see the room)
+_audiences: "OrderedDict[str, Tuple[float, FrozenSet[str]]]" = OrderedDict()
+_AUDIENCE_CACHE_SIZE = 10000
+# A failed member lookup is not retried for every event of a burst
+_AUDIENCE_RETRY_SECONDS = 5.0
+
+
+def forget_room_audience(room_id: str) -> None:
+    """Drop a room's cached audience (membership changed)."""
+    _audiences.pop(room_id, None)
+
+
+async def _room_audience(room_id: str, db: Session) -> FrozenSet[str] | None:
+    """Hub user IDs that can see a room, or None if the room is unknown.
+
+    DM rooms: both participants. The tenant's general room: the users of
+    that tenant, read from the database (the directory of this process
+    may not know users provisioned by another worker). Other rooms: their Matrix members, falling back to the
+    room's tenant when the member list is unavailable. Results are
+    cached for SSE_AUDIENCE_TTL_SECONDS; the fallback after a failed
+    member lookup only for a few seconds.
+    """
+    cached = _audiences.get(room_id)
+    now = time.monotonic()
+    if cached and now < cached[0]:
+        return cached[1]
+
+    room_mapping = (
+        db.query(RoomMapping)
+        .filter(RoomMapping.matrix_room_id == room_id)
+        .first()
+    )
+    if not room_mapping:
+        return None
+
+    ttl = SSE_AUDIENCE_TTL_SECONDS
+    if room_mapping.room_type == RoomType.dm:
+        matrix_user_ids = _dm_participants(room_mapping.display_name)
+        audience = frozenset(
+            e.hub_user_id
+            for e in user_directory.resolve_many(matrix_user_ids, db).values()
+            if not e.is_bot
+        )
+    elif room_mapping.room_type == RoomType.general and room_mapping.tenant_id is not None:
+        audience = _tenant_audience(room_mapping.tenant_id, db)
+    else:
+        audience = await _member_audience(room_id, db)
+        if audience is None:
+            ttl = min(ttl, _AUDIENCE_RETRY_SECONDS)
+            audience = (
+                _tenant_audience(room_mapping.tenant_id, db)
+                if room_mapping.tenant_id is not None
+                else frozenset()
+            )
+
+    _audiences[room_id] = (now + ttl, audience)
+    _audiences.move_to_end(room_id)
+    while len(_audiences) > _AUDIENCE_CACHE_SIZE:
+        _audiences.popitem(last=False)
+    return audience
+
+
+def _tenant_audience(tenant_id: int, db: Session) -> FrozenSet[str]:
+    return frozenset(
+        hub_user_id
+        for (hub_user_id,) in db.query(UserMapping.hub_user_id).filter(
+            UserMapping.tenant_id == tenant_id, UserMapping.is_bot == False
+        )
+    )
+
+
+async def _member_audience(room_id: str, db: Session) -> FrozenSet[str] | None:
+    """Joined (non-bot) members of a room, read with the notification bot's token."""
+    from app.services.notification_router import BotUnavailable, load_bot_token
+
+    try:
+        members = await matrix_client.get_room_members(load_bot_token(db), room_id)
+    except (BotUnavailable, MatrixClientError, httpx.HTTPError) as e:
+        logger.warning("SSE: Could not read members of room %s: %s", room_id, e)
+        return None
+    return frozenset(
+        e.hub_user_id
+        for e in user_directory.resolve_many(members, db).values()
+        if not e.is_bot
+    )
+
+
+def _dm_participants(display_name: str | None) -> List[str]:
+    """Matrix user IDs from a DM pair key ("<prefix>:@user1:server:@user2:server")."""
+    parts = (display_name or "").split(":")
+    if len(parts) < 5:
+        return []
+    return [f"{parts[1]}:{parts[2]}", f"{parts[3]}:{parts[4]}"]
+
+
+async def _publish_to_room(room_id: str, event_data: Dict[str, Any], db: Session) -> None:
+    """Deliver an SSE event to everyone who should see the room."""
+    # Find room members via RoomMapping + UserMapping
+    room_mapping = (
+        db.query(RoomMapping)
+        .filter(RoomMapping.matrix_room_id == room_id)
+        .first()
+    )
+    if not room_mapping:
+        # Unknown room - do NOT broadcast to all users (security risk)
+        # Only log for debugging; SSE notification will be skipped
+        logger.warning(
+            "SSE: Unknown room %s - skipping notification (no broadcast to prevent data leak)",
+            room_id,
+        )
+        return
+
+    # For DM rooms, extract participant user IDs from the display_name key
+    if room_mapping.room_type == "dm" and room_mapping.display_name:
+        # display_name format: "dm:@user1:server:@user2:server"
+        matrix_user_ids = _dm_participants(room_mapping.display_name)
+        if matrix_user_ids:
+            users = list(user_directory.resolve_many(matrix_user_ids, db).values())
+            logger.info(
+                "SSE: DM room %s — notifying %d users: %s",
+                room_id,
+                len(users),
+                [u.hub_user_id for u in users],
+            )
+            for user in users:
+                await broker.publish_to_user(user.hub_user_id, event_data)
+            return
+
+    # For non-DM rooms, broadcast to all (room membership tracking not available)
+    logger.info("SSE: Non-DM room %s, broadcasting to all", room_id)
+    await broker.broadcast(event_data)
@@ -0,0 +1,92 @@
+"""Time-window aggregation of repetitive notifications.
+
+The first notification for a key (source app, event type, target) is
+delivered immediately and opens a window. Notifications with the same
+key arriving while the window is open are held back; when it closes
+they are handed to the flush callback together, to be sent as one
+digest. A window that collected anything is re-opened, so a flapping
+source produces at most one message per window.
+"""
+
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Set
+
+logger = logging.getLogger("notification_aggregator")
+
+
+class NotificationAggregator:
+    """Per-key aggregation windows holding notification log IDs."""
+
+    def __init__(
+        self,
+        window_seconds: float,
+        flush: Callable[[List[int]], Awaitable[None]],
+    ):
+        self.window_seconds = window_seconds
+        self._flush = flush
+        self._held: Dict[Hashable, List[int]] = {}
+        self._timers: Dict[Hashable, asyncio.TimerHandle] = {}
+        self._tasks: Set[asyncio.Task] = set()
+        self._collapsed = 0
+        self._digests = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.window_seconds > 0
+
+    def admit(self, key: Hashable, log_id: int) -> bool:
+        """Return True to deliver now, False if held for the window's digest."""
+        if not self.enabled:
+            return True
+        held = self._held.get(key)
+        if held is None:
+            self._open(key)
+            return True
+        held.append(log_id)
+        self._collapsed += 1
+        return False
+
+    def _open(self, key: Hashable) -> None:
+        self._held[key] = []
+        loop = asyncio.get_running_loop()
+        self._timers[key] = loop.call_later(self.window_seconds, self._close, key)
+
+    def _close(self, key: Hashable) -> None:
+        self._timers.pop(key, None)
+        held = self._held.pop(key, None)
+        if not held:
+            return
+        # The burst is still going on: keep collecting for another window
+        self._open(key)
+        task = asyncio.create_task(self._run_flush(held))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run_flush(self, log_ids: List[int]) -> None:
+        self._digests += 1
+        try:
+            await self._flush(log_ids)
+        except Exception:
+            logger.exception("Failed to flush notification digest (%d held)", len(log_ids))
+
+    async def flush_all(self) -> None:
+        """Close all windows now and deliver whatever they hold (shutdown)."""
+        for handle in self._timers.values():
+            handle.cancel()
+        self._timers = {}
+        held, self._held = self._held, {}
+        for log_ids in held.values():
+            if log_ids:
+                await self._run_flush(log_ids)
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "window_seconds": self.window_seconds,
+            "open_windows": len(self._held),
+            "held": sum(len(ids) for ids in self._held.values()),
+            "collapsed": self._collapsed,
+            "digests": self._digests,
+        }
@@ -0,0 +1,156 @@
+"""Per-source rate limiting and counters for cross-app notifications.
+
+Each source_app gets a token bucket refilled at a steady rate up to a
+burst size. A request is admitted while the bucket holds at least one
+token; a batch is charged its full size and may overdraw the bucket,
+which then delays the source's next request instead of rejecting
+batches larger than the burst outright.
+"""
+
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, Optional, Tuple
+
+from app.config import (
+    NOTIFICATION_RATE_BURST,
+    NOTIFICATION_RATE_LIMITS,
+    NOTIFICATION_RATE_PER_SECOND,
+)
+
+logger = logging.getLogger("notification_limits")
+
+
+def parse_rate_limits(spec: str) -> Dict[str, Tuple[float, float]]:
+    """Parse "source=rate[:burst],..." into {source: (rate, burst)}."""
+    limits = {}
+    for part in spec.split(","):
+        source, _, value = part.partition("=")
+        if not source.strip() or not value.strip():
+            continue
+        rate, _, burst = value.partition(":")
+        try:
+            limits[source.strip()] = (float(rate), float(burst) if burst else 0.0)
+        except ValueError:
+            logger.warning("Ignoring invalid notification rate limit '%s'", part)
+    return limits
+
+
+@dataclass
+class TokenBucket:
+    rate: float
+    burst: float
+    tokens: float = 0.0
+    updated_at: float = field(default_factory=time.monotonic)
+
+    def __post_init__(self):
+        self.tokens = self.burst
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def retry_after(self, now: float) -> float:
+        """Seconds until the bucket admits again (0 if it does now)."""
+        self._refill(now)
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+@dataclass
+class SourceCounters:
+    admitted: int = 0
+    throttled: int = 0
+    sent: int = 0
+    failed: int = 0
+    latency_sum: float = 0.0
+    latency_max: float = 0.0
+
+
+class SourceLimiter:
+    """Token buckets and counters keyed by source_app."""
+
+    def __init__(
+        self,
+        default_rate: float,
+        default_burst: float,
+        overrides: Dict[str, Tuple[float, float]],
+    ):
+        self._default = (default_rate, default_burst)
+        self._overrides = overrides
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._counters: Dict[str, SourceCounters] = {}
+
+    def _bucket(self, source: str) -> Optional[TokenBucket]:
+        bucket = self._buckets.get(source)
+        if bucket is None:
+            rate, burst = self._overrides.get(source, self._default)
+            if rate <= 0:
+                return None
+            bucket = self._buckets[source] = TokenBucket(rate=rate, burst=burst or max(1.0, rate))
+        return bucket
+
+    def _count(self, source: str) -> SourceCounters:
+        counters = self._counters.get(source)
+        if counters is None:
+            counters = self._counters[source] = SourceCounters()
+        return counters
+
+    def admit(self, costs: Dict[str, int]) -> float:
+        """Charge each source its cost if all of them are within budget.
+
+        Returns 0 when admitted, otherwise the seconds to wait (Retry-After);
+        nothing is charged when any source is over its budget.
+        """
+        now = time.monotonic()
+        buckets = {source: self._bucket(source) for source in costs}
+        wait = max(
+            (bucket.retry_after(now) for bucket in buckets.values() if bucket),
+            default=0.0,
+        )
+        if wait > 0:
+            for source, cost in costs.items():
+                self._count(source).throttled += cost
+            return wait
+        for source, cost in costs.items():
+            if buckets[source]:
+                buckets[source].tokens -= cost
+            self._count(source).admitted += cost
+        return 0.0
+
+    def record_delivery(self, source: str, latency: float, sent: bool) -> None:
+        """Record the accept-to-delivery time of one routed notification."""
+        counters = self._count(source)
+        if sent:
+            counters.sent += 1
+        else:
+            counters.failed += 1
+        counters.latency_sum += latency
+        counters.latency_max = max(counters.latency_max, latency)
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        result = {}
+        for source, c in self._counters.items():
+            delivered = c.sent + c.failed
+            bucket = self._bucket(source)
+            if bucket:
+                bucket.retry_after(now)
+            result[source] = {
+                "admitted": c.admitted,
+                "throttled": c.throttled,
+                "sent": c.sent,
+                "failed": c.failed,
+                "latency_avg_seconds": round(c.latency_sum / delivered, 3) if delivered else 0.0,
+                "latency_max_seconds": round(c.latency_max, 3),
+                "tokens": round(bucket.tokens, 1) if bucket else None,
+            }
+        return result
+
+
+source_limiter = SourceLimiter(
+    NOTIFICATION_RATE_PER_SECOND,
+    NOTIFICATION_RATE_BURST,
+    parse_rate_limits(NOTIFICATION_RATE_LIMITS),
+)
@@ -0,0 +1,195 @@
+"""Outbox and worker pool for cross-app notifications.
+
+The notification log doubles as a durable outbox: a request only
+inserts a pending row and returns. Workers pick the rows up and run the
+regular routing (room lookup/creation, bot joins, Matrix send). Jobs are
+keyed by target, so notifications for one room are delivered in the
+order they were accepted while different targets proceed in parallel.
+Queued rows carry a lease in ``next_attempt_at`` (see
+queue_lease_until) that keeps the retry scheduler, and the workers of
+other processes, from queueing them a second time. On startup a process
+claims the pending rows whose lease has run out (claim_notifications);
+on shutdown it hands back the leases of rows it had not delivered yet,
+so the next process to start picks them up right away.
+"""
+
+import logging
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Set, Tuple
+
+from sqlalchemy import or_, update
+from sqlalchemy.orm import Session
+
+from app.config import NOTIFICATION_WORKERS
+from app.database import SessionLocal
+from app.models import NotificationLog, NotificationStatus
+from app.schemas.notifications import NotificationSend
+from app.services.message_events import publish_notification
+from app.services.notification_limits import source_limiter
+from app.services.notification_router import (
+    BotUnavailable,
+    claim_notifications,
+    load_bot_token,
+    mark_failed,
+    new_log_entry,
+    notification_from_log,
+    route_notifications,
+    store_results,
+    target_key,
+    warm_dm_targets,
+)
+from app.services.worker_pool import KeyedWorkerPool
+
+logger = logging.getLogger("notification_pipeline")
+
+
+def is_enabled() -> bool:
+    return _pool.running
+
+
+def enqueue_notifications(
+    notifications: List[NotificationSend], db: Session
+) -> List[NotificationLog]:
+    """Persist notifications as pending and queue them for routing.
+
+    Rows are inserted in one flush; each distinct target becomes a single
+    job, so its room is resolved once for the whole group. Existing DM
+    rooms of a fan-out are looked up in bulk up front, so the workers
+    only create the missing ones. Urgent notifications go through the
+    pool's urgent lane, ahead of queued normal traffic.
+    """
+    log_entries = [new_log_entry(n) for n in notifications]
+    db.add_all(log_entries)
+    db.flush()
+    jobs = _group_jobs(log_entries)
+    # Every column is known after the INSERT; skip the refresh round trip
+    db.expire_on_commit = False
+    db.commit()
+    warm_dm_targets(notifications, db)
+    _submit_jobs(jobs)
+    return log_entries
+
+
+def requeue_notifications(log_entries: List[NotificationLog]) -> None:
+    """Queue existing rows this process has claimed (claim_notifications)."""
+    _submit_jobs(_group_jobs(log_entries))
+
+
+def _group_jobs(log_entries: List[NotificationLog]) -> Dict[Tuple[str, bool], List[int]]:
+    """One job per (target, urgent) so each target is resolved once per job."""
+    jobs: Dict[Tuple[str, bool], List[int]] = {}
+    for log_entry in log_entries:
+        urgent = log_entry.priority == "urgent"
+        key = target_key(notification_from_log(log_entry))
+        jobs.setdefault((key, urgent), []).append(log_entry.id)
+    return jobs
+
+
+def _submit_jobs(jobs: Dict[Tuple[str, bool], List[int]]) -> None:
+    accepted_at = time.monotonic()
+    for (key, urgent), log_ids in jobs.items():
+        _pool.submit(key, (log_ids, accepted_at), urgent=urgent)
+        _queued.update(log_ids)
+
+
+def enqueue_notification(notification: NotificationSend, db: Session) -> NotificationLog:
+    """Persist a notification as pending and queue it for routing."""
+    return enqueue_notifications([notification], db)[0]
+
+
+async def _deliver(job: Tuple[List[int], float]) -> None:
+    """Route queued notifications that share one target."""
+    log_ids, accepted_at = job
+    db = SessionLocal()
+    try:
+        log_entries = (
+            db.query(NotificationLog)
+            .filter(
+                NotificationLog.id.in_(log_ids),
+                NotificationLog.status == NotificationStatus.pending,
+            )
+            .order_by(NotificationLog.id)
+            .all()
+        )
+        if not log_entries:
+            return
+        try:
+            bot_token = load_bot_token(db)
+        except BotUnavailable as e:
+            for log_entry in log_entries:
+                mark_failed(log_entry, str(e))
+            store_results(db, log_entries)
+            return
+
+        log_entries = await route_notifications(
+            notifications=[notification_from_log(e) for e in log_entries],
+            bot_token=bot_token,
+            db=db,
+            log_entries=log_entries,
+        )
+        latency = time.monotonic() - accepted_at
+        for log_entry in log_entries:
+            if log_entry.status != NotificationStatus.pending:
+                source_limiter.record_delivery(
+                    log_entry.source_app, latency, log_entry.status == NotificationStatus.sent
+                )
+            await publish_notification(log_entry, db)
+    finally:
+        _queued.difference_update(log_ids)
+        db.close()
+
+
+# IDs of rows submitted to the pool and not delivered yet
+_queued: Set[int] = set()
+_pool = KeyedWorkerPool("notifications", NOTIFICATION_WORKERS, _deliver)
+
+
+async def start() -> None:
+    """Start the workers and re-queue notifications left pending by a restart."""
+    _pool.start()
+    if not _pool.running:
+        return
+    db = SessionLocal()
+    try:
+        # Rows under a live lease belong to a worker of another process
+        pending = claim_notifications(
+            (NotificationLog.status == NotificationStatus.pending)
+            & or_(
+                NotificationLog.next_attempt_at.is_(None),
+                NotificationLog.next_attempt_at <= datetime.now(timezone.utc),
+            ),
+            db,
+        )
+        jobs = _group_jobs(pending)
+    finally:
+        db.close()
+    _submit_jobs(jobs)
+    if pending:
+        logger.info("Re-queued %d pending notification(s).", len(pending))
+
+
+async def stop() -> None:
+    await _pool.stop()
+    if not _queued:
+        return
+    # Hand the leases back so the next start doesn't wait for them to run out
+    db = SessionLocal()
+    try:
+        db.execute(
+            update(NotificationLog)
+            .where(
+                NotificationLog.id.in_(_queued),
+                NotificationLog.status == NotificationStatus.pending,
+            )
+            .values(next_attempt_at=datetime.now(timezone.utc))
+            .execution_options(synchronize_session=False)
+        )
+        db.commit()
+    finally:
+        db.close()
+    _queued.clear()
+
+
+def stats() -> Dict[str, Any]:
+    return _pool.stats()
@@ -0,0 +1,180 @@
+"""Retention for the notification log and the message outbox.
+
+Rows of finished notifications (sent or dead) older than
+NOTIFICATION_LOG_RETENTION_DAYS are removed by a background job in
+chunks of NOTIFICATION_LOG_RETENTION_BATCH_SIZE, each chunk in its own
+short transaction, so the table is never locked for long. With
+NOTIFICATION_LOG_ARCHIVE_DIR set, each chunk is appended to a daily
+JSONL file before it is deleted. Aggregated numbers stay available in
+the stats rollup.
+
+The same job removes delivered and failed message outbox rows older
+than MESSAGE_OUTBOX_RETENTION_SECONDS; pending rows are always kept.
+"""
+
+import asyncio
+import json
+import logging
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+
+from app.config import (
+    MESSAGE_OUTBOX_RETENTION_SECONDS,
+    NOTIFICATION_LOG_ARCHIVE_DIR,
+    NOTIFICATION_LOG_RETENTION_BATCH_SIZE,
+    NOTIFICATION_LOG_RETENTION_DAYS,
+    NOTIFICATION_LOG_RETENTION_INTERVAL_SECONDS,
+)
+from app.database import SessionLocal
+from app.models import MessageOutbox, NotificationLog, NotificationStatus, OutboxStatus
+from app.schemas.notifications import NotificationOut
+
+logger = logging.getLogger("notification_retention")
+
+# Pause between chunks, leaving room for other writers and the event loop
+CHUNK_PAUSE_SECONDS = 0.1
+
+_task: Optional[asyncio.Task] = None
+_stats: Dict[str, Any] = {
+    "runs": 0, "deleted": 0, "archived": 0, "outbox_deleted": 0, "last_run_at": None,
+}
+
+
+def _archive(rows: List[NotificationLog]) -> None:
+    os.makedirs(NOTIFICATION_LOG_ARCHIVE_DIR, exist_ok=True)
+    day = datetime.now(timezone.utc).strftime("%Y-%m-%d")
+    path = os.path.join(NOTIFICATION_LOG_ARCHIVE_DIR, f"notification-log-{day}.jsonl")
+    with open(path, "a", encoding="utf-8") as f:
+        for row in rows:
+            f.write(NotificationOut.model_validate(row).model_dump_json())
+            f.write("\n")
+
+
+def purge_chunk(cutoff: datetime) -> int:
+    """Archive (if configured) and delete one chunk of expired rows."""
+    db = SessionLocal()
+    try:
+        rows = (
+            db.query(NotificationLog)
+            .filter(
+                NotificationLog.created_at < cutoff,
+                NotificationLog.status.in_([NotificationStatus.sent, NotificationStatus.dead]),
+            )
+            .order_by(NotificationLog.created_at, NotificationLog.id)
+            .limit(NOTIFICATION_LOG_RETENTION_BATCH_SIZE)
+            .all()
+        )
+        if not rows:
+            return 0
+        if NOTIFICATION_LOG_ARCHIVE_DIR:
+            _archive(rows)
+            _stats["archived"] += len(rows)
+        db.query(NotificationLog).filter(
+            NotificationLog.id.in_([row.id for row in rows])
+        ).delete(synchronize_session=False)
+        db.commit()
+        return len(rows)
+    finally:
+        db.close()
+
+
+async def purge_expired() -> int:
+    """Delete all expired rows chunk by chunk. Returns the number deleted."""
+    cutoff = datetime.now(timezone.utc) - timedelta(days=NOTIFICATION_LOG_RETENTION_DAYS)
+    total = 0
+    while True:
+        deleted = purge_chunk(cutoff)
+        total += deleted
+        if deleted < NOTIFICATION_LOG_RETENTION_BATCH_SIZE:
+            break
+        await asyncio.sleep(CHUNK_PAUSE_SECONDS)
+    if total:
+        logger.info("Removed %d notification log row(s) older than %s.", total, cutoff.isoformat())
+    return total
+
+
+def purge_outbox_chunk(cutoff: datetime) -> int:
+    """Delete one chunk of finished outbox rows queued before ``cutoff``."""
+    db = SessionLocal()
+    try:
+        ids = [
+            outbox_id for (outbox_id,) in db.query(MessageOutbox.id)
+            .filter(
+                MessageOutbox.created_at < cutoff,
+                MessageOutbox.status.in_([OutboxStatus.sent, OutboxStatus.failed]),
+            )
+            .order_by(MessageOutbox.id)
+            .limit(NOTIFICATION_LOG_RETENTION_BATCH_SIZE)
+        ]
+        if not ids:
+            return 0
+        db.query(MessageOutbox).filter(MessageOutbox.id.in_(ids)).delete(synchronize_session=False)
+        db.commit()
+        return len(ids)
+    finally:
+        db.close()
+
+
+async def purge_outbox() -> int:
+    """Delete all expired outbox rows chunk by chunk. Returns the number deleted."""
+    cutoff = datetime.now(timezone.utc) - timedelta(seconds=MESSAGE_OUTBOX_RETENTION_SECONDS)
+    total = 0
+    while True:
+        deleted = purge_outbox_chunk(cutoff)
+        total += deleted
+        if deleted < NOTIFICATION_LOG_RETENTION_BATCH_SIZE:
+            break
+        await asyncio.sleep(CHUNK_PAUSE_SECONDS)
+    if total:
+        logger.info("Removed %d message outbox row(s) queued before %s.", total, cutoff.isoformat())
+    return total
+
+
+async def _run() -> None:
+    while True:
+        if NOTIFICATION_LOG_RETENTION_DAYS > 0:
+            try:
+                _stats["deleted"] += await purge_expired()
+            except Exception:
+                logger.exception("Notification log retention run failed")
+        if MESSAGE_OUTBOX_RETENTION_SECONDS > 0:
+            try:
+                _stats["outbox_deleted"] += await purge_outbox()
+            except Exception:
+                logger.exception("Message outbox retention run failed")
+        _stats["runs"] += 1
+        _stats["last_run_at"] = datetime.now(timezone.utc).isoformat()
+        await asyncio.sleep(NOTIFICATION_LOG_RETENTION_INTERVAL_SECONDS)
+
+
+def start() -> None:
+    global _task
+    if _task is not None:
+        return
+    if NOTIFICATION_LOG_RETENTION_DAYS <= 0 and MESSAGE_OUTBOX_RETENTION_SECONDS <= 0:
+        return
+    _task = asyncio.create_task(_run(), name="notification-retention")
+    logger.info(
+        "Retention started (notification log: %d days, message outbox: %d s, chunks of %d).",
+        NOTIFICATION_LOG_RETENTION_DAYS, MESSAGE_OUTBOX_RETENTION_SECONDS,
+        NOTIFICATION_LOG_RETENTION_BATCH_SIZE,
+    )
+
+
+async def stop() -> None:
+    global _task
+    if _task is None:
+        return
+    _task.cancel()
+    await asyncio.gather(_task, return_exceptions=True)
+    _task = None
+
+
+def stats() -> Dict[str, Any]:
+    return {
+        "running": _task is not None,
+        "retention_days": NOTIFICATION_LOG_RETENTION_DAYS,
+        "outbox_retention_seconds": MESSAGE_OUTBOX_RETENTION_SECONDS,
+        **_stats,
+    }
@@ -0,0 +1,138 @@
+"""Background retries for failed notifications.
+
+Failed deliveries are scheduled with exponential backoff and jitter
+(``next_attempt_at``) by the routing code. This scheduler wakes up every
+NOTIFICATION_RETRY_INTERVAL_SECONDS and re-routes at most
+NOTIFICATION_RETRY_BATCH_SIZE due rows, so recovery after a Conduit
+outage is spread out instead of replaying the whole backlog at once.
+Pending rows are picked up as well once their queue lease
+(NOTIFICATION_RETRY_STALE_SECONDS from being queued) has run out, e.g.
+rows left over from a crashed request; rows still queued or being
+delivered are left alone. Due rows are claimed with a conditional
+update (claim_notifications), so with several workers every row is
+retried by one process only. Rows that exhaust their
+``max_attempts`` end up in the ``dead`` state.
+"""
+
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Optional
+
+from sqlalchemy import and_, or_
+
+from app.config import (
+    NOTIFICATION_RETRY_BATCH_SIZE,
+    NOTIFICATION_RETRY_INTERVAL_SECONDS,
+    NOTIFICATION_RETRY_STALE_SECONDS,
+)
+from app.database import SessionLocal
+from app.models import NotificationLog, NotificationStatus
+from app.services import notification_pipeline
+from app.services.message_events import publish_notification
+from app.services.notification_router import (
+    BotUnavailable,
+    claim_notifications,
+    load_bot_token,
+    notification_from_log,
+    route_notifications,
+)
+
+logger = logging.getLogger("notification_retry")
+
+_task: Optional[asyncio.Task] = None
+_stats: Dict[str, Any] = {"runs": 0, "retried": 0, "last_run_at": None}
+
+
+async def retry_due() -> int:
+    """Re-route one batch of due notifications. Returns the number retried."""
+    if notification_pipeline.is_enabled():
+        # Don't pile retries onto a backlog the workers haven't drained yet
+        if notification_pipeline.stats()["queued"] >= NOTIFICATION_RETRY_BATCH_SIZE:
+            return 0
+
+    db = SessionLocal()
+    try:
+        now = datetime.now(timezone.utc)
+        stale_before = now - timedelta(seconds=NOTIFICATION_RETRY_STALE_SECONDS)
+        if not notification_pipeline.is_enabled():
+            try:
+                bot_token = load_bot_token(db)
+            except BotUnavailable as e:
+                logger.warning("Notification retry skipped: %s", e)
+                return 0
+        due = claim_notifications(
+            or_(
+                and_(
+                    NotificationLog.status == NotificationStatus.failed,
+                    NotificationLog.next_attempt_at <= now,
+                ),
+                # Queued rows whose lease ran out (rows from before leases: by age)
+                and_(
+                    NotificationLog.status == NotificationStatus.pending,
+                    or_(
+                        NotificationLog.next_attempt_at <= now,
+                        and_(
+                            NotificationLog.next_attempt_at.is_(None),
+                            NotificationLog.created_at < stale_before,
+                        ),
+                    ),
+                ),
+            ),
+            db,
+            limit=NOTIFICATION_RETRY_BATCH_SIZE,
+        )
+        if not due:
+            return 0
+        logger.info("Retrying %d notification(s).", len(due))
+
+        if notification_pipeline.is_enabled():
+            notification_pipeline.requeue_notifications(due)
+            return len(due)
+
+        log_entries = await route_notifications(
+            notifications=[notification_from_log(e) for e in due],
+            bot_token=bot_token,
+            db=db,
+            log_entries=due,
+        )
+        for log_entry in log_entries:
+            await publish_notification(log_entry, db)
+        return len(due)
+    finally:
+        db.close()
+
+
+async def _run() -> None:
+    while True:
+        await asyncio.sleep(NOTIFICATION_RETRY_INTERVAL_SECONDS)
+        try:
+            _stats["retried"] += await retry_due()
+        except Exception:
+            logger.exception("Notification retry run failed")
+        _stats["runs"] += 1
+        _stats["last_run_at"] = datetime.now(timezone.utc).isoformat()
+
+
+def start() -> None:
+    global _task
+    if NOTIFICATION_RETRY_INTERVAL_SECONDS <= 0 or _task is not None:
+        return
+    _task = asyncio.create_task(_run(), name="notification-retry")
+    logger.info(
+        "Notification retry scheduler started (every %ss, batch %d).",
+        NOTIFICATION_RETRY_INTERVAL_SECONDS, NOTIFICATION_RETRY_BATCH_SIZE,
+    )
+
+
+async def stop() -> None:
+    global _task
+    if _task is None:
+        return
+    _task.cancel()
+    await asyncio.gather(_task, return_exceptions=True)
+    _task = None
+
+
+def stats() -> Dict[str, Any]:
+    return {"running": _task is not None, **_stats}
@@ -1,29 +1,86 @@
 """Route cross-app notifications to Matrix rooms."""
 
+import asyncio
 import logging
+import random
+import time
+from collections import Counter, OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, List, Optional, Tuple
 
+from sqlalchemy import select, update
 from sqlalchemy.orm import Session
 
+from app.config import (
+    NOTIFICATION_AGGREGATE_WINDOW_SECONDS,
+    NOTIFICATION_BATCH_CONCURRENCY,
+    NOTIFICATION_BOT_POOL_SIZE,
+    NOTIFICATION_MAX_ATTEMPTS,
+    NOTIFICATION_RETRY_BASE_SECONDS,
+    NOTIFICATION_RETRY_MAX_DELAY_SECONDS,
+    NOTIFICATION_RETRY_STALE_SECONDS,
+    NOTIFICATION_TARGET_CACHE_SIZE,
+    ROOM_PROVISION_CONCURRENCY,
+)
+from app.database import SessionLocal
 from app.models import NotificationLog, NotificationStatus, RoomMapping, RoomType, UserMapping
+from app.schemas.messages import MessageOut
 from app.schemas.notifications import NotificationSend
+from app.schemas.rooms import EntityRoomSpec
+from app.services.bot_pool import BotCoolingDown, BotPool, pool_bot_names
+from app.services.jobs import Job
 from app.services.matrix_client import matrix_client, MatrixClientError
+from app.services.message_cache import message_cache
+from app.services.message_events import publish_notification
+from app.services.notification_aggregator import NotificationAggregator
+from app.services.notification_stats import record_outcomes
+from app.services.notification_writer import status_writer
 from app.services.room_manager import (
+    ensure_bot_in_room,
+    forget_bot_membership,
     get_or_create_entity_room,
+    get_or_create_entity_rooms,
     get_or_create_general_room,
     get_or_create_notification_dm_room,
+    get_or_create_notification_dm_rooms,
+    notification_dm_key,
     get_or_create_service_room,
+    touch_room_activity,
 )
+from app.services.user_directory import user_directory
 
 logger = logging.getLogger("notification_router")
 
+NOTIFICATION_BOT = "notification_bot"
 
-async def route_notification(
-    notification: NotificationSend,
-    bot_token: str,
-    db: Session,
-) -> NotificationLog:
-    """Route a notification to the appropriate Matrix room and log it."""
-    log_entry = NotificationLog(
+# Accounts notifications are sent from; the primary bot resolves and creates rooms
+bot_pool = BotPool(pool_bot_names(NOTIFICATION_BOT, NOTIFICATION_BOT_POOL_SIZE))
+
+
+class BotUnavailable(Exception):
+    """The notification bot is missing or its token cannot be used."""
+
+
+def load_bot_token(db: Session) -> str:
+    """Return the decrypted Matrix access token of the notification bot."""
+    bot = (
+        db.query(UserMapping)
+        .filter(UserMapping.hub_user_id == NOTIFICATION_BOT, UserMapping.is_bot == True)
+        .first()
+    )
+    if not bot or not bot.matrix_access_token_encrypted:
+        raise BotUnavailable("Notification bot not provisioned. Run startup provisioning first.")
+    try:
+        return bot.get_matrix_access_token()
+    except ValueError as e:
+        logger.error("Failed to decrypt bot token: %s", e)
+        raise BotUnavailable("Notification bot token decryption failed. Re-provision the bot.")
+
+
+def new_log_entry(notification: NotificationSend) -> NotificationLog:
+    """Build a pending log row holding everything needed to route the notification."""
+    now = datetime.now(timezone.utc)
+    return NotificationLog(
         source_app=notification.source_app,
         event_type=notification.event_type,
         title=notification.title,
@@ -31,61 +88,535 @@ async def route_notification(
         target_type=notification.target_type,
         entity_type=notification.entity_type,
         entity_id=notification.entity_id,
+        target_user=notification.target_user,
         priority=notification.priority,
         status=NotificationStatus.pending,
+        attempts=0,
+        created_at=now,
+        next_attempt_at=queue_lease_until(now),
+        max_attempts=NOTIFICATION_MAX_ATTEMPTS,
     )
-    db.add(log_entry)
-    db.flush()
 
-    try:
-        room_mapping = await _resolve_target_room(notification, bot_token, db)
-        if not room_mapping:
-            log_entry.status = NotificationStatus.failed
-            log_entry.error_message = "Could not resolve target room"
-            db.commit()
-            return log_entry
-
-        log_entry.matrix_room_id = room_mapping.matrix_room_id
-
-        # Format message
-        priority_prefix = "🔴 " if notification.priority == "urgent" else ""
-        formatted_body = (
-            f"{priority_prefix}**[{notification.source_app}]** {notification.title}"
-        )
-        if notification.body:
-            formatted_body += f"\n\n{notification.body}"
 
-        event_id = await matrix_client.send_message(
-            access_token=bot_token,
-            room_id=room_mapping.matrix_room_id,
-            body=formatted_body,
-            msg_type="m.text",
+def queue_lease_until(now: datetime) -> datetime:
+    """Until when a pending row counts as in flight (queued or being delivered).
+
+    The retry scheduler only picks pending rows up again once this lease
+    has run out, so a row is not requeued while it is still on its way.
+    """
+    return now + timedelta(seconds=NOTIFICATION_RETRY_STALE_SECONDS)
+
+
+def claim_notifications(condition, db: Session, limit: Optional[int] = None) -> List[NotificationLog]:
+    """Lease the rows matching ``condition`` for this process, oldest first.
+
+    The lease is taken with one conditional ``UPDATE ... RETURNING`` that
+    re-checks ``condition``: when several workers sweep the same due rows,
+    the first update moves ``next_attempt_at`` past ``now`` and the others
+    no longer match, so every row is claimed by exactly one process.
+    """
+    candidates = select(NotificationLog.id).where(condition).order_by(NotificationLog.id)
+    if limit is not None:
+        candidates = candidates.limit(limit)
+    claimed_ids = db.execute(
+        update(NotificationLog)
+        .where(NotificationLog.id.in_(candidates), condition)
+        .values(
+            status=NotificationStatus.pending,
+            next_attempt_at=queue_lease_until(datetime.now(timezone.utc)),
         )
+        .returning(NotificationLog.id)
+        .execution_options(synchronize_session=False)
+    ).scalars().all()
+    db.commit()
+    if not claimed_ids:
+        return []
+    return (
+        db.query(NotificationLog)
+        .filter(NotificationLog.id.in_(claimed_ids))
+        .order_by(NotificationLog.id)
+        .all()
+    )
 
-        log_entry.matrix_event_id = event_id
-        log_entry.status = NotificationStatus.sent
 
-    except MatrixClientError as e:
-        logger.error("Failed to send notification: %s", e)
-        log_entry.status = NotificationStatus.failed
-        log_entry.error_message = str(e)[:500]
-    except Exception as e:
-        logger.exception("Unexpected error routing notification")
+def notification_txn_id(log_entries: List[NotificationLog]) -> str:
+    """Matrix transaction ID of a notification (or digest) message.
+
+    Derived from the log rows, so sending the same notification again
+    (e.g. a retry after a timed-out send) is deduplicated by Matrix.
+    """
+    if len(log_entries) == 1:
+        return f"notification-{log_entries[0].id}"
+    return f"notification-digest-{log_entries[0].id}-{log_entries[-1].id}"
+
+
+def retry_delay(attempts: int) -> float:
+    """Exponential backoff with jitter (50-100% of the capped delay)."""
+    delay = min(
+        NOTIFICATION_RETRY_MAX_DELAY_SECONDS,
+        NOTIFICATION_RETRY_BASE_SECONDS * 2 ** max(0, attempts - 1),
+    )
+    return delay * random.uniform(0.5, 1.0)
+
+
+def mark_sent(log_entry: NotificationLog, event_id: str) -> None:
+    log_entry.attempts = (log_entry.attempts or 0) + 1
+    log_entry.matrix_event_id = event_id
+    log_entry.status = NotificationStatus.sent
+    log_entry.error_message = None
+    log_entry.next_attempt_at = None
+
+
+def mark_failed(log_entry: NotificationLog, error: str) -> None:
+    """Record a failed attempt: schedule a retry, or dead-letter when exhausted."""
+    log_entry.attempts = (log_entry.attempts or 0) + 1
+    log_entry.error_message = error
+    if log_entry.attempts >= (log_entry.max_attempts or NOTIFICATION_MAX_ATTEMPTS):
+        log_entry.status = NotificationStatus.dead
+        log_entry.next_attempt_at = None
+        logger.warning(
+            "Notification %s dead-lettered after %d attempts: %s",
+            log_entry.id, log_entry.attempts, error,
+        )
+    else:
         log_entry.status = NotificationStatus.failed
-        log_entry.error_message = str(e)[:500]
-        # Rollback any failed DB operations before committing the error status
-        db.rollback()
-        # Re-add the log entry after rollback
-        db.add(log_entry)
+        log_entry.next_attempt_at = datetime.now(timezone.utc) + timedelta(
+            seconds=retry_delay(log_entry.attempts)
+        )
+
+
+def mark_deferred(log_entry: NotificationLog, error: str, seconds: float) -> None:
+    """Schedule a row for later without counting an attempt (nothing was sent)."""
+    log_entry.error_message = error
+    log_entry.status = NotificationStatus.failed
+    log_entry.next_attempt_at = datetime.now(timezone.utc) + timedelta(seconds=seconds)
+
+
+def notification_from_log(log_entry: NotificationLog) -> NotificationSend:
+    """Rebuild the original request from a queued log row."""
+    return NotificationSend(
+        source_app=log_entry.source_app,
+        event_type=log_entry.event_type,
+        title=log_entry.title,
+        body=log_entry.body,
+        target_type=log_entry.target_type or "general",
+        entity_type=log_entry.entity_type,
+        entity_id=log_entry.entity_id,
+        target_user=log_entry.target_user,
+        priority=log_entry.priority or "normal",
+    )
+
+
+def target_key(notification: NotificationSend) -> str:
+    """Key identifying the target; notifications with equal keys share a room."""
+    if notification.target_type == "service_room":
+        return f"service:{notification.source_app}"
+    if notification.target_type == "entity_room" and notification.entity_type and notification.entity_id:
+        return f"entity:{notification.entity_type}:{notification.entity_id}"
+    if notification.target_type == "dm" and notification.target_user:
+        return f"dm:{notification.target_user}"
+    return "general"
+
+
+FANOUT_TARGET_TYPES = ("users", "role", "tenant")
+
+
+def expand_recipients(
+    notifications: List[NotificationSend], db: Session
+) -> List[NotificationSend]:
+    """Replace multi-recipient notifications by one DM notification per recipient.
+
+    Explicit user lists of the whole batch are checked against the
+    messenger users with one query; role and tenant targets are expanded
+    to their (non-bot) members. Unknown users are skipped.
+    """
+    listed = {
+        user
+        for n in notifications
+        if n.target_type == "users"
+        for user in (n.target_users or [])
+    }
+    known = set()
+    if listed:
+        known = {
+            hub_user_id
+            for (hub_user_id,) in db.query(UserMapping.hub_user_id).filter(
+                UserMapping.hub_user_id.in_(list(listed)), UserMapping.is_bot == False
+            )
+        }
+
+    members: Dict[Tuple[str, str | None, int | None], List[str]] = {}
+    expanded = []
+    for notification in notifications:
+        if notification.target_type not in FANOUT_TARGET_TYPES:
+            expanded.append(notification)
+            continue
+        if notification.target_type == "users":
+            recipients = [u for u in dict.fromkeys(notification.target_users or []) if u in known]
+        else:
+            group = (
+                notification.target_type,
+                notification.target_role,
+                notification.target_tenant_id,
+            )
+            if group not in members:
+                members[group] = _group_members(*group, db=db)
+            recipients = members[group]
+        if not recipients:
+            logger.warning(
+                "Notification '%s' from %s has no recipients (%s)",
+                notification.title, notification.source_app, notification.target_type,
+            )
+        for user in recipients:
+            expanded.append(notification.model_copy(update={
+                "target_type": "dm",
+                "target_user": user,
+                "target_users": None,
+                "target_role": None,
+                "target_tenant_id": None,
+            }))
+    return expanded
+
+
+def _group_members(
+    target_type: str, role: str | None, tenant_id: int | None, db: Session
+) -> List[str]:
+    query = db.query(UserMapping.hub_user_id).filter(UserMapping.is_bot == False)
+    if target_type == "role":
+        if not role:
+            return []
+        query = query.filter(UserMapping.role == role)
+    elif tenant_id is None:
+        return []
+    if tenant_id is not None:
+        query = query.filter(UserMapping.tenant_id == tenant_id)
+    return [hub_user_id for (hub_user_id,) in query.order_by(UserMapping.hub_user_id)]
+
+
+def format_notification_body(notification: NotificationSend) -> str:
+    priority_prefix = "🔴 " if notification.priority == "urgent" else ""
+    formatted_body = (
+        f"{priority_prefix}**[{notification.source_app}]** {notification.title}"
+    )
+    if notification.body:
+        formatted_body += f"\n\n{notification.body}"
+    return formatted_body
+
+
+def aggregation_key(notification: NotificationSend) -> Tuple[str, str, str]:
+    return (notification.source_app, notification.event_type, target_key(notification))
+
+
+DIGEST_MAX_LINES = 10
 
+
+def format_digest_body(notifications: List[NotificationSend]) -> str:
+    """One message summarizing the notifications held in an aggregation window."""
+    latest = notifications[-1]
+    titles = Counter(n.title for n in notifications)
+    lines = [
+        f"**[{latest.source_app}]** {len(notifications)} Meldungen ({latest.event_type})"
+    ]
+    for title, count in list(titles.items())[:DIGEST_MAX_LINES]:
+        lines.append(f"- {title} ({count}×)" if count > 1 else f"- {title}")
+    if len(titles) > DIGEST_MAX_LINES:
+        lines.append(f"- … und {len(titles) - DIGEST_MAX_LINES} weitere")
+    return "\n".join(lines)
+
+
+def reload_log_entries(entries: List[NotificationLog], db: Session) -> None:
+    """Refresh committed log rows (status, created_at) with one SELECT."""
+    ids = [entry.id for entry in entries if entry.id is not None]
+    if ids:
+        db.query(NotificationLog).filter(NotificationLog.id.in_(ids)).all()
+
+
+def store_results(
+    db: Session,
+    log_entries: List[NotificationLog],
+    rooms: Iterable[str] = (),
+    reload: bool = False,
+    new: bool = False,
+) -> None:
+    """Persist settled statuses together with room activity and the stats rollup.
+
+    ``rooms`` holds the room of every delivered message (a room once per
+    message, for its unread counter).
+
+    With the write-behind buffer running, the results are handed to it
+    and the entries detached from the session (so no later commit writes
+    them row by row); they keep their in-memory state for the response.
+    Otherwise everything is committed here, and ``reload`` refreshes the
+    entries afterwards with one query. ``new`` entries are not in the
+    database yet and are inserted by the buffer (see reserve_ids).
+    """
+    if status_writer.enabled:
+        status_writer.record(log_entries, rooms, new=new)
+        for log_entry in log_entries:
+            if log_entry in db:
+                db.expunge(log_entry)
+        return
+
+    for room_id, messages in Counter(rooms).items():
+        touch_room_activity(room_id, db, commit=False, messages=messages)
+    record_outcomes(db, log_entries)
     try:
         db.commit()
-        db.refresh(log_entry)
+        if reload:
+            reload_log_entries(log_entries, db)
     except Exception as commit_error:
         logger.error("Failed to commit notification log: %s", commit_error)
         db.rollback()
-        # Return the log entry without persistence - the notification may still have been sent
-    return log_entry
+        # Keep the log entries without persistence - notifications may still have been sent
+
+
+async def route_notification(
+    notification: NotificationSend,
+    bot_token: str,
+    db: Session,
+    log_entry: NotificationLog | None = None,
+) -> NotificationLog:
+    """Route a notification to the appropriate Matrix room and log it.
+
+    ``log_entry`` is the already persisted row when the notification was
+    queued in the outbox; otherwise a new row is created.
+    """
+    entries = await route_notifications(
+        [notification], bot_token, db, [log_entry] if log_entry is not None else None
+    )
+    return entries[0]
+
+
+async def route_notifications(
+    notifications: List[NotificationSend],
+    bot_token: str,
+    db: Session,
+    log_entries: List[NotificationLog] | None = None,
+) -> List[NotificationLog]:
+    """Route several notifications and log them.
+
+    Each distinct target is resolved to its room once. Matrix sends for
+    different targets run concurrently (bounded by
+    NOTIFICATION_BATCH_CONCURRENCY); notifications for the same target
+    keep their order. New log rows are inserted in one flush and all
+    results are written with a single commit, or handed to the
+    write-behind buffer when it is running (see store_results).
+
+    With an aggregation window configured, non-urgent notifications that
+    fall into an open window stay pending and are delivered later as
+    part of the window's digest.
+    """
+    if status_writer.enabled:
+        # Keep the entries loaded across the commits of room creation
+        db.expire_on_commit = False
+    written_behind = False
+    if log_entries is None:
+        log_entries = [new_log_entry(n) for n in notifications]
+        # Held rows are read back by the digest flush, so they can't wait for the buffer
+        ids = None if aggregator.enabled else status_writer.reserve_ids(len(log_entries), db)
+        if ids is not None:
+            # Inserted by the write-behind buffer together with their result
+            for log_entry, log_id in zip(log_entries, ids):
+                log_entry.id = log_id
+            written_behind = True
+        else:
+            db.add_all(log_entries)
+            db.flush()
+            if status_writer.enabled:
+                # The rows must exist before the write-behind buffer updates them
+                db.commit()
+    bot_pool.ensure_loaded(db)
+
+    by_target: Dict[str, List[int]] = {}
+    for index, notification in enumerate(notifications):
+        if (
+            aggregator.enabled
+            and notification.priority != "urgent"
+            and not aggregator.admit(aggregation_key(notification), log_entries[index].id)
+        ):
+            continue
+        by_target.setdefault(target_key(notification), []).append(index)
+
+    try:
+        await _resolve_dm_targets(
+            [notifications[indexes[0]] for indexes in by_target.values()], bot_token, db
+        )
+    except Exception:
+        # Fall back to resolving the DM targets one by one below
+        logger.exception("Bulk DM room resolution failed")
+        db.rollback()
+        if not written_behind:
+            db.add_all(log_entries)
+
+    rooms: Dict[str, str] = {}
+    errors: Dict[int, str] = {}
+    for key, indexes in by_target.items():
+        error = "Could not resolve target room"
+        try:
+            room_id = await _resolve_target_room_id(notifications[indexes[0]], bot_token, db)
+        except MatrixClientError as e:
+            logger.error("Failed to send notification: %s", e)
+            room_id = None
+            error = str(e)[:500]
+        except Exception as e:
+            logger.exception("Unexpected error routing notification")
+            room_id = None
+            error = str(e)[:500]
+            # Rollback any failed DB operations, then re-add the log entries
+            # (statuses are only applied below, after all rollbacks)
+            db.rollback()
+            if not written_behind:
+                db.add_all(log_entries)
+        if room_id:
+            rooms[key] = room_id
+        else:
+            for index in indexes:
+                errors[index] = error
+
+    bodies = [format_notification_body(n) for n in notifications]
+    event_ids: Dict[int, str] = {}
+    senders: Dict[int, str] = {}
+    deferred: Dict[int, BotCoolingDown] = {}
+    semaphore = asyncio.Semaphore(NOTIFICATION_BATCH_CONCURRENCY)
+
+    async def send_target(room_id: str, indexes: List[int]) -> None:
+        async with semaphore:
+            for index in indexes:
+                try:
+                    event_ids[index], senders[index] = await _send_as_bot(
+                        bot_token, room_id, bodies[index],
+                        notification_txn_id([log_entries[index]]),
+                    )
+                except BotCoolingDown as e:
+                    deferred[index] = e
+                except MatrixClientError as e:
+                    logger.error("Failed to send notification: %s", e)
+                    errors[index] = str(e)[:500]
+                except Exception as e:
+                    logger.exception("Unexpected error routing notification")
+                    errors[index] = str(e)[:500]
+
+    await asyncio.gather(*(
+        send_target(rooms[key], indexes)
+        for key, indexes in by_target.items()
+        if key in rooms
+    ))
+
+    touched = []
+    for key, indexes in by_target.items():
+        room_id = rooms.get(key)
+        for index in indexes:
+            log_entry = log_entries[index]
+            log_entry.matrix_room_id = room_id
+            if index in event_ids:
+                mark_sent(log_entry, event_ids[index])
+                touched.append(room_id)
+                _cache_notification_message(
+                    room_id, event_ids[index], bodies[index], senders[index]
+                )
+            elif index in deferred:
+                mark_deferred(log_entry, str(deferred[index]), deferred[index].seconds)
+            else:
+                mark_failed(log_entry, errors.get(index, "Could not resolve target room"))
+    store_results(db, log_entries, touched, reload=True, new=written_behind)
+    return log_entries
+
+
+async def route_digest(
+    log_entries: List[NotificationLog],
+    bot_token: str,
+    db: Session,
+) -> None:
+    """Deliver notifications held in one aggregation window as a single message."""
+    if status_writer.enabled:
+        db.expire_on_commit = False
+    notifications = [notification_from_log(entry) for entry in log_entries]
+    body = format_digest_body(notifications)
+    room_id = None
+    event_id = None
+    sender = NOTIFICATION_BOT
+    error = "Could not resolve target room"
+    cooling_down = None
+    bot_pool.ensure_loaded(db)
+    try:
+        room_id = await _resolve_target_room_id(notifications[0], bot_token, db)
+        if room_id:
+            event_id, sender = await _send_as_bot(
+                bot_token, room_id, body, notification_txn_id(log_entries)
+            )
+    except BotCoolingDown as e:
+        cooling_down = e
+    except MatrixClientError as e:
+        logger.error("Failed to send notification digest: %s", e)
+        error = str(e)[:500]
+    except Exception as e:
+        logger.exception("Unexpected error routing notification digest")
+        error = str(e)[:500]
+        db.rollback()
+
+    for log_entry in log_entries:
+        log_entry.matrix_room_id = room_id
+        if event_id:
+            mark_sent(log_entry, event_id)
+        elif cooling_down:
+            mark_deferred(log_entry, str(cooling_down), cooling_down.seconds)
+        else:
+            mark_failed(log_entry, error)
+    if event_id:
+        _cache_notification_message(room_id, event_id, body, sender)
+    store_results(db, log_entries, [room_id] if event_id else [])
+
+
+async def _flush_digest(log_ids: List[int]) -> None:
+    db = SessionLocal()
+    try:
+        log_entries = (
+            db.query(NotificationLog)
+            .filter(
+                NotificationLog.id.in_(log_ids),
+                NotificationLog.status == NotificationStatus.pending,
+            )
+            .order_by(NotificationLog.id)
+            .all()
+        )
+        if not log_entries:
+            return
+        try:
+            bot_token = load_bot_token(db)
+        except BotUnavailable as e:
+            for log_entry in log_entries:
+                mark_failed(log_entry, str(e))
+            store_results(db, log_entries)
+            return
+        await route_digest(log_entries, bot_token, db)
+        await publish_notification(log_entries[-1], db, count=len(log_entries))
+    finally:
+        db.close()
+
+
+aggregator = NotificationAggregator(NOTIFICATION_AGGREGATE_WINDOW_SECONDS, _flush_digest)
+
+
+def _cache_notification_message(
+    room_id: str, event_id: str, body: str, sender: str = NOTIFICATION_BOT
+) -> None:
+    """Add a delivered notification to the room's recent-message buffer."""
+    bot = user_directory.get_by_hub_id(sender)
+    if not bot:
+        # Unknown sender: drop the buffer instead of serving it without this message
+        message_cache.invalidate(room_id)
+        return
+    message_cache.append(
+        MessageOut(
+            event_id=event_id,
+            room_id=room_id,
+            sender=bot.matrix_user_id,
+            sender_display_name=bot.label,
+            body=body,
+            msg_type="m.text",
+            timestamp=datetime.now(timezone.utc),
+        ).model_dump()
+    )
 
 
 SERVICE_DISPLAY_NAMES = {
@@ -93,6 +624,191 @@ SERVICE_DISPLAY_NAMES = {
 }
 
 
+# target_key -> Matrix room ID, so repeat notifications skip the room lookup
+_target_rooms: "OrderedDict[str, str]" = OrderedDict()
+
+
+def forget_target_room(room_id: str) -> None:
+    """Drop cached targets pointing at a room (deleted or no longer usable)."""
+    for key in [k for k, v in _target_rooms.items() if v == room_id]:
+        del _target_rooms[key]
+
+
+async def _resolve_target_room_id(
+    notification: NotificationSend,
+    bot_token: str,
+    db: Session,
+) -> str | None:
+    """Room ID for the notification's target, served from the target cache if possible."""
+    key = target_key(notification)
+    room_id = _target_rooms.get(key)
+    if room_id:
+        _target_rooms.move_to_end(key)
+        return room_id
+
+    room_mapping = await _resolve_target_room(notification, bot_token, db)
+    if not room_mapping:
+        return None
+    # A DM to an unknown user falls back to the general room; don't pin that
+    if notification.target_type != "dm" or room_mapping.room_type == RoomType.dm:
+        _cache_target(key, room_mapping.matrix_room_id)
+    return room_mapping.matrix_room_id
+
+
+def _cache_target(key: str, room_id: str) -> None:
+    _target_rooms[key] = room_id
+    _target_rooms.move_to_end(key)
+    while len(_target_rooms) > NOTIFICATION_TARGET_CACHE_SIZE:
+        _target_rooms.popitem(last=False)
+
+
+def _notification_bot_user_id() -> str:
+    bot_entry = user_directory.get_by_hub_id(NOTIFICATION_BOT)
+    return bot_entry.matrix_user_id if bot_entry else NOTIFICATION_BOT
+
+
+def _uncached_dm_targets(notifications: Iterable[NotificationSend], db: Session) -> List[UserMapping]:
+    """User mappings (one query) of DM targets whose room is not cached yet."""
+    users = {
+        n.target_user
+        for n in notifications
+        if n.target_type == "dm" and n.target_user and target_key(n) not in _target_rooms
+    }
+    if len(users) < 2:
+        # A single target is resolved by the regular per-target path
+        return []
+    return db.query(UserMapping).filter(UserMapping.hub_user_id.in_(list(users))).all()
+
+
+def warm_dm_targets(notifications: Iterable[NotificationSend], db: Session) -> None:
+    """Cache the existing DM rooms of many DM notifications with two queries.
+
+    Used when notifications are queued; rooms that don't exist yet are
+    created by the workers.
+    """
+    mappings = _uncached_dm_targets(notifications, db)
+    if not mappings:
+        return
+    bot_user_id = _notification_bot_user_id()
+    users_by_key = {
+        notification_dm_key(bot_user_id, m.matrix_user_id): m.hub_user_id for m in mappings
+    }
+    for room_mapping in db.query(RoomMapping).filter(
+        RoomMapping.room_type == RoomType.dm,
+        RoomMapping.display_name.in_(list(users_by_key)),
+    ):
+        _cache_target(f"dm:{users_by_key[room_mapping.display_name]}", room_mapping.matrix_room_id)
+
+
+async def _resolve_dm_targets(
+    notifications: Iterable[NotificationSend], bot_token: str, db: Session
+) -> None:
+    """Resolve many DM targets at once, creating missing rooms concurrently."""
+    mappings = _uncached_dm_targets(notifications, db)
+    if not mappings:
+        return
+    rooms = await get_or_create_notification_dm_rooms(
+        bot_user_id=_notification_bot_user_id(),
+        target_user_mappings=mappings,
+        bot_token=bot_token,
+        db=db,
+        concurrency=NOTIFICATION_BATCH_CONCURRENCY,
+    )
+    for hub_user_id, room_id in rooms.items():
+        _cache_target(f"dm:{hub_user_id}", room_id)
+
+
+ENTITY_ROOMS_JOB = "entity_rooms"
+
+
+async def provision_entity_rooms(specs: List[EntityRoomSpec], job: Job) -> None:
+    """Job body: create missing entity rooms ahead of their first notification.
+
+    All requested rooms (new and existing) end up in the target cache, so
+    the first alarm for an entity skips the room lookup as well.
+    """
+    db = SessionLocal()
+    try:
+        rooms = await get_or_create_entity_rooms(
+            specs,
+            admin_token=load_bot_token(db),
+            db=db,
+            concurrency=ROOM_PROVISION_CONCURRENCY,
+            job=job,
+        )
+    finally:
+        db.close()
+    for (entity_type, entity_id), room_id in rooms.items():
+        _cache_target(f"entity:{entity_type}:{entity_id}", room_id)
+
+
+async def _send_as_bot(bot_token: str, room_id: str, body: str, txn_id: str) -> Tuple[str, str]:
+    """Send through the room's pool bot; returns (event ID, sender hub user ID).
+
+    Pool bots other than the primary one (``bot_token``) join the room on
+    first use, invited by the primary bot if the room is private. On
+    M_FORBIDDEN (bot not in room) the bot joins again and retries once.
+    Raises BotCoolingDown, before sending anything, while the room's bot
+    is paused.
+    """
+    bot = bot_pool.for_room(room_id)
+    if bot is not None:
+        bot_pool.check_ready(bot)
+    if bot is None or bot.access_token == bot_token:
+        token, sender, bot_user_id, inviter = bot_token, NOTIFICATION_BOT, None, None
+    else:
+        token, sender, bot_user_id, inviter = (
+            bot.access_token, bot.hub_user_id, bot.matrix_user_id, bot_token
+        )
+        await ensure_bot_in_room(token, room_id, bot_user_id, inviter)
+
+    started = time.monotonic()
+    try:
+        event_id = await _send_with_rejoin(token, room_id, body, txn_id, bot_user_id, inviter)
+    except Exception as e:
+        if bot:
+            bot_pool.record(bot, False, time.monotonic() - started, str(e))
+        raise
+    if bot:
+        bot_pool.record(bot, True, time.monotonic() - started)
+    return event_id, sender
+
+
+async def _send_with_rejoin(
+    token: str,
+    room_id: str,
+    body: str,
+    txn_id: str,
+    bot_user_id: str | None,
+    inviter_token: str | None,
+) -> str:
+    try:
+        return await matrix_client.send_message(
+            access_token=token,
+            room_id=room_id,
+            body=body,
+            msg_type="m.text",
+            txn_id=txn_id,
+        )
+    except MatrixClientError as e:
+        if e.errcode != "M_FORBIDDEN":
+            raise
+        forget_bot_membership(token, room_id)
+    await ensure_bot_in_room(token, room_id, bot_user_id, inviter_token)
+    try:
+        return await matrix_client.send_message(
+            access_token=token,
+            room_id=room_id,
+            body=body,
+            msg_type="m.text",
+            txn_id=txn_id,
+        )
+    except MatrixClientError:
+        # The room may be gone; look it up again next time
+        forget_target_room(room_id)
+        raise
+
+
 async def _resolve_target_room(
     notification: NotificationSend,
     bot_token: str,
@@ -127,16 +843,8 @@ async def _resolve_target_room(
             .first()
         )
         if user_mapping:
-            # Get the bot's user ID for the DM room key
-            bot_mapping = (
-                db.query(UserMapping)
-                .filter(UserMapping.hub_user_id == "notification_bot", UserMapping.is_bot == True)
-                .first()
-            )
-            bot_user_id = bot_mapping.matrix_user_id if bot_mapping else "notification_bot"
-
             return await get_or_create_notification_dm_room(
-                bot_user_id=bot_user_id,
+                bot_user_id=_notification_bot_user_id(),
                 target_user_mapping=user_mapping,
                 bot_token=bot_token,
                 db=db,
@@ -0,0 +1,129 @@
+"""Hourly rollup of notification delivery outcomes.
+
+Every time routing settles a notification (sent, a failed attempt,
+dead) the matching (hour, source_app, event_type, status) counter is
+incremented in the same transaction that stores the new status (or the
+write-behind flush carrying it), so the stats endpoint reads a small
+table instead of scanning the log.
+"""
+
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import func
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from app.models import NotificationLog, NotificationStat, NotificationStatus
+
+logger = logging.getLogger("notification_stats")
+
+_Key = Tuple[datetime, str, str, str]
+# (hour bucket, source_app, event_type, status, latency seconds)
+Outcome = Tuple[datetime, str, str, str, float]
+
+
+def hour_bucket(moment: datetime) -> datetime:
+    return moment.replace(minute=0, second=0, microsecond=0)
+
+
+def _latency(log_entry: NotificationLog, now: datetime) -> float:
+    created_at = log_entry.created_at
+    if created_at is None:
+        return 0.0
+    if created_at.tzinfo is None:
+        created_at = created_at.replace(tzinfo=timezone.utc)
+    return max(0.0, (now - created_at).total_seconds())
+
+
+def outcome_of(log_entry: NotificationLog, now: datetime) -> Optional[Outcome]:
+    """The rollup contribution of an entry's current status (None while pending)."""
+    if log_entry.status == NotificationStatus.pending:
+        return None
+    return (
+        hour_bucket(now),
+        log_entry.source_app,
+        log_entry.event_type,
+        log_entry.status.value,
+        _latency(log_entry, now),
+    )
+
+
+def record_outcomes(db: Session, log_entries: Iterable[NotificationLog]) -> None:
+    """Add the current (non-pending) status of each entry to the rollup.
+
+    Call once per delivery attempt, before the commit that stores the
+    statuses.
+    """
+    now = datetime.now(timezone.utc)
+    add_outcomes(db, [o for o in (outcome_of(e, now) for e in log_entries) if o])
+
+
+def add_outcomes(db: Session, outcomes: Iterable[Outcome]) -> None:
+    """Upsert outcomes, one statement per distinct rollup key."""
+    increments: Dict[_Key, List[float]] = {}
+    for bucket, source_app, event_type, status, latency in outcomes:
+        totals = increments.setdefault((bucket, source_app, event_type, status), [0, 0.0, 0.0])
+        totals[0] += 1
+        totals[1] += latency
+        totals[2] = max(totals[2], latency)
+    for key, (count, latency_sum, latency_max) in increments.items():
+        _upsert(db, key, int(count), latency_sum, latency_max)
+
+
+def _upsert(db: Session, key: _Key, count: int, latency_sum: float, latency_max: float) -> None:
+    """INSERT ... ON CONFLICT DO UPDATE (PostgreSQL, or SQLite in development)."""
+    bucket, source_app, event_type, status = key
+    if db.get_bind().dialect.name == "postgresql":
+        insert, greatest = postgresql.insert, func.greatest
+    else:
+        insert, greatest = sqlite.insert, func.max
+    stmt = insert(NotificationStat).values(
+        bucket=bucket,
+        source_app=source_app,
+        event_type=event_type,
+        status=status,
+        count=count,
+        latency_sum_seconds=latency_sum,
+        latency_max_seconds=latency_max,
+    )
+    db.execute(stmt.on_conflict_do_update(
+        index_elements=["bucket", "source_app", "event_type", "status"],
+        set_={
+            "count": NotificationStat.count + stmt.excluded.count,
+            "latency_sum_seconds": (
+                NotificationStat.latency_sum_seconds + stmt.excluded.latency_sum_seconds
+            ),
+            "latency_max_seconds": greatest(
+                NotificationStat.latency_max_seconds, stmt.excluded.latency_max_seconds
+            ),
+        },
+    ))
+
+
+def query_stats(
+    db: Session,
+    since: datetime,
+    until: Optional[datetime] = None,
+    source_app: Optional[str] = None,
+    event_type: Optional[str] = None,
+) -> List[NotificationStat]:
+    """Rollup rows in [since, until), oldest first."""
+    query = db.query(NotificationStat).filter(NotificationStat.bucket >= hour_bucket(since))
+    if until is not None:
+        query = query.filter(NotificationStat.bucket < until)
+    if source_app:
+        query = query.filter(NotificationStat.source_app == source_app)
+    if event_type:
+        query = query.filter(NotificationStat.event_type == event_type)
+    return query.order_by(
+        NotificationStat.bucket,
+        NotificationStat.source_app,
+        NotificationStat.event_type,
+        NotificationStat.status,
+    ).all()
+
+
+def default_since(hours: int) -> datetime:
+    return hour_bucket(datetime.now(timezone.utc) - timedelta(hours=hours - 1))
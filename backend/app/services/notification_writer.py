@@ -0,0 +1,335 @@
+"""Write-behind buffer for notification delivery results.
+
+Routing settles statuses in memory and hands them to the buffer instead
+of issuing an UPDATE and commit per request or job. A background task
+writes everything collected within NOTIFICATION_STATUS_FLUSH_INTERVAL_MS
+(or as soon as NOTIFICATION_STATUS_FLUSH_MAX_ROWS are waiting) in one
+transaction: one bulk UPDATE by primary key for the log rows, the stats
+rollup upserts and the rooms' last activity and message counters. Several
+results for the same row coalesce to the latest.
+
+Rows of notifications routed inside the request (NOTIFICATION_WORKERS=0)
+are inserted by the buffer as well, complete with their result, so the
+response does not wait for the database. Their primary keys come from
+the log's sequence, reserved in blocks of ID_BLOCK_SIZE (PostgreSQL
+only; elsewhere the request inserts its rows itself).
+
+Rows whose update is lost in a crash stay pending and are picked up
+again by the retry scheduler once their queue lease runs out; the
+resend carries the same Matrix txn_id, so it does not post a duplicate.
+The writes run in a worker thread, off the event loop. A flush that
+fails on the connection is retried; after MAX_FLUSH_ATTEMPTS only
+updates of rows that were not delivered are given up, since new rows and
+sent results have no other copy. When the database rejects a batch
+(e.g. a constraint violation), it is written again in halves so that
+one bad row does not hold back the others; a row rejected in
+MAX_FLUSH_ATTEMPTS flushes is logged with its values and dropped.
+"""
+
+import asyncio
+import logging
+from datetime import datetime, timezone
+from collections import Counter, deque
+from typing import Any, Deque, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import exc, insert, text, update
+from sqlalchemy.orm import Session
+
+from app.config import NOTIFICATION_STATUS_FLUSH_INTERVAL_MS, NOTIFICATION_STATUS_FLUSH_MAX_ROWS
+from app.database import SessionLocal
+from app.models import NotificationLog, NotificationStatus, RoomMapping
+from app.services.notification_stats import Outcome, add_outcomes, outcome_of
+
+logger = logging.getLogger("notification_writer")
+
+# Failed flushes before undelivered results, or a row the database rejects, are dropped
+MAX_FLUSH_ATTEMPTS = 3
+# Log IDs reserved per sequence round trip for rows inserted write-behind
+ID_BLOCK_SIZE = 100
+# The database is unreachable: retry the whole batch (anything else is a rejected row)
+_TRANSIENT_ERRORS = (exc.OperationalError, exc.InterfaceError, exc.TimeoutError)
+
+# (inserted by the buffer, column values) of one log row
+_Item = Tuple[bool, Dict[str, Any]]
+
+
+class NotificationWriter:
+    """Coalesces settled log rows and writes them in periodic batches."""
+
+    def __init__(self, interval_ms: int, max_rows: int):
+        self.interval = interval_ms / 1000
+        self.max_rows = max(1, max_rows)
+        self._rows: Dict[int, Dict[str, Any]] = {}
+        self._new_rows: Dict[int, Dict[str, Any]] = {}  # rows to INSERT, by reserved ID
+        self._ids: Deque[int] = deque()
+        self._outcomes: List[Outcome] = []
+        self._rooms: Counter = Counter()  # room ID -> messages delivered
+        self._failures = 0
+        self._rejections: Dict[int, int] = {}  # log ID -> flushes the database rejected the row in
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._flushes = 0
+        self._written = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self._task is not None
+
+    def reserve_ids(self, count: int, db: Session) -> Optional[List[int]]:
+        """Primary keys for new log rows that record(new=True) will insert.
+
+        Taken from the log's sequence ID_BLOCK_SIZE at a time, so most
+        requests need no round trip. None if the buffer is not running or
+        the database has no sequence (SQLite); the caller then inserts
+        the rows itself.
+        """
+        if not self.enabled or db.get_bind().dialect.name != "postgresql":
+            return None
+        missing = count - len(self._ids)
+        if missing > 0:
+            self._ids.extend(
+                log_id for (log_id,) in db.execute(
+                    text(
+                        "SELECT nextval(pg_get_serial_sequence('messenger_notification_log', 'id')) "
+                        "FROM generate_series(1, :n)"
+                    ),
+                    {"n": max(missing, ID_BLOCK_SIZE)},
+                )
+            )
+        return [self._ids.popleft() for _ in range(count)]
+
+    def record(
+        self,
+        log_entries: Iterable[NotificationLog],
+        rooms: Iterable[str] = (),
+        new: bool = False,
+    ) -> None:
+        """Buffer the current (non-pending) state of the entries.
+
+        ``rooms`` names the room of every delivered message (repeated per
+        message). With ``new`` the entries are not in the database yet
+        (IDs from reserve_ids) and are inserted whole, pending or not.
+        """
+        now = datetime.now(timezone.utc)
+        for log_entry in log_entries:
+            outcome = outcome_of(log_entry, now)
+            if outcome is not None:
+                self._outcomes.append(outcome)
+            if new:
+                self._new_rows[log_entry.id] = {
+                    column.key: getattr(log_entry, column.key)
+                    for column in NotificationLog.__table__.columns
+                }
+                continue
+            if outcome is None:
+                continue
+            row = {
+                "id": log_entry.id,
+                "status": log_entry.status,
+                "matrix_room_id": log_entry.matrix_room_id,
+                "matrix_event_id": log_entry.matrix_event_id,
+                "error_message": log_entry.error_message,
+                "attempts": log_entry.attempts,
+                "next_attempt_at": log_entry.next_attempt_at,
+            }
+            if log_entry.id in self._new_rows:
+                self._new_rows[log_entry.id].update(row)
+            else:
+                self._rows[log_entry.id] = row
+        self._rooms.update(r for r in rooms if r)
+        if len(self._rows) + len(self._new_rows) >= self.max_rows and self._wakeup is not None:
+            self._wakeup.set()
+
+    async def flush(self) -> int:
+        """Write everything buffered in one transaction. Returns the rows written.
+
+        The database work runs in a worker thread, off the event loop. If
+        the database rejects the batch itself (not a lost connection),
+        the rows are written again in halves to find the offending ones;
+        the rest goes through.
+        """
+        if not self._rows and not self._new_rows and not self._outcomes and not self._rooms:
+            return 0
+        items = [(True, row) for row in self._new_rows.values()]
+        items += [(False, row) for row in self._rows.values()]
+        outcomes, rooms = self._outcomes, self._rooms
+        self._rows, self._new_rows, self._outcomes, self._rooms = {}, {}, [], Counter()
+
+        try:
+            await asyncio.to_thread(self._write, items, outcomes, rooms)
+        except _TRANSIENT_ERRORS:
+            self._retry_later(items, outcomes, rooms)
+            raise
+        except Exception:
+            logger.exception("Notification results rejected, writing them in parts")
+            written = await self._write_isolated(items, outcomes, rooms)
+        else:
+            written = len(items)
+            self._failures = 0
+            if self._rejections:
+                for _new, row in items:
+                    self._rejections.pop(row["id"], None)
+        self._flushes += 1
+        self._written += written
+        return written
+
+    def _write(self, items: List[_Item], outcomes: List[Outcome], rooms: Counter) -> None:
+        """One transaction: the rows, the stats rollup and the room counters."""
+        db = SessionLocal()
+        try:
+            new_rows = [row for new, row in items if new]
+            rows = [row for new, row in items if not new]
+            if new_rows:
+                db.execute(insert(NotificationLog), new_rows)
+            if rows:
+                db.execute(update(NotificationLog), rows)
+            add_outcomes(db, outcomes)
+            # One UPDATE per distinct message count (nearly always just one or two)
+            by_count: Dict[int, List[str]] = {}
+            for room_id, messages in rooms.items():
+                by_count.setdefault(messages, []).append(room_id)
+            now = datetime.now(timezone.utc)
+            for messages, room_ids in by_count.items():
+                db.query(RoomMapping).filter(RoomMapping.matrix_room_id.in_(room_ids)).update(
+                    {
+                        RoomMapping.last_activity_at: now,
+                        RoomMapping.message_count: RoomMapping.message_count + messages,
+                    },
+                    synchronize_session=False,
+                )
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def _write_rows_in_halves(self, items: List[_Item]) -> Tuple[List[_Item], List[_Item]]:
+        """Write rows in ever smaller transactions until each failure is one row.
+
+        Returns the rows the database rejected and, if the connection
+        failed on the way, the rows not written yet.
+        """
+        rejected: List[_Item] = []
+        chunks = [items]
+        while chunks:
+            chunk = chunks.pop()
+            try:
+                self._write(chunk, [], Counter())
+            except _TRANSIENT_ERRORS:
+                return rejected, chunk + [item for rest in chunks for item in rest]
+            except Exception:
+                if len(chunk) == 1:
+                    rejected.extend(chunk)
+                else:
+                    middle = len(chunk) // 2
+                    chunks += [chunk[middle:], chunk[:middle]]
+        return rejected, []
+
+    async def _write_isolated(
+        self, items: List[_Item], outcomes: List[Outcome], rooms: Counter
+    ) -> int:
+        """Write a rejected batch around its bad rows. Returns the rows written."""
+        rejected, unwritten = await asyncio.to_thread(self._write_rows_in_halves, items)
+        if unwritten:
+            self._retry_later(unwritten, outcomes, rooms)
+        else:
+            self._failures = 0
+            try:
+                await asyncio.to_thread(self._write, [], outcomes, rooms)
+            except _TRANSIENT_ERRORS:
+                self._retry_later([], outcomes, rooms)
+            except Exception:
+                logger.exception(
+                    "Dropping stats and room activity of %d notification result(s)", len(outcomes)
+                )
+        settled = {row["id"] for _new, row in items} - {row["id"] for _new, row in rejected + unwritten}
+        for log_id in settled:
+            self._rejections.pop(log_id, None)
+
+        retry = []
+        for new, row in rejected:
+            self._rejections[row["id"]] = self._rejections.get(row["id"], 0) + 1
+            if self._rejections[row["id"]] < MAX_FLUSH_ATTEMPTS:
+                retry.append((new, row))
+                continue
+            # Dead letter: the log line is the only copy of a new row
+            del self._rejections[row["id"]]
+            logger.error(
+                "Dropping notification result %s rejected %d times by the database: %r",
+                row["id"], MAX_FLUSH_ATTEMPTS, row,
+            )
+        self._restore(retry, [], Counter())
+        return len(settled)
+
+    def _retry_later(self, items: List[_Item], outcomes: List[Outcome], rooms: Counter) -> None:
+        """Put back a batch that failed on the connection; give up after MAX_FLUSH_ATTEMPTS."""
+        self._failures += 1
+        if self._failures >= MAX_FLUSH_ATTEMPTS:
+            # Undelivered rows stay pending in the database and are retried;
+            # sent results and new rows would be lost (or re-sent), so keep them
+            kept = [(new, row) for new, row in items if new or row["status"] == NotificationStatus.sent]
+            dropped = len(items) - len(kept)
+            items = kept
+            outcomes = [o for o in outcomes if o[3] == NotificationStatus.sent.value]
+            if dropped:
+                logger.error(
+                    "Dropping %d undelivered notification result(s) after %d failed flushes",
+                    dropped, self._failures,
+                )
+            self._failures = 0
+        self._restore(items, outcomes, rooms)
+
+    def _restore(self, items: List[_Item], outcomes: List[Outcome], rooms: Counter) -> None:
+        """Put rows back into the buffer for the next round; newer results for a row win."""
+        for new, row in items:
+            if not new:
+                self._rows.setdefault(row["id"], row)
+                continue
+            if row["id"] in self._new_rows:
+                row.update(self._new_rows[row["id"]])
+            self._new_rows[row["id"]] = row
+        self._outcomes[:0] = outcomes
+        self._rooms.update(rooms)
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("Failed to write notification results")
+
+    def start(self) -> None:
+        if self.interval <= 0 or self._task is not None:
+            return
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run(), name="notification-writer")
+        logger.info("Notification write-behind started (every %.0f ms).", self.interval * 1000)
+
+    async def stop(self) -> None:
+        """Stop the flusher and write what is still buffered."""
+        if self._task is None:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+        try:
+            await self.flush()
+        except Exception:
+            logger.exception("Failed to write notification results on shutdown")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "buffered": len(self._rows) + len(self._new_rows),
+            "flushes": self._flushes,
+            "written": self._written,
+        }
+
+
+status_writer = NotificationWriter(NOTIFICATION_STATUS_FLUSH_INTERVAL_MS, NOTIFICATION_STATUS_FLUSH_MAX_ROWS)
@@ -1,28 +1,221 @@
 """Manage Matrix rooms: tenant spaces, entity rooms, DMs."""
 
+import asyncio
 import logging
-from typing import Optional
+from datetime import datetime, timezone
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple
 
+import httpx
+from sqlalchemy import and_, or_, tuple_
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 
 from app.config import MATRIX_SERVER_NAME
-from app.models import RoomMapping, RoomType, UserMapping
+from app.models import RoomMapping, RoomMember, RoomReadState, RoomType, UserMapping
+from app.schemas.rooms import EntityRoomSpec
+from app.services import room_reconciler
+from app.services.jobs import Job
 from app.services.matrix_client import matrix_client, MatrixClientError
+from app.services.room_membership import record_join
 
 logger = logging.getLogger("room_manager")
 
 
-async def _ensure_bot_in_room(bot_token: str, room_id: str) -> None:
+# (bot access token, room ID) pairs the bot is known to have joined
+_bot_memberships: Set[Tuple[str, str]] = set()
+
+# room_key -> creation in progress in this process (resolved when it is stored)
+_inflight: Dict[str, asyncio.Future] = {}
+
+
+async def ensure_bot_in_room(
+    bot_token: str,
+    room_id: str,
+    bot_user_id: Optional[str] = None,
+    inviter_token: Optional[str] = None,
+) -> None:
     """Ensure the bot is a member of the room so it can send messages.
 
     For public rooms, the bot can join directly.
-    For private rooms, this may fail if the bot is not invited.
+    For private rooms, this may fail if the bot is not invited; given an
+    inviter (a member of the room), the bot is invited and joins again.
+    Successful joins are remembered, so later calls skip the round trip
+    until forget_bot_membership() is called (e.g. after M_FORBIDDEN).
     """
+    if (bot_token, room_id) in _bot_memberships:
+        return
     try:
         await matrix_client.join_room(bot_token, room_id)
+        _bot_memberships.add((bot_token, room_id))
+        return
     except MatrixClientError as e:
         # Log but don't fail - the bot may already be a member
         logger.debug("Bot join attempt for room %s: %s", room_id, e)
+    if not (bot_user_id and inviter_token):
+        return
+    try:
+        await matrix_client.invite_user(inviter_token, room_id, bot_user_id)
+        await matrix_client.join_room(bot_token, room_id)
+        _bot_memberships.add((bot_token, room_id))
+    except MatrixClientError as e:
+        logger.warning("Could not invite bot %s to room %s: %s", bot_user_id, room_id, e)
+
+
+def remember_bot_membership(bot_token: str, room_id: str) -> None:
+    """Record a room the bot is in without joining (e.g. it created the room)."""
+    _bot_memberships.add((bot_token, room_id))
+
+
+def forget_bot_membership(bot_token: str, room_id: str) -> None:
+    _bot_memberships.discard((bot_token, room_id))
+
+
+def touch_room_activity(room_id: str, db: Session, commit: bool = True, messages: int = 1) -> None:
+    """Record that a room just received messages (drives room list ordering and unread counts)."""
+    db.query(RoomMapping).filter(RoomMapping.matrix_room_id == room_id).update(
+        {
+            RoomMapping.last_activity_at: datetime.now(timezone.utc),
+            RoomMapping.message_count: RoomMapping.message_count + messages,
+        },
+        synchronize_session=False,
+    )
+    if commit:
+        db.commit()
+
+
+def mark_room_read(hub_user_id: str, room_id: str, read_count: int, db: Session) -> None:
+    """Store that a user has read a room up to its ``read_count``-th message."""
+    insert = postgresql.insert if db.get_bind().dialect.name == "postgresql" else sqlite.insert
+    stmt = insert(RoomReadState).values(
+        hub_user_id=hub_user_id,
+        matrix_room_id=room_id,
+        read_count=read_count,
+        read_at=datetime.now(timezone.utc),
+    )
+    db.execute(stmt.on_conflict_do_update(
+        index_elements=["hub_user_id", "matrix_room_id"],
+        set_={"read_count": stmt.excluded.read_count, "read_at": stmt.excluded.read_at},
+    ))
+    db.commit()
+
+
+def general_room_key(tenant_id: int) -> str:
+    return f"general:{tenant_id}"
+
+
+def service_room_key(service_name: str) -> str:
+    return f"service:{service_name}"
+
+
+def entity_room_key(entity_type: str, entity_id: int) -> str:
+    return f"entity:{entity_type}:{entity_id}"
+
+
+def dm_room_key(matrix_user_id_1: str, matrix_user_id_2: str) -> str:
+    """Order-independent key of a DM between two users."""
+    return "dm:" + ":".join(sorted((matrix_user_id_1, matrix_user_id_2)))
+
+
+def _find_room(room_key: str, db: Session, *legacy_filter) -> Optional[RoomMapping]:
+    """The room stored under ``room_key``.
+
+    Rooms migration 009 left without a key (it could not derive one, or a
+    duplicate from an earlier race) are matched by ``legacy_filter``, the
+    oldest first; a keyed room always wins over them.
+    """
+    mapping = db.query(RoomMapping).filter(RoomMapping.room_key == room_key).first()
+    if mapping is None:
+        mapping = (
+            db.query(RoomMapping)
+            .filter(RoomMapping.room_key.is_(None), *legacy_filter)
+            .order_by(RoomMapping.id)
+            .first()
+        )
+    return mapping
+
+
+async def discard_room(room_id: str, creator_token: str, db: Session) -> None:
+    """Abandon a Matrix room that lost the race for its room_key.
+
+    The creator kicks everyone else (joined or still invited) and then
+    leaves and forgets the room, so no one keeps a stray duplicate in
+    their room list; memberships recorded for it are deleted. Failures
+    are only logged: the room is unused either way.
+    """
+    try:
+        creator = await matrix_client.whoami(creator_token)
+        memberships = await matrix_client.get_room_memberships(creator_token, room_id)
+        for user_id, membership in memberships.items():
+            if user_id != creator and membership in ("join", "invite"):
+                await matrix_client.kick_user(
+                    creator_token, room_id, user_id, reason="Duplicate room"
+                )
+        await matrix_client.leave_room(creator_token, room_id)
+    except (MatrixClientError, httpx.HTTPError) as e:
+        logger.warning("Could not clean up duplicate room %s: %s", room_id, e)
+    forget_bot_membership(creator_token, room_id)
+    db.query(RoomMember).filter(RoomMember.matrix_room_id == room_id).delete(
+        synchronize_session=False
+    )
+    db.commit()
+
+
+async def _get_or_create(
+    room_key: str,
+    lookup: Callable[[], Optional[RoomMapping]],
+    create: Callable[[], Awaitable[RoomMapping]],
+    creator_token: str,
+    db: Session,
+) -> Tuple[RoomMapping, bool]:
+    """Single-flight get-or-create of the room identified by ``room_key``.
+
+    Concurrent callers in this process wait for the one creating the room
+    and then read it. Across processes the unique ``room_key`` column
+    decides: the loser of the insert discards its Matrix room (created
+    with ``creator_token``, see discard_room) and uses the stored one.
+    Returns (mapping, created).
+    """
+    while True:
+        mapping = lookup()
+        if mapping:
+            return mapping, False
+        flight = _inflight.get(room_key)
+        if flight is None:
+            break
+        await asyncio.shield(flight)
+
+    flight = asyncio.get_running_loop().create_future()
+    _inflight[room_key] = flight
+    try:
+        mapping = await create()
+        mapping.room_key = room_key
+        db.add(mapping)
+        try:
+            db.commit()
+        except IntegrityError:
+            db.rollback()
+            existing = lookup()
+            if existing is None:
+                raise
+            logger.warning(
+                "Room %s was created concurrently; discarding duplicate %s",
+                room_key, mapping.matrix_room_id,
+            )
+            flight.set_result(None)
+            await discard_room(mapping.matrix_room_id, creator_token, db)
+            return existing, False
+        db.refresh(mapping)
+        flight.set_result(None)
+        return mapping, True
+    except BaseException as e:
+        if not flight.done():
+            flight.set_exception(e if isinstance(e, Exception) else RuntimeError(f"Creation of {room_key} aborted"))
+            # Waiters re-raise it; don't warn when there are none
+            flight.exception()
+        raise
+    finally:
+        _inflight.pop(room_key, None)
 
 
 async def get_or_create_general_room(
@@ -31,35 +224,32 @@ async def get_or_create_general_room(
     db: Session,
 ) -> RoomMapping:
     """Get or create the tenant's general chat room."""
-    mapping = (
-        db.query(RoomMapping)
-        .filter(
+    def lookup() -> Optional[RoomMapping]:
+        return _find_room(
+            general_room_key(tenant_id), db,
             RoomMapping.tenant_id == tenant_id,
             RoomMapping.room_type == RoomType.general,
         )
-        .first()
-    )
-    if mapping:
-        # Ensure bot can send to this room (may have been created before bot provisioning)
-        await _ensure_bot_in_room(admin_token, mapping.matrix_room_id)
-        return mapping
 
-    room_id = await matrix_client.create_room(
-        access_token=admin_token,
-        name="Allgemein",
-        topic="Allgemeiner Chat-Kanal",
-        preset="public_chat",
-    )
+    async def create() -> RoomMapping:
+        room_id = await matrix_client.create_room(
+            access_token=admin_token,
+            name="Allgemein",
+            topic="Allgemeiner Chat-Kanal",
+            preset="public_chat",
+        )
+        remember_bot_membership(admin_token, room_id)
+        return RoomMapping(
+            matrix_room_id=room_id,
+            room_type=RoomType.general,
+            display_name="Allgemein",
+            tenant_id=tenant_id,
+        )
 
-    mapping = RoomMapping(
-        matrix_room_id=room_id,
-        room_type=RoomType.general,
-        display_name="Allgemein",
-        tenant_id=tenant_id,
-    )
-    db.add(mapping)
-    db.commit()
-    db.refresh(mapping)
+    mapping, created = await _get_or_create(general_room_key(tenant_id), lookup, create, admin_token, db)
+    if not created:
+        # Ensure bot can send to this room (may have been created before bot provisioning)
+        await ensure_bot_in_room(admin_token, mapping.matrix_room_id)
     return mapping
 
 
@@ -71,83 +261,50 @@ async def get_or_create_service_room(
     tenant_id: Optional[int] = None,
 ) -> RoomMapping:
     """Get or create a dedicated room for a satellite service (e.g., machine-monitoring)."""
-    mapping = (
-        db.query(RoomMapping)
-        .filter(
+    def lookup() -> Optional[RoomMapping]:
+        return _find_room(
+            service_room_key(service_name), db,
             RoomMapping.room_type == RoomType.service,
             RoomMapping.entity_type == service_name,
         )
-        .first()
-    )
-    if mapping:
-        # Ensure bot can send to this room (may have been created before bot provisioning)
-        await _ensure_bot_in_room(admin_token, mapping.matrix_room_id)
-        return mapping
 
-    # Get all non-bot users to invite them
-    all_users = db.query(UserMapping).filter(UserMapping.is_bot == False).all()
-    invite_user_ids = [u.matrix_user_id for u in all_users if u.matrix_user_id]
+    async def create() -> RoomMapping:
+        room_id = await matrix_client.create_room(
+            access_token=admin_token,
+            name=display_name,
+            topic=f"Benachrichtigungen von {display_name}",
+            preset="public_chat",
+        )
+        remember_bot_membership(admin_token, room_id)
+        return RoomMapping(
+            matrix_room_id=room_id,
+            room_type=RoomType.service,
+            display_name=display_name,
+            tenant_id=tenant_id,
+            entity_type=service_name,  # Use entity_type to store service name
+        )
 
-    room_id = await matrix_client.create_room(
-        access_token=admin_token,
-        name=display_name,
-        topic=f"Benachrichtigungen von {display_name}",
-        preset="public_chat",
-        invite=invite_user_ids if invite_user_ids else None,
-    )
+    mapping, created = await _get_or_create(service_room_key(service_name), lookup, create, admin_token, db)
+    if created:
+        # Users join in the background so the room appears in their list
+        room_reconciler.reconcile_room(mapping.matrix_room_id)
+    else:
+        # Ensure bot can send to this room (may have been created before bot provisioning)
+        await ensure_bot_in_room(admin_token, mapping.matrix_room_id)
+    return mapping
 
-    # Auto-join all invited users so the room appears in their list
-    for user in all_users:
-        if user.matrix_access_token_encrypted:
-            try:
-                await matrix_client.join_room(
-                    user.get_matrix_access_token(), room_id
-                )
-            except MatrixClientError:
-                logger.debug(
-                    "User %s could not auto-join service room %s",
-                    user.matrix_user_id, room_id,
-                )
 
-    mapping = RoomMapping(
-        matrix_room_id=room_id,
-        room_type=RoomType.service,
-        display_name=display_name,
-        tenant_id=tenant_id,
-        entity_type=service_name,  # Use entity_type to store service name
-    )
-    db.add(mapping)
-    db.commit()
-    db.refresh(mapping)
-    return mapping
+def notification_dm_key(bot_user_id: str, matrix_user_id: str) -> str:
+    """RoomMapping display_name identifying a bot-user notification DM."""
+    return f"notification_dm:{bot_user_id}:{matrix_user_id}"
 
 
-async def get_or_create_notification_dm_room(
+async def _create_notification_dm_room(
     bot_user_id: str,
     target_user_mapping: UserMapping,
     bot_token: str,
-    db: Session,
 ) -> RoomMapping:
-    """Get or create a DM room between the notification bot and a target user.
-
-    This is used for sending direct notification messages to specific users.
-    """
-    # Create a unique key for this bot-user pair
-    pair_key = f"notification_dm:{bot_user_id}:{target_user_mapping.matrix_user_id}"
-
-    mapping = (
-        db.query(RoomMapping)
-        .filter(
-            RoomMapping.room_type == RoomType.dm,
-            RoomMapping.display_name == pair_key,
-        )
-        .first()
-    )
-    if mapping:
-        await _ensure_bot_in_room(bot_token, mapping.matrix_room_id)
-        return mapping
-
-    # Create new DM room with the target user invited
+    """Create the Matrix DM room; the returned mapping is not added to the session yet."""
     room_id = await matrix_client.create_room(
         access_token=bot_token,
         name=f"Benachrichtigungen fuer {target_user_mapping.display_name or target_user_mapping.hub_user_id}",
@@ -155,6 +312,7 @@ async def get_or_create_notification_dm_room(
         is_direct=True,
         preset="private_chat",
     )
+    remember_bot_membership(bot_token, room_id)
 
     # Auto-join the target user so they see the room
     if target_user_mapping.matrix_access_token_encrypted:
@@ -162,6 +320,7 @@ async def get_or_create_notification_dm_room(
             await matrix_client.join_room(
                 target_user_mapping.get_matrix_access_token(), room_id
             )
+            record_join(target_user_mapping.matrix_user_id, room_id)
         except MatrixClientError:
             logger.warning(
                 "User %s could not auto-join notification DM room %s",
@@ -169,18 +328,122 @@ async def get_or_create_notification_dm_room(
                 room_id,
             )
 
-    mapping = RoomMapping(
+    return RoomMapping(
         matrix_room_id=room_id,
         room_type=RoomType.dm,
-        display_name=pair_key,
+        display_name=notification_dm_key(bot_user_id, target_user_mapping.matrix_user_id),
         tenant_id=target_user_mapping.tenant_id,
     )
-    db.add(mapping)
-    db.commit()
-    db.refresh(mapping)
+
+
+async def get_or_create_notification_dm_room(
+    bot_user_id: str,
+    target_user_mapping: UserMapping,
+    bot_token: str,
+    db: Session,
+) -> RoomMapping:
+    """Get or create a DM room between the notification bot and a target user.
+
+    This is used for sending direct notification messages to specific users.
+    """
+    pair_key = notification_dm_key(bot_user_id, target_user_mapping.matrix_user_id)
+
+    def lookup() -> Optional[RoomMapping]:
+        return _find_room(
+            pair_key, db,
+            RoomMapping.room_type == RoomType.dm,
+            RoomMapping.display_name == pair_key,
+        )
+
+    async def create() -> RoomMapping:
+        return await _create_notification_dm_room(bot_user_id, target_user_mapping, bot_token)
+
+    mapping, created = await _get_or_create(pair_key, lookup, create, bot_token, db)
+    if not created:
+        await ensure_bot_in_room(bot_token, mapping.matrix_room_id)
     return mapping
 
 
+async def get_or_create_notification_dm_rooms(
+    bot_user_id: str,
+    target_user_mappings: List[UserMapping],
+    bot_token: str,
+    db: Session,
+    concurrency: int = 8,
+) -> Dict[str, str]:
+    """Bulk variant of get_or_create_notification_dm_room.
+
+    Returns Matrix room IDs keyed by hub_user_id. Existing rooms are found
+    with one query; missing ones are created concurrently (at most
+    ``concurrency`` at a time) and stored with one commit; rooms another
+    request is creating at the same moment are awaited instead. Users
+    whose room could not be created are left out.
+    """
+    by_key = {
+        notification_dm_key(bot_user_id, m.matrix_user_id): m for m in target_user_mappings
+    }
+    if not by_key:
+        return {}
+    rooms = {}
+    for room_key, display_name, room_id in (
+        db.query(RoomMapping.room_key, RoomMapping.display_name, RoomMapping.matrix_room_id)
+        .filter(or_(
+            RoomMapping.room_key.in_(list(by_key)),
+            and_(
+                RoomMapping.room_key.is_(None),
+                RoomMapping.room_type == RoomType.dm,
+                RoomMapping.display_name.in_(list(by_key)),
+            ),
+        ))
+        .order_by(RoomMapping.id)
+        .all()
+    ):
+        # Same precedence as _find_room: the keyed room, else the oldest unkeyed one
+        hub_user_id = by_key[room_key or display_name].hub_user_id
+        if room_key or hub_user_id not in rooms:
+            rooms[hub_user_id] = room_id
+
+    missing = [key for key, m in by_key.items() if m.hub_user_id not in rooms]
+    # Rooms another request of this process is creating are awaited, not created twice
+    pending = [_inflight[key] for key in missing if key in _inflight]
+    own = [key for key in missing if key not in _inflight]
+    loop = asyncio.get_running_loop()
+    for key in own:
+        _inflight[key] = loop.create_future()
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def create(target: UserMapping) -> Optional[RoomMapping]:
+        async with semaphore:
+            try:
+                return await _create_notification_dm_room(bot_user_id, target, bot_token)
+            except MatrixClientError as e:
+                logger.error("Failed to create notification DM for %s: %s", target.hub_user_id, e)
+                return None
+
+    try:
+        created = await asyncio.gather(*(create(by_key[key]) for key in own))
+        new_rooms = []
+        for key, room in zip(own, created):
+            if room is not None:
+                room.room_key = key
+                new_rooms.append(room)
+        await _discard_unstored(new_rooms, _store_rooms(new_rooms, db), bot_token, db)
+    finally:
+        for key in own:
+            _inflight.pop(key).set_result(None)
+    if pending:
+        await asyncio.gather(*(asyncio.shield(f) for f in pending), return_exceptions=True)
+
+    if missing:
+        for room_key, room_id in (
+            db.query(RoomMapping.room_key, RoomMapping.matrix_room_id)
+            .filter(RoomMapping.room_key.in_(missing))
+            .all()
+        ):
+            rooms[by_key[room_key].hub_user_id] = room_id
+    return rooms
+
+
 async def get_or_create_entity_room(
     entity_type: str,
     entity_id: int,
@@ -190,28 +453,126 @@ async def get_or_create_entity_room(
     tenant_id: Optional[int] = None,
 ) -> RoomMapping:
     """Get or create a room for a specific entity (machine, project, etc.)."""
-    mapping = (
-        db.query(RoomMapping)
-        .filter(
+    def lookup() -> Optional[RoomMapping]:
+        return _find_room(
+            entity_room_key(entity_type, entity_id), db,
             RoomMapping.entity_type == entity_type,
             RoomMapping.entity_id == entity_id,
             RoomMapping.room_type == RoomType.entity,
         )
-        .first()
+
+    async def create() -> RoomMapping:
+        return await _create_entity_room(entity_type, entity_id, display_name, admin_token, tenant_id)
+
+    mapping, created = await _get_or_create(
+        entity_room_key(entity_type, entity_id), lookup, create, admin_token, db
     )
-    if mapping:
+    if not created:
         # Ensure bot can send to this room (may have been created before bot provisioning)
-        await _ensure_bot_in_room(admin_token, mapping.matrix_room_id)
-        return mapping
+        await ensure_bot_in_room(admin_token, mapping.matrix_room_id)
+    return mapping
+
 
+async def get_or_create_entity_rooms(
+    specs: List[EntityRoomSpec],
+    admin_token: str,
+    db: Session,
+    concurrency: int = 8,
+    chunk_size: int = 100,
+    job: Optional[Job] = None,
+) -> Dict[Tuple[str, int], str]:
+    """Bulk variant of get_or_create_entity_room, e.g. to pre-provision a plant.
+
+    Returns Matrix room IDs keyed by (entity_type, entity_id). Existing
+    rooms are found with one query per chunk; missing ones are created
+    concurrently (at most ``concurrency`` at a time) and inserted with one
+    commit per chunk of ``chunk_size``. Rooms another request is creating
+    at the same moment are awaited instead. Progress goes to ``job``.
+    """
+    by_pair = {(spec.entity_type, spec.entity_id): spec for spec in specs}
+    pairs = list(by_pair)
+    if job:
+        job.total = len(pairs)
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    rooms: Dict[Tuple[str, int], str] = {}
+    pending: List[asyncio.Future] = []
+
+    async def create(spec: EntityRoomSpec) -> Optional[RoomMapping]:
+        async with semaphore:
+            try:
+                return await _create_entity_room(
+                    spec.entity_type,
+                    spec.entity_id,
+                    spec.display_name or f"{spec.entity_type} #{spec.entity_id}",
+                    admin_token,
+                    spec.tenant_id,
+                )
+            except (MatrixClientError, httpx.HTTPError) as e:
+                logger.error(
+                    "Failed to create room for %s #%s: %s", spec.entity_type, spec.entity_id, e
+                )
+                return None
+
+    for start in range(0, len(pairs), chunk_size):
+        chunk = pairs[start:start + chunk_size]
+        rooms.update(_entity_room_ids(chunk, db))
+        missing = [pair for pair in chunk if pair not in rooms]
+        if job:
+            job.skipped += len(chunk) - len(missing)
+        pending += [_inflight[entity_room_key(*p)] for p in missing if entity_room_key(*p) in _inflight]
+        own = [p for p in missing if entity_room_key(*p) not in _inflight]
+        loop = asyncio.get_running_loop()
+        for pair in own:
+            _inflight[entity_room_key(*pair)] = loop.create_future()
+        try:
+            created = await asyncio.gather(*(create(by_pair[pair]) for pair in own))
+            new_rooms = {}
+            for pair, room in zip(own, created):
+                if room is not None:
+                    room.room_key = entity_room_key(*pair)
+                    new_rooms[pair] = (room.matrix_room_id, room)
+            candidates = [r for _, r in new_rooms.values()]
+            stored_rooms = _store_rooms(candidates, db)
+            await _discard_unstored(candidates, stored_rooms, admin_token, db)
+            stored = {id(room) for room in stored_rooms}
+            for pair, (room_id, room) in new_rooms.items():
+                if id(room) in stored:
+                    rooms[pair] = room_id
+            if job:
+                job.done += len(stored)
+                job.failed += len(own) - len(new_rooms)
+        finally:
+            for pair in own:
+                _inflight.pop(entity_room_key(*pair)).set_result(None)
+
+    if pending:
+        await asyncio.gather(*(asyncio.shield(f) for f in pending), return_exceptions=True)
+    # Rooms stored by someone else (concurrent request or process)
+    unresolved = [pair for pair in pairs if pair not in rooms]
+    if unresolved:
+        rooms.update(_entity_room_ids(unresolved, db))
+    if job:
+        job.done += sum(1 for pair in unresolved if pair in rooms)
+        job.failed = job.total - job.skipped - job.done
+    return rooms
+
+
+async def _create_entity_room(
+    entity_type: str,
+    entity_id: int,
+    display_name: str,
+    admin_token: str,
+    tenant_id: Optional[int],
+) -> RoomMapping:
+    """Create the Matrix room; the returned mapping is not added to the session yet."""
     room_id = await matrix_client.create_room(
         access_token=admin_token,
         name=display_name,
         topic=f"{entity_type} #{entity_id}",
         preset="private_chat",
     )
-
-    mapping = RoomMapping(
+    remember_bot_membership(admin_token, room_id)
+    return RoomMapping(
         matrix_room_id=room_id,
         room_type=RoomType.entity,
         display_name=display_name,
@@ -219,10 +580,72 @@ async def get_or_create_entity_room(
         entity_type=entity_type,
         entity_id=entity_id,
     )
-    db.add(mapping)
-    db.commit()
-    db.refresh(mapping)
-    return mapping
+
+
+def _entity_room_ids(pairs: List[Tuple[str, int]], db: Session) -> Dict[Tuple[str, int], str]:
+    if not pairs:
+        return {}
+    rooms: Dict[Tuple[str, int], str] = {}
+    for room_key, entity_type, entity_id, room_id in (
+        db.query(
+            RoomMapping.room_key,
+            RoomMapping.entity_type,
+            RoomMapping.entity_id,
+            RoomMapping.matrix_room_id,
+        )
+        .filter(
+            RoomMapping.room_type == RoomType.entity,
+            or_(
+                RoomMapping.room_key.in_([entity_room_key(*pair) for pair in pairs]),
+                and_(
+                    RoomMapping.room_key.is_(None),
+                    tuple_(RoomMapping.entity_type, RoomMapping.entity_id).in_(pairs),
+                ),
+            ),
+        )
+        .order_by(RoomMapping.id)
+        .all()
+    ):
+        # Same precedence as _find_room: the keyed room, else the oldest unkeyed one
+        pair = (entity_type, entity_id)
+        if room_key or pair not in rooms:
+            rooms[pair] = room_id
+    return rooms
+
+
+async def _discard_unstored(
+    new_rooms: List[RoomMapping], stored: List[RoomMapping], creator_token: str, db: Session
+) -> None:
+    """Discard the created rooms another process stored first."""
+    stored_ids = {id(room) for room in stored}
+    for room in new_rooms:
+        if id(room) not in stored_ids:
+            await discard_room(room.matrix_room_id, creator_token, db)
+
+
+def _store_rooms(new_rooms: List[RoomMapping], db: Session) -> List[RoomMapping]:
+    """Insert new mappings with one commit; returns those that were stored.
+
+    If another process stored some of the same rooms first (unique
+    room_key), the rest are inserted one by one.
+    """
+    if not new_rooms:
+        return []
+    db.add_all(new_rooms)
+    try:
+        db.commit()
+        return new_rooms
+    except IntegrityError:
+        db.rollback()
+    stored = []
+    for room in new_rooms:
+        db.add(room)
+        try:
+            db.commit()
+            stored.append(room)
+        except IntegrityError:
+            db.rollback()
+    return stored
 
 
 async def get_or_create_dm_room(
@@ -235,68 +658,72 @@ async def get_or_create_dm_room(
     # Check both directions
     pair_key_1 = f"dm:{user1_mapping.matrix_user_id}:{user2_mapping.matrix_user_id}"
     pair_key_2 = f"dm:{user2_mapping.matrix_user_id}:{user1_mapping.matrix_user_id}"
+    room_key = dm_room_key(user1_mapping.matrix_user_id, user2_mapping.matrix_user_id)
 
-    mapping = (
-        db.query(RoomMapping)
-        .filter(
+    def lookup() -> Optional[RoomMapping]:
+        return _find_room(
+            room_key, db,
             RoomMapping.room_type == RoomType.dm,
             RoomMapping.display_name.in_([pair_key_1, pair_key_2]),
         )
-        .first()
-    )
-    if mapping:
-        # Ensure both users are joined (they may have been only invited)
-        room_id = mapping.matrix_room_id
-        for user_mapping, token in [
-            (user1_mapping, user1_token),
-            (user2_mapping, user2_mapping.get_matrix_access_token() if user2_mapping.matrix_access_token_encrypted else None),
-        ]:
-            if not token:
-                continue
+
+    async def create() -> RoomMapping:
+        room_id = await matrix_client.create_room(
+            access_token=user1_token,
+            name=f"DM: {user1_mapping.display_name} & {user2_mapping.display_name}",
+            invite=[user2_mapping.matrix_user_id],
+            is_direct=True,
+        )
+        record_join(user1_mapping.matrix_user_id, room_id, db)
+
+        # Auto-join recipient so the room appears in their joined_rooms
+        if user2_mapping.matrix_access_token_encrypted:
             try:
-                await matrix_client.join_room(token, room_id)
+                await matrix_client.join_room(
+                    user2_mapping.get_matrix_access_token(), room_id
+                )
+                record_join(user2_mapping.matrix_user_id, room_id, db)
             except MatrixClientError:
-                # Try invite first, then join
-                try:
-                    await matrix_client.invite_user(user1_token, room_id, user_mapping.matrix_user_id)
-                    await matrix_client.join_room(token, room_id)
-                except MatrixClientError:
-                    logger.warning(
-                        "User %s could not join existing DM room %s",
-                        user_mapping.matrix_user_id,
-                        room_id,
-                    )
-        return mapping
+                logger.warning(
+                    "User %s could not auto-join DM room %s",
+                    user2_mapping.matrix_user_id,
+                    room_id,
+                )
 
-    room_id = await matrix_client.create_room(
-        access_token=user1_token,
-        name=f"DM: {user1_mapping.display_name} & {user2_mapping.display_name}",
-        invite=[user2_mapping.matrix_user_id],
-        is_direct=True,
-    )
+        return RoomMapping(
+            matrix_room_id=room_id,
+            room_type=RoomType.dm,
+            display_name=pair_key_1,
+            tenant_id=user1_mapping.tenant_id,
+        )
+
+    mapping, created = await _get_or_create(room_key, lookup, create, user1_token, db)
+    if created:
+        return mapping
 
-    # Auto-join recipient so the room appears in their joined_rooms
-    if user2_mapping.matrix_access_token_encrypted:
+    # Ensure both users are joined (they may have been only invited)
+    room_id = mapping.matrix_room_id
+    for user_mapping, token in [
+        (user1_mapping, user1_token),
+        (user2_mapping, user2_mapping.get_matrix_access_token() if user2_mapping.matrix_access_token_encrypted else None),
+    ]:
+        if not token:
+            continue
         try:
-            await matrix_client.join_room(
-                user2_mapping.get_matrix_access_token(), room_id
-            )
+            await matrix_client.join_room(token, room_id)
         except MatrixClientError:
-            logger.warning(
-                "User %s could not auto-join DM room %s",
-                user2_mapping.matrix_user_id,
-                room_id,
-            )
-
-    mapping = RoomMapping(
-        matrix_room_id=room_id,
-        room_type=RoomType.dm,
-        display_name=pair_key_1,
-        tenant_id=user1_mapping.tenant_id,
-    )
-    db.add(mapping)
-    db.commit()
-    db.refresh(mapping)
+            # Try invite first, then join
+            try:
+                await matrix_client.invite_user(user1_token, room_id, user_mapping.matrix_user_id)
+                await matrix_client.join_room(token, room_id)
+            except MatrixClientError:
+                logger.warning(
+                    "User %s could not join existing DM room %s",
+                    user_mapping.matrix_user_id,
+                    room_id,
+                )
+                continue
+        record_join(user_mapping.matrix_user_id, room_id, db)
     return mapping
 
 
@@ -330,6 +757,7 @@ async def create_custom_room(
                     await matrix_client.join_room(
                         user_mapping.get_matrix_access_token(), room_id
                     )
+                    record_join(matrix_user_id, room_id, db)
                 except MatrixClientError:
                     logger.warning(
                         "User %s could not auto-join room %s",
@@ -350,26 +778,24 @@ async def create_custom_room(
 
 async def ensure_user_in_room(
     user_mapping: UserMapping,
-    room_mapping: RoomMapping,
-    admin_token: str,
-) -> None:
-    """Ensure a user is in a room (invite + auto-join)."""
+    room_id: str,
+    inviter_token: str,
+) -> bool:
+    """Ensure a user is in a room (invite + auto-join). Returns whether the join succeeded.
+
+    A refused invite raises MatrixClientError without attempting the join.
+    """
+    await matrix_client.invite_user(inviter_token, room_id, user_mapping.matrix_user_id)
+    if not user_mapping.matrix_access_token_encrypted:
+        return False
     try:
-        await matrix_client.invite_user(
-            admin_token, room_mapping.matrix_room_id, user_mapping.matrix_user_id
-        )
+        await matrix_client.join_room(user_mapping.get_matrix_access_token(), room_id)
+        record_join(user_mapping.matrix_user_id, room_id)
+        return True
     except MatrixClientError:
-        pass  # May already be invited or joined
-
-    if user_mapping.matrix_access_token_encrypted:
-        try:
-            await matrix_client.join_room(
-                user_mapping.get_matrix_access_token(),
-                room_mapping.matrix_room_id,
-            )
-        except MatrixClientError:
-            logger.warning(
-                "User %s could not join room %s",
-                user_mapping.matrix_user_id,
-                room_mapping.matrix_room_id,
-            )
+        logger.warning(
+            "User %s could not join room %s",
+            user_mapping.matrix_user_id,
+            room_id,
+        )
+        return False
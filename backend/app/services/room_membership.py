@@ -0,0 +1,89 @@
+"""Rooms each user has joined, mirrored into the database.
+
+The room list pages over messenger_room_members joined with the room
+mappings, so a page costs one indexed query instead of fetching the
+user's full joined_rooms from Conduit and filtering with a growing
+IN (...). Joins made through this service are recorded right away with
+record_join(); a user's rows are replaced with Conduit's joined_rooms
+when this process last synced them more than ROOM_MEMBERSHIP_SYNC_SECONDS
+ago, which picks up joins and leaves made with external Matrix clients.
+"""
+
+import logging
+import time
+from typing import Dict, Iterable, Optional
+
+import httpx
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from app.config import ROOM_MEMBERSHIP_SYNC_SECONDS
+from app.database import SessionLocal
+from app.models import RoomMember, UserMapping
+from app.services.matrix_client import matrix_client, MatrixClientError
+
+logger = logging.getLogger("room_membership")
+
+# matrix_user_id -> time.monotonic() of the last sync with Conduit in this process
+_synced: Dict[str, float] = {}
+
+
+async def sync_user_rooms(user: UserMapping, db: Session) -> None:
+    """Refresh the user's rows from Conduit unless they were synced recently."""
+    synced_at = _synced.get(user.matrix_user_id)
+    if synced_at is not None and time.monotonic() - synced_at < ROOM_MEMBERSHIP_SYNC_SECONDS:
+        return
+    try:
+        joined = set(await matrix_client.list_joined_rooms(user.get_matrix_access_token()))
+    except (MatrixClientError, httpx.HTTPError) as e:
+        # Keep serving the stored rows; try again on the next request
+        logger.warning("Could not list joined rooms of %s: %s", user.matrix_user_id, e)
+        return
+
+    stored = {
+        room_id for (room_id,) in db.query(RoomMember.matrix_room_id)
+        .filter(RoomMember.matrix_user_id == user.matrix_user_id)
+    }
+    left = stored - joined
+    if left:
+        db.query(RoomMember).filter(
+            RoomMember.matrix_user_id == user.matrix_user_id,
+            RoomMember.matrix_room_id.in_(list(left)),
+        ).delete(synchronize_session=False)
+    _insert(user.matrix_user_id, joined - stored, db)
+    db.commit()
+    _synced[user.matrix_user_id] = time.monotonic()
+
+
+def record_join(matrix_user_id: str, room_id: str, db: Optional[Session] = None) -> None:
+    """Store that a user joined a room (no-op if already stored)."""
+    own_session = db is None
+    db = db or SessionLocal()
+    try:
+        _insert(matrix_user_id, [room_id], db)
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        # The next sync with Conduit catches up
+        logger.warning("Could not record join of %s to %s: %s", matrix_user_id, room_id, e)
+        _synced.pop(matrix_user_id, None)
+    finally:
+        if own_session:
+            db.close()
+
+
+def forget_user(matrix_user_id: str) -> None:
+    """Sync the user's rooms with Conduit on their next room list."""
+    _synced.pop(matrix_user_id, None)
+
+
+def _insert(matrix_user_id: str, room_ids: Iterable[str], db: Session) -> None:
+    rows = [{"matrix_user_id": matrix_user_id, "matrix_room_id": r} for r in room_ids]
+    if not rows:
+        return
+    insert = postgresql.insert if db.get_bind().dialect.name == "postgresql" else sqlite.insert
+    db.execute(
+        insert(RoomMember).values(rows).on_conflict_do_nothing(
+            index_elements=["matrix_user_id", "matrix_room_id"],
+        )
+    )
@@ -0,0 +1,145 @@
+"""Background membership reconciliation for service rooms.
+
+Service rooms are meant to contain every (non-bot) user. Instead of
+joining all users one by one inside the request that creates the room,
+a background job compares the room's Matrix members with the provisioned
+users and joins the missing ones concurrently, at most
+ROOM_RECONCILE_CONCURRENCY at a time. Service rooms are public, so a
+join with the user's own token is enough; if it is refused, the
+notification bot invites the user and the join is repeated.
+
+Jobs run when a service room is created (all users -> that room) and
+when a user is provisioned (that user -> all service rooms). Their
+progress is listed by GET /api/v1/admin/jobs.
+"""
+
+import asyncio
+import logging
+from typing import List, Optional, Tuple
+
+import httpx
+
+from app.config import ROOM_RECONCILE_CONCURRENCY
+from app.database import SessionLocal
+from app.models import RoomMapping, RoomType, UserMapping
+from app.services.jobs import Job, jobs
+from app.services.matrix_client import matrix_client, MatrixClientError
+from app.services.room_membership import record_join
+
+logger = logging.getLogger("room_reconciler")
+
+ROOM_JOB = "service_room_members"
+USER_JOB = "user_service_rooms"
+
+
+def _bot_token(db) -> Optional[str]:
+    from app.services.notification_router import BotUnavailable, load_bot_token
+
+    try:
+        return load_bot_token(db)
+    except BotUnavailable as e:
+        logger.warning("Room reconciliation without bot: %s", e)
+        return None
+
+
+async def _join(
+    matrix_user_id: str,
+    user_token: str,
+    room_id: str,
+    bot_token: Optional[str],
+) -> None:
+    """Join a user to a room, inviting them first if the join is refused."""
+    try:
+        await matrix_client.join_room(user_token, room_id)
+        return
+    except MatrixClientError:
+        if not bot_token:
+            raise
+    await matrix_client.invite_user(bot_token, room_id, matrix_user_id)
+    await matrix_client.join_room(user_token, room_id)
+
+
+async def _join_all(job: Job, pairs: List[Tuple[str, str, str]], bot_token: Optional[str]) -> None:
+    """Join (matrix user ID, user token, room ID) pairs with bounded concurrency."""
+    semaphore = asyncio.Semaphore(max(1, ROOM_RECONCILE_CONCURRENCY))
+
+    async def join(matrix_user_id: str, user_token: str, room_id: str) -> None:
+        async with semaphore:
+            try:
+                await _join(matrix_user_id, user_token, room_id, bot_token)
+                record_join(matrix_user_id, room_id)
+                job.done += 1
+            except (MatrixClientError, httpx.HTTPError) as e:
+                job.failed += 1
+                logger.debug("User %s could not join room %s: %s", matrix_user_id, room_id, e)
+
+    await asyncio.gather(*(join(*pair) for pair in pairs))
+
+
+def _user_credentials(users: List[UserMapping]) -> List[Tuple[str, str]]:
+    credentials = []
+    for user in users:
+        if not user.matrix_user_id or not user.matrix_access_token_encrypted:
+            continue
+        try:
+            credentials.append((user.matrix_user_id, user.get_matrix_access_token()))
+        except ValueError as e:
+            logger.error("Failed to decrypt token of user %s: %s", user.hub_user_id, e)
+    return credentials
+
+
+async def _reconcile_room(job: Job) -> None:
+    room_id = job.subject
+    db = SessionLocal()
+    try:
+        bot_token = _bot_token(db)
+        users = _user_credentials(
+            db.query(UserMapping).filter(UserMapping.is_bot == False).all()
+        )
+    finally:
+        db.close()
+
+    joined = set()
+    if bot_token:
+        try:
+            joined = set(await matrix_client.get_room_members(bot_token, room_id))
+        except (MatrixClientError, httpx.HTTPError) as e:
+            # Joining is idempotent, so just try everyone
+            logger.warning("Could not read members of room %s: %s", room_id, e)
+
+    missing = [(uid, token, room_id) for uid, token in users if uid not in joined]
+    job.total = len(missing)
+    job.skipped = len(users) - len(missing)
+    await _join_all(job, missing, bot_token)
+
+
+async def _reconcile_user(job: Job) -> None:
+    db = SessionLocal()
+    try:
+        bot_token = _bot_token(db)
+        user = db.query(UserMapping).filter(UserMapping.hub_user_id == job.subject).first()
+        credentials = _user_credentials([user]) if user else []
+        room_ids = [
+            room_id
+            for (room_id,) in db.query(RoomMapping.matrix_room_id)
+            .filter(RoomMapping.room_type == RoomType.service)
+            .all()
+        ]
+    finally:
+        db.close()
+
+    if not credentials:
+        return
+    matrix_user_id, user_token = credentials[0]
+    job.total = len(room_ids)
+    await _join_all(job, [(matrix_user_id, user_token, r) for r in room_ids], bot_token)
+
+
+def reconcile_room(room_id: str) -> Job:
+    """Join all provisioned users missing from a service room (in the background)."""
+    return jobs.active(ROOM_JOB, room_id) or jobs.start(ROOM_JOB, room_id, _reconcile_room)
+
+
+def reconcile_user(hub_user_id: str) -> Job:
+    """Join a user to all service rooms (in the background)."""
+    return jobs.active(USER_JOB, hub_user_id) or jobs.start(USER_JOB, hub_user_id, _reconcile_user)
@@ -0,0 +1,266 @@
+"""Accept-then-deliver pipeline for chat messages.
+
+Messages are written to a durable outbox and handed to a keyed worker
+pool. Jobs are keyed by room, so messages to one room are delivered in
+the order they were accepted while different rooms proceed in parallel.
+Once Conduit assigns an event ID, room members are notified via SSE
+with the provisional ID the sender received, so clients can replace
+their local echo. A failed attempt is retried after a backoff delay by
+resubmitting the message; until then the room's later messages are held
+back while the worker moves on to other rooms. Pending rows are
+re-queued on startup.
+"""
+
+import asyncio
+import json
+import logging
+import uuid
+from collections import deque
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Any, Deque, Dict, Optional
+
+import httpx
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.config import MESSAGE_SEND_MAX_ATTEMPTS, MESSAGE_SEND_WORKERS
+from app.database import SessionLocal
+from app.models import MessageOutbox, OutboxStatus, UserMapping
+from app.services.matrix_client import matrix_client, MatrixClientError
+from app.services.message_cache import message_cache
+from app.services.message_events import notify_room_members
+from app.services.room_manager import touch_room_activity
+from app.services.sse_broker import broker
+from app.services.user_directory import user_label
+from app.services.worker_pool import KeyedWorkerPool
+
+logger = logging.getLogger("send_pipeline")
+
+
+class DuplicateTransaction(Exception):
+    """The sender's provisional ID (client txn_id) is already in the outbox."""
+
+    def __init__(self, entry: MessageOutbox):
+        super().__init__(entry.provisional_id)
+        self.entry = entry
+
+
+def new_provisional_id() -> str:
+    return uuid.uuid4().hex
+
+
+def is_enabled() -> bool:
+    return _pool.running
+
+
+def enqueue_message(
+    room_id: str,
+    sender: UserMapping,
+    content: Dict[str, Any],
+    db: Session,
+    provisional_id: Optional[str] = None,
+) -> MessageOutbox:
+    """Persist a message in the outbox and queue it for delivery.
+
+    A client-supplied ``provisional_id`` (its txn_id) makes the call
+    idempotent: re-submitting it raises DuplicateTransaction carrying the
+    existing entry instead of queueing the message twice. Like Matrix
+    txn_ids it is scoped to the sender.
+    """
+    if provisional_id:
+        existing = _outbox_entry(sender.hub_user_id, provisional_id, db)
+        if existing:
+            raise DuplicateTransaction(existing)
+
+    entry = MessageOutbox(
+        provisional_id=provisional_id or new_provisional_id(),
+        room_id=room_id,
+        sender_hub_user_id=sender.hub_user_id,
+        content=json.dumps(content),
+        status=OutboxStatus.pending,
+    )
+    db.add(entry)
+    try:
+        db.commit()
+    except IntegrityError:
+        # Lost a race against a concurrent retry of the same transaction
+        db.rollback()
+        raise DuplicateTransaction(_outbox_entry(sender.hub_user_id, entry.provisional_id, db))
+    db.refresh(entry)
+    _pool.submit(room_id, entry.id)
+    return entry
+
+
+def _outbox_entry(sender_hub_user_id: str, provisional_id: str, db: Session) -> Optional[MessageOutbox]:
+    return (
+        db.query(MessageOutbox)
+        .filter(
+            MessageOutbox.sender_hub_user_id == sender_hub_user_id,
+            MessageOutbox.provisional_id == provisional_id,
+        )
+        .first()
+    )
+
+
+@dataclass
+class _Backoff:
+    """A room whose oldest undelivered message waits for its next attempt."""
+    outbox_id: int
+    held: Deque[int]  # later messages of the room, in order
+
+
+# room_id -> backoff; the room's messages wait without blocking the rest of the shard
+_backoff: Dict[str, _Backoff] = {}
+
+
+async def _deliver(outbox_id: int) -> None:
+    db = SessionLocal()
+    try:
+        entry = db.get(MessageOutbox, outbox_id)
+        if entry is None or entry.status != OutboxStatus.pending:
+            return
+        room_id = entry.room_id
+    finally:
+        db.close()
+
+    queue = deque([outbox_id])
+    backoff = _backoff.get(room_id)
+    if backoff is not None:
+        if backoff.outbox_id != outbox_id:
+            # An earlier message of the room waits for its retry; keep the order
+            backoff.held.append(outbox_id)
+            return
+        del _backoff[room_id]
+        queue.extend(backoff.held)
+    while queue:
+        current = queue.popleft()
+        delay = await _attempt(current)
+        if delay is not None:
+            # Retry later; messages queued for the room meanwhile are held back
+            _backoff[room_id] = _Backoff(current, queue)
+            asyncio.get_running_loop().call_later(delay, _resubmit, room_id, current)
+            return
+
+
+def _resubmit(room_id: str, outbox_id: int) -> None:
+    if _pool.running:
+        _pool.submit(room_id, outbox_id)
+
+
+async def _attempt(outbox_id: int) -> Optional[float]:
+    """Try to deliver one outbox message once.
+
+    Returns the delay before the next attempt if it failed and attempts
+    are left, otherwise None (delivered, or marked failed).
+    """
+    db = SessionLocal()
+    try:
+        entry = db.get(MessageOutbox, outbox_id)
+        if entry is None or entry.status != OutboxStatus.pending:
+            return None
+        sender = (
+            db.query(UserMapping)
+            .filter(UserMapping.hub_user_id == entry.sender_hub_user_id)
+            .first()
+        )
+        content = json.loads(entry.content)
+
+        event_id = None
+        error = "Sender not provisioned on Matrix"
+        if sender and sender.matrix_access_token_encrypted:
+            entry.attempts = (entry.attempts or 0) + 1
+            try:
+                # The provisional ID doubles as Matrix txn_id, so retries are idempotent
+                event_id = await matrix_client.send_message_event(
+                    access_token=sender.get_matrix_access_token(),
+                    room_id=entry.room_id,
+                    content=content,
+                    txn_id=entry.provisional_id,
+                )
+            except (MatrixClientError, httpx.HTTPError, ValueError) as e:
+                error = str(e)
+                logger.warning(
+                    "Outbox %s delivery attempt %d failed: %s", entry.id, entry.attempts, e
+                )
+                if entry.attempts < MESSAGE_SEND_MAX_ATTEMPTS:
+                    db.commit()
+                    return 2 ** (entry.attempts - 1)
+
+        if event_id is None:
+            entry.status = OutboxStatus.failed
+            entry.error_message = error[:500]
+            db.commit()
+            await broker.publish_to_user(entry.sender_hub_user_id, {
+                "type": "message_failed",
+                "room_id": entry.room_id,
+                "provisional_id": entry.provisional_id,
+                "error": entry.error_message,
+            })
+            return None
+
+        entry.status = OutboxStatus.sent
+        entry.matrix_event_id = event_id
+        entry.delivered_at = datetime.now(timezone.utc)
+        touch_room_activity(entry.room_id, db, commit=False)
+        db.commit()
+
+        message_cache.append({
+            "event_id": event_id,
+            "room_id": entry.room_id,
+            "sender": sender.matrix_user_id,
+            "sender_display_name": user_label(sender),
+            "body": content.get("body", ""),
+            "msg_type": content.get("msgtype", "m.text"),
+            "timestamp": entry.delivered_at,
+            "file_url": None,
+            "filename": None,
+            "file_size": None,
+        })
+        await notify_room_members(
+            room_id=entry.room_id,
+            event_id=event_id,
+            sender=sender.matrix_user_id,
+            sender_display_name=user_label(sender),
+            body=content.get("body", ""),
+            msg_type=content.get("msgtype", "m.text"),
+            db=db,
+            provisional_id=entry.provisional_id,
+        )
+        return None
+    finally:
+        db.close()
+
+
+_pool = KeyedWorkerPool("message-send", MESSAGE_SEND_WORKERS, _deliver)
+
+
+async def start() -> None:
+    """Start the workers and re-queue messages left pending by a restart."""
+    _pool.start()
+    if not _pool.running:
+        return
+    db = SessionLocal()
+    try:
+        pending = (
+            db.query(MessageOutbox.id, MessageOutbox.room_id)
+            .filter(MessageOutbox.status == OutboxStatus.pending)
+            .order_by(MessageOutbox.id)
+            .all()
+        )
+    finally:
+        db.close()
+    for outbox_id, room_id in pending:
+        _pool.submit(room_id, outbox_id)
+    if pending:
+        logger.info("Re-queued %d pending outbox message(s).", len(pending))
+
+
+async def stop() -> None:
+    await _pool.stop()
+    # Held messages stay pending in the outbox and are re-queued on startup
+    _backoff.clear()
+
+
+def stats() -> Dict[str, Any]:
+    return _pool.stats()
@@ -3,7 +3,7 @@
 import asyncio
 import json
 import logging
-from typing import AsyncIterator, Dict, Any, List
+from typing import AsyncIterator, Dict, Any, Iterable, List
 
 logger = logging.getLogger("sse_broker")
 
@@ -46,6 +46,13 @@ class SSEBroker:
             except asyncio.QueueFull:
                 logger.warning("SSE queue full for user %s", user_id)
 
+    async def publish_to_users(self, user_ids: Iterable[str], event: Dict[str, Any]) -> int:
+        """Send an event to the connected users among ``user_ids``; returns how many."""
+        connected = [user_id for user_id in user_ids if user_id in self._subscribers]
+        for user_id in connected:
+            await self.publish_to_user(user_id, event)
+        return len(connected)
+
     async def broadcast(self, event: Dict[str, Any]) -> None:
         """Broadcast an event to all connected users."""
         for user_id in list(self._subscribers.keys()):
@@ -0,0 +1,66 @@
+"""Short-lived registry of client transaction IDs.
+
+Clients may attach a ``txn_id`` to sends so a retry after a timeout does
+not post the message twice. The ID is passed through to Matrix (which
+deduplicates per access token) and the response is remembered here, so
+a retry is answered without another Conduit round trip.
+
+Transaction IDs are scoped per sender, like Matrix scopes them per
+access token. Each entry keeps a fingerprint of the request; a sender
+reusing a txn_id for a different request gets TransactionConflict.
+"""
+
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from app.config import TXN_CACHE_MAX_ENTRIES, TXN_CACHE_TTL_SECONDS
+
+
+class TransactionConflict(Exception):
+    """The sender already used the txn_id for a different request."""
+
+
+class TransactionRegistry:
+    """TTL map of (sender, txn_id) -> (status code, JSON response payload)."""
+
+    def __init__(self, ttl_seconds: int = TXN_CACHE_TTL_SECONDS, max_entries: int = TXN_CACHE_MAX_ENTRIES):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[float, int, Dict[str, Any], Optional[str]]]" = OrderedDict()
+
+    def _expire(self) -> None:
+        cutoff = time.monotonic() - self.ttl_seconds
+        while self._entries:
+            key, (stored_at, _, _, _) = next(iter(self._entries.items()))
+            if stored_at >= cutoff and len(self._entries) <= self.max_entries:
+                break
+            del self._entries[key]
+
+    def get(
+        self, sender: str, txn_id: str, fingerprint: Optional[str] = None
+    ) -> Optional[Tuple[int, Dict[str, Any]]]:
+        """The remembered response, or None. Raises TransactionConflict if
+        the stored request's fingerprint differs from ``fingerprint``."""
+        self._expire()
+        hit = self._entries.get((sender, txn_id))
+        if hit is None:
+            return None
+        if fingerprint is not None and hit[3] is not None and hit[3] != fingerprint:
+            raise TransactionConflict(txn_id)
+        return hit[1], hit[2]
+
+    def record(
+        self,
+        sender: str,
+        txn_id: str,
+        payload: Dict[str, Any],
+        status_code: int = 200,
+        fingerprint: Optional[str] = None,
+    ) -> None:
+        self._entries[(sender, txn_id)] = (time.monotonic(), status_code, payload, fingerprint)
+        self._entries.move_to_end((sender, txn_id))
+        self._expire()
+
+
+txn_registry = TransactionRegistry()
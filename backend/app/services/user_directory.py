@@ -0,0 +1,142 @@
+"""In-process directory of Matrix user IDs to display names.
+
+Room member lists, message history and DM naming all need to turn
+Matrix user IDs into Hub identities. Instead of querying UserMapping
+per item, the directory is warmed once at startup and kept current by
+the code paths that create or rename users.
+"""
+
+import logging
+from dataclasses import dataclass
+from typing import Dict, Iterable, Optional
+
+from sqlalchemy.orm import Session
+
+from app.models import UserMapping
+
+logger = logging.getLogger("user_directory")
+
+
+@dataclass(frozen=True)
+class DirectoryEntry:
+    matrix_user_id: str
+    hub_user_id: str
+    display_name: Optional[str]
+    tenant_id: Optional[int]
+    is_bot: bool = False
+
+    @property
+    def label(self) -> str:
+        return user_label(self)
+
+
+def user_label(user) -> str:
+    """Human readable name of a user mapping or directory entry.
+
+    The display name, falling back to the Hub user ID. Messages sent
+    through the API and history read from Conduit both label senders with
+    it, so cached and fetched pages agree.
+    """
+    return user.display_name or user.hub_user_id
+
+
+def fallback_name(matrix_user_id: str) -> str:
+    """Extract the localpart from a Matrix ID (@user:server -> user)."""
+    return matrix_user_id.split(":")[0].lstrip("@")
+
+
+class UserDirectory:
+    """Shared matrix_user_id -> (hub_user_id, display_name) lookup."""
+
+    def __init__(self):
+        self._entries: Dict[str, DirectoryEntry] = {}
+        self._by_hub_id: Dict[str, str] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def load(self, db: Session) -> int:
+        """(Re)load all user mappings in a single query."""
+        rows = db.query(
+            UserMapping.matrix_user_id,
+            UserMapping.hub_user_id,
+            UserMapping.display_name,
+            UserMapping.tenant_id,
+            UserMapping.is_bot,
+        ).all()
+        entries = {}
+        by_hub_id = {}
+        for matrix_user_id, hub_user_id, display_name, tenant_id, is_bot in rows:
+            entries[matrix_user_id] = DirectoryEntry(
+                matrix_user_id=matrix_user_id,
+                hub_user_id=hub_user_id,
+                display_name=display_name,
+                tenant_id=tenant_id,
+                is_bot=bool(is_bot),
+            )
+            by_hub_id[hub_user_id] = matrix_user_id
+        self._entries = entries
+        self._by_hub_id = by_hub_id
+        logger.info("User directory loaded with %d entries.", len(entries))
+        return len(entries)
+
+    def update(self, mapping: UserMapping) -> None:
+        """Insert or refresh the entry for a user mapping."""
+        previous = self._by_hub_id.get(mapping.hub_user_id)
+        if previous and previous != mapping.matrix_user_id:
+            self._entries.pop(previous, None)
+        self._entries[mapping.matrix_user_id] = DirectoryEntry(
+            matrix_user_id=mapping.matrix_user_id,
+            hub_user_id=mapping.hub_user_id,
+            display_name=mapping.display_name,
+            tenant_id=mapping.tenant_id,
+            is_bot=bool(mapping.is_bot),
+        )
+        self._by_hub_id[mapping.hub_user_id] = mapping.matrix_user_id
+
+    def get(self, matrix_user_id: str) -> Optional[DirectoryEntry]:
+        return self._entries.get(matrix_user_id)
+
+    def get_by_hub_id(self, hub_user_id: str, db: Optional[Session] = None) -> Optional[DirectoryEntry]:
+        """Entry of a Hub user; a miss is looked up in the database when a session is given."""
+        matrix_user_id = self._by_hub_id.get(hub_user_id)
+        if matrix_user_id:
+            return self._entries.get(matrix_user_id)
+        if db is None:
+            return None
+        mapping = db.query(UserMapping).filter(UserMapping.hub_user_id == hub_user_id).first()
+        if mapping is None:
+            return None
+        self.update(mapping)
+        return self._entries[mapping.matrix_user_id]
+
+    def resolve_many(
+        self, matrix_user_ids: Iterable[str], db: Optional[Session] = None
+    ) -> Dict[str, DirectoryEntry]:
+        """Resolve many Matrix IDs at once.
+
+        Misses (e.g. users created by another worker process) are fetched
+        with one IN query when a session is given and added to the directory.
+        """
+        wanted = {mid for mid in matrix_user_ids if mid}
+        found = {mid: self._entries[mid] for mid in wanted if mid in self._entries}
+        missing = wanted - found.keys()
+        if missing and db is not None:
+            for mapping in (
+                db.query(UserMapping)
+                .filter(UserMapping.matrix_user_id.in_(list(missing)))
+                .all()
+            ):
+                self.update(mapping)
+                found[mapping.matrix_user_id] = self._entries[mapping.matrix_user_id]
+        return found
+
+    def display_name(self, matrix_user_id: str, db: Optional[Session] = None) -> str:
+        """Display name for a Matrix ID, falling back to its localpart."""
+        entry = self.resolve_many([matrix_user_id], db).get(matrix_user_id)
+        if entry:
+            return entry.label
+        return fallback_name(matrix_user_id)
+
+
+user_directory = UserDirectory()
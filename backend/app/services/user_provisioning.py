@@ -7,8 +7,11 @@ from sqlalchemy.orm import Session
 
 from app.config import MATRIX_SERVER_NAME
 from app.models import UserMapping
+from app.services import room_reconciler
 from app.services.matrix_client import matrix_client, MatrixClientError
 from app.services.encryption import encrypt_token
+from app.services.room_membership import forget_user
+from app.services.user_directory import user_directory
 
 logger = logging.getLogger("user_provisioning")
 
@@ -81,6 +84,11 @@ async def provision_matrix_user(
 
     db.commit()
     db.refresh(mapping)
+    user_directory.update(mapping)
+    forget_user(matrix_user_id)
+
+    # Add the new account to the existing service rooms
+    room_reconciler.reconcile_user(hub_user_id)
     return mapping
 
 
@@ -141,4 +149,5 @@ async def provision_bot_user(
 
     db.commit()
     db.refresh(mapping)
+    user_directory.update(mapping)
     return mapping
@@ -0,0 +1,118 @@
+"""Keyed asyncio worker pool with per-key ordering.
+
+Each worker owns a FIFO queue. Jobs are routed to a worker by a stable
+hash of their key, so all jobs for one key (e.g. one room) run strictly
+in submission order while different keys are processed in parallel.
+Jobs submitted as urgent go into a separate lane that the worker drains
+before normal jobs, so they never wait behind queued normal traffic.
+"""
+
+import asyncio
+import logging
+import time
+import zlib
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional
+
+logger = logging.getLogger("worker_pool")
+
+URGENT_LANE = 0
+NORMAL_LANE = 1
+
+
+class KeyedWorkerPool:
+    """Fixed set of asyncio workers consuming per-worker ordered queues."""
+
+    def __init__(
+        self,
+        name: str,
+        workers: int,
+        handler: Callable[[Any], Awaitable[None]],
+    ):
+        self.name = name
+        self.size = max(0, workers)
+        self._handler = handler
+        self._queues: List[asyncio.PriorityQueue] = []
+        # Enqueue times per worker and lane; FIFO within a lane, so [0] is the oldest
+        self._enqueued: List[List[Deque[float]]] = []
+        self._tasks: List[asyncio.Task] = []
+        self._processed = 0
+        self._failed = 0
+        self._last_wait = 0.0
+        self._seq = 0
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
+
+    def start(self) -> None:
+        if self.running or self.size == 0:
+            return
+        self._queues = [asyncio.PriorityQueue() for _ in range(self.size)]
+        self._enqueued = [[deque(), deque()] for _ in range(self.size)]
+        self._tasks = [
+            asyncio.create_task(self._run(i), name=f"{self.name}-{i}")
+            for i in range(self.size)
+        ]
+        logger.info("Worker pool '%s' started with %d workers.", self.name, self.size)
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._queues = []
+        self._enqueued = []
+
+    def _shard(self, key: str) -> int:
+        return zlib.crc32(key.encode("utf-8")) % self.size
+
+    def submit(self, key: str, job: Any, urgent: bool = False) -> None:
+        """Queue a job; jobs with equal keys and lane are handled in order."""
+        if not self.running:
+            raise RuntimeError(f"Worker pool '{self.name}' is not running")
+        # The sequence number keeps FIFO order within a lane
+        self._seq += 1
+        lane = URGENT_LANE if urgent else NORMAL_LANE
+        shard = self._shard(key)
+        now = time.monotonic()
+        self._enqueued[shard][lane].append(now)
+        self._queues[shard].put_nowait((lane, self._seq, now, job))
+
+    async def _run(self, shard: int) -> None:
+        queue = self._queues[shard]
+        enqueued = self._enqueued[shard]
+        while True:
+            lane, _seq, enqueued_at, job = await queue.get()
+            enqueued[lane].popleft()
+            self._last_wait = time.monotonic() - enqueued_at
+            try:
+                await self._handler(job)
+                self._processed += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                self._failed += 1
+                logger.exception("Worker pool '%s' job failed", self.name)
+            finally:
+                queue.task_done()
+
+    def _oldest_wait(self) -> Optional[float]:
+        oldest = min(
+            (lane[0] for shard in self._enqueued for lane in shard if lane),
+            default=None,
+        )
+        return time.monotonic() - oldest if oldest is not None else None
+
+    def stats(self) -> Dict[str, Any]:
+        """Queue depth and lag for monitoring."""
+        oldest = self._oldest_wait()
+        return {
+            "workers": len(self._tasks),
+            "queued": sum(q.qsize() for q in self._queues),
+            "queued_urgent": sum(len(shard[URGENT_LANE]) for shard in self._enqueued),
+            "oldest_queued_seconds": round(oldest, 3) if oldest is not None else 0.0,
+            "last_wait_seconds": round(self._last_wait, 3),
+            "processed": self._processed,
+            "failed": self._failed,
+        }
@@ -0,0 +1,115 @@
+"""Benchmark: per-page CPU time of history serialization.
+
+Compares the previous path (validated MessageOut objects, re-validated
+through MessageHistory and encoded by FastAPI's JSON response) with the
+pre-shaped dict + fast JSON path used by GET /messages/history.
+
+Run from the backend directory:
+
+    python benchmarks/bench_history.py [--events 200] [--rounds 500]
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+from fastapi.encoders import jsonable_encoder  # noqa: E402
+
+from app.fast_json import dumps  # noqa: E402
+from app.routers.messages import build_history_payloads  # noqa: E402
+from app.schemas.messages import MessageHistory, MessageOut  # noqa: E402
+
+ROOM_ID = "!bench:hub.local"
+
+
+def make_chunk(events: int) -> list[dict]:
+    chunk = []
+    base_ts = 1_760_000_000_000
+    for i in range(events):
+        content = {"msgtype": "m.text", "body": f"Nachricht {i} " + "x" * 80}
+        if i % 10 == 0:
+            content = {
+                "msgtype": "m.file",
+                "body": f"report-{i}.pdf",
+                "filename": f"report-{i}.pdf",
+                "url": f"mxc://hub.local/media{i}",
+                "info": {"mimetype": "application/pdf", "size": 1024 * i},
+            }
+        chunk.append({
+            "type": "m.room.message",
+            "event_id": f"$event{i}",
+            "sender": f"@user{i % 12}:hub.local",
+            "origin_server_ts": base_ts - i * 1000,
+            "content": content,
+        })
+    return chunk
+
+
+def legacy_page(chunk: list[dict], names: dict[str, str]) -> bytes:
+    messages = []
+    for event in chunk:
+        content = event.get("content", {})
+        file_info = content.get("info", {})
+        file_url = content.get("url")
+        filename = content.get("filename") or content.get("body", "")
+        sender = event.get("sender", "")
+        messages.append(
+            MessageOut(
+                event_id=event["event_id"],
+                room_id=ROOM_ID,
+                sender=sender,
+                sender_display_name=names.get(sender),
+                body=content.get("body", ""),
+                msg_type=content.get("msgtype", "m.text"),
+                timestamp=datetime.fromtimestamp(
+                    event.get("origin_server_ts", 0) / 1000, tz=timezone.utc
+                ),
+                file_url=file_url,
+                filename=filename if file_url else None,
+                file_size=file_info.get("size") if file_url else None,
+            )
+        )
+    history = MessageHistory(messages=messages, end_token="t1", has_more=True)
+    # response_model validation + JSONResponse encoding, as FastAPI does it
+    validated = MessageHistory.model_validate(history.model_dump())
+    return json.dumps(jsonable_encoder(validated)).encode("utf-8")
+
+
+def fast_page(chunk: list[dict], names: dict[str, str]) -> bytes:
+    messages = build_history_payloads(chunk, ROOM_ID, names)
+    return dumps({"messages": messages, "end_token": "t1", "has_more": True})
+
+
+def bench(fn, chunk, names, rounds: int) -> float:
+    fn(chunk, names)  # warm up
+    start = time.process_time()
+    for _ in range(rounds):
+        fn(chunk, names)
+    return (time.process_time() - start) / rounds * 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--events", type=int, default=200)
+    parser.add_argument("--rounds", type=int, default=500)
+    args = parser.parse_args()
+
+    chunk = make_chunk(args.events)
+    names = {f"@user{i}:hub.local": f"Benutzer {i}" for i in range(12)}
+
+    legacy_ms = bench(legacy_page, chunk, names, args.rounds)
+    fast_ms = bench(fast_page, chunk, names, args.rounds)
+    print(f"events/page: {args.events}, rounds: {args.rounds}")
+    print(f"legacy (pydantic + response_model): {legacy_ms:.3f} ms CPU/page")
+    print(f"fast   (dicts + fast JSON):         {fast_ms:.3f} ms CPU/page")
+    print(f"speedup: {legacy_ms / fast_ms:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""Shared fixtures: a throwaway SQLite database and an API client.
+
+Conduit is never contacted; tests replace the matrix_client methods they
+need with monkeypatch.
+"""
+
+import os
+import tempfile
+
+_db_dir = tempfile.mkdtemp(prefix="messenger-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{_db_dir}/messenger.db"
+os.environ.setdefault("SECRET_KEY", "test-secret-key")
+os.environ.setdefault("MESSENGER_SERVICE_TOKEN", "test-service-token")
+
+import pytest
+from fastapi import Depends
+from fastapi.testclient import TestClient
+from sqlalchemy.orm import Session
+
+from app import models  # noqa: F401 - registers all tables
+from app.auth import get_current_user
+from app.config import MATRIX_SERVER_NAME
+from app.database import Base, SessionLocal, engine, get_db
+from app.models import UserMapping
+from app.services.encryption import encrypt_token
+from app.services import message_events, room_membership
+from app.services.message_cache import message_cache
+from app.services.txn_registry import txn_registry
+from app.services.user_directory import user_directory
+
+SERVICE_TOKEN = os.environ["MESSENGER_SERVICE_TOKEN"]
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+def db():
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+    # Process-wide caches must not leak rows of a previous test's database
+    user_directory.__init__()
+    message_cache.__init__()
+    txn_registry.__init__()
+    room_membership._synced.clear()
+    message_events._audiences.clear()
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+@pytest.fixture
+def make_user(db):
+    """Create a provisioned user mapping."""
+    def make(
+        hub_user_id: str,
+        tenant_id: int = 1,
+        role: str = "user",
+        display_name: str = None,
+        is_bot: bool = False,
+    ) -> UserMapping:
+        user = UserMapping(
+            hub_user_id=hub_user_id,
+            matrix_user_id=f"@{hub_user_id}:{MATRIX_SERVER_NAME}",
+            matrix_access_token_encrypted=encrypt_token(f"token-{hub_user_id}"),
+            tenant_id=tenant_id,
+            role=role,
+            display_name=display_name,
+            is_bot=is_bot,
+        )
+        db.add(user)
+        db.commit()
+        db.refresh(user)
+        user_directory.update(user)
+        return user
+    return make
+
+
+class ApiClient(TestClient):
+    """TestClient whose requests are authenticated as ``as_user``."""
+
+    hub_user_id = None
+
+    def as_user(self, user: UserMapping) -> "ApiClient":
+        self.hub_user_id = user.hub_user_id
+        return self
+
+
+@pytest.fixture
+def client(db):
+    from app.main import app
+
+    api = ApiClient(app)
+
+    def current_user(session: Session = Depends(get_db)) -> UserMapping:
+        return session.query(UserMapping).filter(UserMapping.hub_user_id == api.hub_user_id).one()
+
+    app.dependency_overrides[get_current_user] = current_user
+    try:
+        yield api
+    finally:
+        app.dependency_overrides.clear()
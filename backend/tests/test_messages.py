@@ -0,0 +1,138 @@
+"""Message send and history endpoints."""
+
+import anyio
+import pytest
+
+from app.models import RoomMapping, RoomType
+from app.routers import messages as messages_router
+from app.services.matrix_client import matrix_client
+from app.services import send_pipeline
+from app.services.room_manager import touch_room_activity
+from app.services.txn_registry import txn_registry
+
+ROOM = "!room:hub.local"
+
+
+class FakeRoom:
+    """One Conduit room: sends append events, history reads them back."""
+
+    def __init__(self):
+        self.events = []
+        self.sender_of = {}  # access token -> Matrix user ID
+        self.reads = 0
+
+    def join(self, user):
+        self.sender_of[user.get_matrix_access_token()] = user.matrix_user_id
+
+    async def get_room_messages(self, access_token, room_id, limit=50, from_token=None, **kwargs):
+        self.reads += 1
+        return {"chunk": list(reversed(self.events))[:limit], "end": None}
+
+    async def send_message(self, access_token, room_id, body, msg_type="m.text", txn_id=None):
+        event_id = f"$event{len(self.events) + 1}"
+        self.events.append({
+            "event_id": event_id,
+            "sender": self.sender_of[access_token],
+            "origin_server_ts": 1760000000000 + len(self.events),
+            "type": "m.room.message",
+            "content": {"msgtype": msg_type, "body": body},
+        })
+        return event_id
+
+
+@pytest.fixture
+def conduit(monkeypatch):
+    room = FakeRoom()
+
+    async def notify(*args, **kwargs):
+        pass
+
+    monkeypatch.setattr(matrix_client, "get_room_messages", room.get_room_messages)
+    monkeypatch.setattr(matrix_client, "send_message", room.send_message)
+    monkeypatch.setattr(messages_router, "notify_room_members", notify)
+    return room
+
+
+def test_cached_and_fetched_history_label_senders_alike(client, make_user, conduit):
+    user = make_user("mueller", display_name=None)
+    conduit.join(user)
+    client.as_user(user)
+
+    client.post("/api/v1/messages/send", json={"room_id": ROOM, "body": "first"})
+    fetched = client.get(f"/api/v1/messages/history/{ROOM}").json()
+    client.post("/api/v1/messages/send", json={"room_id": ROOM, "body": "second"})
+    cached = client.get(f"/api/v1/messages/history/{ROOM}").json()
+
+    assert [m["body"] for m in cached["messages"]] == ["second", "first"]
+    labels = {m["sender_display_name"] for m in fetched["messages"] + cached["messages"]}
+    assert labels == {"mueller"}
+
+
+def test_newest_page_picks_up_messages_sent_by_another_worker(client, db, make_user, conduit):
+    user = make_user("mueller")
+    conduit.join(user)
+    db.add(RoomMapping(matrix_room_id=ROOM, room_type=RoomType.general, tenant_id=1))
+    db.commit()
+    client.as_user(user)
+    client.get(f"/api/v1/messages/history/{ROOM}")
+    client.post("/api/v1/messages/send", json={"room_id": ROOM, "body": "first"})
+    client.get(f"/api/v1/messages/history/{ROOM}")
+    assert conduit.reads == 1  # own send kept the buffer current
+
+    # Another process sends: Conduit has the event and the stored count moved
+    anyio.run(conduit.send_message, user.get_matrix_access_token(), ROOM, "elsewhere")
+    touch_room_activity(ROOM, db)
+
+    page = client.get(f"/api/v1/messages/history/{ROOM}").json()
+    assert [m["body"] for m in page["messages"]] == ["elsewhere", "first"]
+
+
+@pytest.fixture(params=["sync", "async"])
+def send_mode(request, monkeypatch):
+    """Send directly, or through the outbox (pipeline workers not running)."""
+    if request.param == "async":
+        monkeypatch.setattr(send_pipeline, "is_enabled", lambda: True)
+        monkeypatch.setattr(send_pipeline._pool, "submit", lambda *args: None)
+        monkeypatch.setattr(messages_router, "MESSAGE_SEND_ASYNC", True)
+    return request.param
+
+
+def test_retried_txn_id_returns_the_original_message(client, make_user, conduit, send_mode):
+    user = make_user("mueller")
+    conduit.join(user)
+    client.as_user(user)
+    send = {"room_id": ROOM, "body": "hello", "txn_id": "1"}
+
+    first = client.post("/api/v1/messages/send", json=send)
+    if send_mode == "async":
+        txn_registry.__init__()  # e.g. the retry reaches another worker: the outbox answers
+    retry = client.post("/api/v1/messages/send", json=send)
+
+    assert retry.status_code == first.status_code
+    assert retry.json() == first.json()
+    assert len(conduit.events) == (1 if send_mode == "sync" else 0)
+
+
+def test_txn_ids_are_scoped_per_sender(client, db, make_user, conduit, send_mode):
+    alice, bob = make_user("alice"), make_user("bob")
+    for user in (alice, bob):
+        conduit.join(user)
+
+    client.as_user(alice)
+    assert client.post("/api/v1/messages/send", json={"room_id": ROOM, "body": "a", "txn_id": "1"}).is_success
+    client.as_user(bob)
+    response = client.post("/api/v1/messages/send", json={"room_id": ROOM, "body": "b", "txn_id": "1"})
+
+    assert response.is_success
+    assert response.json()["body"] == "b"
+
+
+def test_reusing_a_txn_id_for_another_message_conflicts(client, make_user, conduit, send_mode):
+    user = make_user("mueller")
+    conduit.join(user)
+    client.as_user(user)
+
+    client.post("/api/v1/messages/send", json={"room_id": ROOM, "body": "hello", "txn_id": "1"})
+    response = client.post("/api/v1/messages/send", json={"room_id": ROOM, "body": "changed", "txn_id": "1"})
+
+    assert response.status_code == 409
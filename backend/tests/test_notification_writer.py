@@ -0,0 +1,38 @@
+"""Write-behind buffer for notification results."""
+
+import pytest
+
+from app.models import NotificationLog, NotificationStatus
+from app.schemas.notifications import NotificationSend
+from app.services.notification_router import mark_sent, new_log_entry
+from app.services.notification_writer import MAX_FLUSH_ATTEMPTS, NotificationWriter
+
+pytestmark = pytest.mark.anyio
+
+
+def _sent_entry(log_id: int) -> NotificationLog:
+    entry = new_log_entry(
+        NotificationSend(source_app="machine-monitoring", event_type="alarm", title="Stoerung")
+    )
+    entry.id = log_id
+    mark_sent(entry, f"$event{log_id}")
+    return entry
+
+
+async def test_rejected_row_does_not_hold_back_the_batch(db):
+    writer = NotificationWriter(interval_ms=0, max_rows=100)
+    good = [_sent_entry(log_id) for log_id in (1, 2, 4)]
+    poison = _sent_entry(3)
+    poison.title = None  # violates NOT NULL
+    writer.record(good[:2] + [poison] + good[2:], new=True)
+
+    assert await writer.flush() == 3
+    assert sorted(log_id for (log_id,) in db.query(NotificationLog.id)) == [1, 2, 4]
+    assert writer.stats()["buffered"] == 1
+
+    for _ in range(MAX_FLUSH_ATTEMPTS - 1):
+        assert await writer.flush() == 0
+    # Dropped (logged) instead of being retried forever
+    assert writer.stats()["buffered"] == 0
+    assert await writer.flush() == 0
+    assert {status for (status,) in db.query(NotificationLog.status)} == {NotificationStatus.sent}
@@ -0,0 +1,203 @@
+"""Cross-app notification endpoints."""
+
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+import anyio
+import pytest
+
+from app.models import NotificationLog, NotificationStatus, RoomMapping, RoomType
+from app.routers import notifications as notifications_router
+from app.schemas.notifications import NotificationSend
+from app.services import message_events, notification_pipeline, notification_retry, notification_router
+from app.services.bot_pool import BotCoolingDown, BotPool, pool_bot_names
+from app.services.jobs import Job
+from app.services.matrix_client import matrix_client
+from app.services.notification_router import NOTIFICATION_BOT, mark_deferred, new_log_entry
+from app.services.user_directory import user_directory
+from tests.conftest import SERVICE_TOKEN
+
+NOTIFICATION = {"source_app": "machine-monitoring", "event_type": "alarm", "title": "Stoerung"}
+
+
+@pytest.fixture
+def queued(monkeypatch):
+    """Queue mode with the workers' job submission captured instead of run."""
+    submitted = []
+    monkeypatch.setattr(notification_pipeline, "is_enabled", lambda: True)
+    monkeypatch.setattr(notification_pipeline, "_submit_jobs", submitted.extend)
+    return submitted
+
+
+@pytest.fixture
+def bound_token(monkeypatch):
+    """A machine-monitoring token that may address tenant 1 only."""
+    monkeypatch.setitem(notifications_router.MESSENGER_SERVICE_TOKENS, "mm-token", "machine-monitoring")
+    monkeypatch.setitem(notifications_router.MESSENGER_SERVICE_TOKEN_TENANTS, "machine-monitoring", {1})
+    return "mm-token"
+
+
+def _post(client, path, payload, token=SERVICE_TOKEN):
+    return client.post(f"/api/v1/notifications{path}", json=payload, headers={"X-Service-Token": token})
+
+
+def test_send_finds_a_bot_provisioned_by_another_worker(client, make_user, queued):
+    make_user(NOTIFICATION_BOT, tenant_id=None, is_bot=True)
+    user_directory.__init__()  # directory warmed before the bot existed
+
+    response = _post(client, "/send", NOTIFICATION)
+
+    assert response.status_code == 202
+    assert queued
+
+
+def test_send_without_bot_is_unavailable(client, db, queued):
+    assert _post(client, "/send", NOTIFICATION).status_code == 503
+    assert queued == []
+
+
+def test_due_rows_are_claimed_by_one_sweep_only(db, queued, monkeypatch):
+    now = datetime.now(timezone.utc)
+    for status, next_attempt_at in [
+        (NotificationStatus.failed, now - timedelta(seconds=1)),  # retry due
+        (NotificationStatus.pending, now - timedelta(seconds=1)),  # lease ran out
+        (NotificationStatus.pending, now + timedelta(minutes=5)),  # queued by a live worker
+    ]:
+        entry = new_log_entry(NotificationSend(**NOTIFICATION))
+        entry.status = status
+        entry.next_attempt_at = next_attempt_at
+        db.add(entry)
+    db.commit()
+
+    # Another worker's scheduler sweeps while this one is handing its rows to the queue
+    swept_meanwhile = []
+    requeue = notification_pipeline.requeue_notifications
+
+    def requeue_during_other_sweep(*args):
+        if not swept_meanwhile:
+            swept_meanwhile.append(None)
+            with ThreadPoolExecutor(1) as other_worker:
+                swept_meanwhile[0] = other_worker.submit(anyio.run, notification_retry.retry_due).result()
+        requeue(*args)
+
+    monkeypatch.setattr(notification_pipeline, "requeue_notifications", requeue_during_other_sweep)
+
+    assert anyio.run(notification_retry.retry_due) == 2
+    assert swept_meanwhile == [0]
+    assert len(queued) == 1  # one job for the shared target, submitted once
+
+
+def test_room_waits_for_its_cooling_bot_instead_of_failing_over(db, make_user, monkeypatch):
+    names = pool_bot_names(NOTIFICATION_BOT, 2)
+    primary = [make_user(name, tenant_id=None, is_bot=True) for name in names][0]
+    pool = BotPool(names)
+    pool.load(db)
+    monkeypatch.setattr(notification_router, "bot_pool", pool)
+    sent = []
+
+    async def send_message(**kwargs):
+        sent.append(kwargs)
+        return "$event"
+
+    monkeypatch.setattr(matrix_client, "send_message", send_message)
+    room_bot = pool.for_room("!room:hub.local")
+    for _ in range(3):
+        pool.record(room_bot, False, 0.1, "Send failed: 502")
+
+    with pytest.raises(BotCoolingDown) as cooling:
+        anyio.run(
+            notification_router._send_as_bot,
+            primary.get_matrix_access_token(), "!room:hub.local", "Stoerung", "notification-1",
+        )
+
+    assert sent == []
+    assert pool.for_room("!room:hub.local") is room_bot
+    entry = new_log_entry(NotificationSend(**NOTIFICATION))
+    mark_deferred(entry, str(cooling.value), cooling.value.seconds)
+    assert entry.status == NotificationStatus.failed
+    assert entry.attempts == 0
+    assert entry.next_attempt_at > datetime.now(timezone.utc) + timedelta(seconds=50)
+
+
+@pytest.mark.parametrize("target, allowed", [
+    ({"target_type": "tenant", "target_tenant_id": 1}, True),
+    ({"target_type": "role", "target_role": "admin", "target_tenant_id": 1}, True),
+    ({"target_type": "tenant", "target_tenant_id": 2}, False),
+    ({"target_type": "role", "target_role": "admin"}, False),  # every tenant
+])
+def test_bound_token_fans_out_to_its_tenants_only(client, make_user, queued, bound_token, target, allowed):
+    make_user(NOTIFICATION_BOT, tenant_id=None, is_bot=True)
+    make_user("mueller", tenant_id=1, role="admin")
+    make_user("schmidt", tenant_id=2, role="admin")
+
+    response = _post(client, "/send-batch", [{**NOTIFICATION, **target}], token=bound_token)
+
+    assert response.status_code == (202 if allowed else 403)
+    assert bool(queued) == allowed
+
+
+def test_general_room_audience_includes_users_of_other_workers(db, make_user):
+    db.add(RoomMapping(matrix_room_id="!general:hub.local", room_type=RoomType.general, tenant_id=1))
+    db.commit()
+    make_user("mueller", tenant_id=1)
+    make_user("schmidt", tenant_id=2)
+    make_user(NOTIFICATION_BOT, tenant_id=1, is_bot=True)
+    user_directory.__init__()  # provisioned through another worker process
+
+    audience = anyio.run(message_events._room_audience, "!general:hub.local", db)
+
+    assert audience == {"mueller"}
+
+
+def test_log_cursor_pages_through_equal_timestamps(client, db):
+    created_at = datetime.now(timezone.utc) - timedelta(minutes=1)
+    for minutes in [0, 0, 0, 1, 1, 2, 3]:  # several rows share a timestamp
+        entry = new_log_entry(NotificationSend(**NOTIFICATION))
+        entry.created_at = created_at + timedelta(minutes=minutes)
+        db.add(entry)
+    db.commit()
+    newest_first = [
+        row.id for row in db.query(NotificationLog).order_by(
+            NotificationLog.created_at.desc(), NotificationLog.id.desc()
+        )
+    ]
+
+    pages, cursor = [], None
+    while True:
+        params = {"limit": 3, **({"cursor": cursor} if cursor else {})}
+        response = client.get(
+            "/api/v1/notifications/log", params=params, headers={"X-Service-Token": SERVICE_TOKEN}
+        )
+        pages.append([row["id"] for row in response.json()])
+        cursor = response.headers.get("X-Next-Cursor")
+        if not cursor:
+            break
+
+    assert pages == [newest_first[0:3], newest_first[3:6], newest_first[6:7]]
+
+
+def test_log_rejects_a_malformed_cursor(client, db):
+    response = client.get(
+        "/api/v1/notifications/log", params={"cursor": "nonsense"}, headers={"X-Service-Token": SERVICE_TOKEN}
+    )
+    assert response.status_code == 400
+
+
+@pytest.mark.parametrize("tenant_id, allowed", [(1, True), (None, True), (2, False)])
+def test_bound_token_provisions_entity_rooms_in_its_tenants_only(
+    client, make_user, bound_token, monkeypatch, tenant_id, allowed
+):
+    make_user(NOTIFICATION_BOT, tenant_id=None, is_bot=True)
+    started = []
+
+    def start(kind, subject, run):
+        started.append(kind)
+        return Job(id=f"{kind}-1", kind=kind, subject=subject)
+
+    monkeypatch.setattr(notifications_router.jobs, "start", start)
+
+    spec = {"entity_type": "machine", "entity_id": 7, "tenant_id": tenant_id}
+    response = _post(client, "/entity-rooms", [spec], token=bound_token)
+
+    assert response.status_code == (202 if allowed else 403)
+    assert len(started) == (1 if allowed else 0)
@@ -0,0 +1,257 @@
+"""Room list, lookup and membership endpoints."""
+
+from datetime import datetime, timedelta, timezone
+
+import json
+
+import anyio
+import pytest
+
+from app.database import SessionLocal
+from app.routers import rooms as rooms_router
+from app.models import RoomMapping, RoomMember, RoomType
+from app.services.matrix_client import matrix_client
+from app.services.room_manager import entity_room_key, get_or_create_entity_room
+
+
+@pytest.fixture
+def joined_rooms(monkeypatch):
+    """Rooms Conduit reports as joined, by access token."""
+    joined = {}
+
+    async def list_joined_rooms(access_token):
+        return joined.get(access_token, [])
+
+    monkeypatch.setattr(matrix_client, "list_joined_rooms", list_joined_rooms)
+    return joined
+
+
+def _add_rooms(db, count, tenant_id=1, same_activity_every=1):
+    base = datetime(2026, 10, 1, tzinfo=timezone.utc)
+    rooms = []
+    for i in range(count):
+        rooms.append(RoomMapping(
+            matrix_room_id=f"!room{i}:hub.local",
+            room_type=RoomType.entity,
+            display_name=f"Room {i}",
+            tenant_id=tenant_id,
+            entity_type="machine",
+            entity_id=i,
+            # Groups of rooms share a timestamp, so ties are broken by id
+            last_activity_at=base + timedelta(minutes=i // same_activity_every),
+        ))
+    db.add_all(rooms)
+    db.commit()
+    return [room.matrix_room_id for room in rooms]
+
+
+def test_room_list_pages_follow_activity_without_gaps(client, db, make_user, joined_rooms):
+    user = make_user("mueller")
+    room_ids = _add_rooms(db, 11, same_activity_every=3)
+    joined_rooms[user.get_matrix_access_token()] = room_ids
+    client.as_user(user)
+
+    seen, cursor = [], None
+    while True:
+        params = {"limit": 4, **({"cursor": cursor} if cursor else {})}
+        page = client.get("/api/v1/rooms", params=params).json()
+        seen += [room["matrix_room_id"] for room in page["rooms"]]
+        if not page["has_more"]:
+            assert page["next_cursor"] is None
+            break
+        cursor = page["next_cursor"]
+
+    # Newest activity first, ties by newest room, every room exactly once
+    assert seen == list(reversed(room_ids))
+
+
+def test_room_list_only_shows_joined_rooms(client, db, make_user, joined_rooms):
+    user = make_user("mueller")
+    room_ids = _add_rooms(db, 5)
+    joined_rooms[user.get_matrix_access_token()] = room_ids[:2] + ["!unmapped:hub.local"]
+    client.as_user(user)
+
+    rooms = client.get("/api/v1/rooms").json()["rooms"]
+
+    assert [room["matrix_room_id"] for room in rooms] == [
+        room_ids[1], room_ids[0], "!unmapped:hub.local",
+    ]
+
+
+@pytest.fixture
+def conduit_rooms(monkeypatch):
+    """Fake room creation; ``created`` and ``calls`` record what reached Conduit."""
+    conduit = type("Conduit", (), {"created": [], "calls": [], "on_create": None})
+
+    async def create_room(access_token, name, **kwargs):
+        await anyio.sleep(0.01)
+        room_id = f"!created{len(conduit.created) + 1}:hub.local"
+        conduit.created.append(room_id)
+        if conduit.on_create:
+            conduit.on_create()
+        return room_id
+
+    async def whoami(access_token):
+        return "@notification_bot:hub.local"
+
+    async def get_room_memberships(access_token, room_id):
+        return {"@notification_bot:hub.local": "join", "@mueller:hub.local": "invite"}
+
+    async def kick_user(access_token, room_id, user_id, reason=None):
+        conduit.calls.append(("kick", room_id, user_id))
+
+    async def leave_room(access_token, room_id):
+        conduit.calls.append(("leave", room_id))
+
+    async def join_room(access_token, room_id):
+        pass
+
+    for name, fake in [
+        ("create_room", create_room),
+        ("whoami", whoami),
+        ("get_room_memberships", get_room_memberships),
+        ("kick_user", kick_user),
+        ("leave_room", leave_room),
+        ("join_room", join_room),
+    ]:
+        monkeypatch.setattr(matrix_client, name, fake)
+    return conduit
+
+
+async def _entity_room(db):
+    return await get_or_create_entity_room("machine", 7, "Fraese 7", "bot-token", db)
+
+
+@pytest.mark.anyio
+async def test_concurrent_get_or_create_creates_one_room(db, conduit_rooms):
+    sessions = [SessionLocal() for _ in range(3)]
+    try:
+        mappings = []
+        async with anyio.create_task_group() as tg:
+            for session in sessions:
+                async def get(session=session):
+                    mappings.append(await _entity_room(session))
+                tg.start_soon(get)
+    finally:
+        for session in sessions:
+            session.close()
+
+    assert conduit_rooms.created == ["!created1:hub.local"]
+    assert {m.matrix_room_id for m in mappings} == {"!created1:hub.local"}
+
+
+@pytest.mark.anyio
+async def test_room_lost_to_another_process_is_discarded(db, conduit_rooms):
+    def other_process_stores_its_room():
+        other = SessionLocal()
+        other.add(RoomMapping(
+            matrix_room_id="!theirs:hub.local",
+            room_type=RoomType.entity,
+            display_name="Fraese 7",
+            entity_type="machine",
+            entity_id=7,
+            room_key=entity_room_key("machine", 7),
+        ))
+        other.commit()
+        other.close()
+
+    conduit_rooms.on_create = other_process_stores_its_room
+
+    mapping = await _entity_room(db)
+
+    assert mapping.matrix_room_id == "!theirs:hub.local"
+    assert conduit_rooms.calls == [
+        ("kick", "!created1:hub.local", "@mueller:hub.local"),
+        ("leave", "!created1:hub.local"),
+    ]
+
+
+def _add_machine_room(db, entity_id, tenant_id):
+    room_id = f"!machine{entity_id}:hub.local"
+    db.add(RoomMapping(
+        matrix_room_id=room_id,
+        room_type=RoomType.entity,
+        display_name=f"machine #{entity_id}",
+        tenant_id=tenant_id,
+        entity_type="machine",
+        entity_id=entity_id,
+        room_key=entity_room_key("machine", entity_id),
+        message_count=3,
+    ))
+    db.commit()
+    return room_id
+
+
+def test_entity_lookup_hides_other_tenants_rooms_unless_joined(client, db, make_user):
+    user = make_user("mueller", tenant_id=1)
+    own = _add_machine_room(db, 1, tenant_id=1)
+    foreign = _add_machine_room(db, 2, tenant_id=2)
+    shared = _add_machine_room(db, 3, tenant_id=2)
+    db.add(RoomMember(matrix_user_id=user.matrix_user_id, matrix_room_id=shared))
+    db.commit()
+    client.as_user(user)
+
+    entities = [{"entity_type": "machine", "entity_id": i} for i in (1, 2, 3, 4)]
+    rooms = client.post("/api/v1/rooms/entities/lookup", json={"entities": entities}).json()["rooms"]
+
+    assert [room["matrix_room_id"] for room in rooms] == [own, None, shared, None]
+    assert [room["unread_count"] for room in rooms] == [3, 0, 3, 0]
+
+
+def test_only_joined_rooms_can_be_marked_read(client, db, make_user, joined_rooms):
+    user = make_user("mueller", tenant_id=1)
+    joined = _add_machine_room(db, 1, tenant_id=1)
+    other = _add_machine_room(db, 2, tenant_id=2)
+    joined_rooms[user.get_matrix_access_token()] = [joined]
+    client.as_user(user)
+
+    assert client.post(f"/api/v1/rooms/{other}/read").status_code == 404
+    response = client.post(f"/api/v1/rooms/{joined}/read")  # joined elsewhere, found by the re-sync
+    assert response.json() == {"ok": True, "read_count": 3}
+
+
+@pytest.fixture
+def invited(monkeypatch):
+    """Users ensure_user_in_room was called for (every invite succeeds)."""
+    users = []
+
+    async def ensure_user_in_room(target, room_id, inviter_token):
+        users.append(target.hub_user_id)
+        return True
+
+    monkeypatch.setattr(rooms_router, "ensure_user_in_room", ensure_user_in_room)
+    return users
+
+
+def _bulk_invite(client, selectors):
+    response = client.post("/api/v1/rooms/!room:hub.local/invite-bulk", json=selectors)
+    lines = [json.loads(line) for line in response.text.splitlines()] if response.is_success else []
+    return response, lines
+
+
+def test_bulk_invite_of_non_admin_stays_in_own_tenant(client, make_user, invited):
+    user = make_user("mueller", tenant_id=1)
+    make_user("schmidt", tenant_id=1, role="technician")
+    make_user("weber", tenant_id=2, role="technician")
+    client.as_user(user)
+
+    response, _ = _bulk_invite(client, {"tenant_id": 2})
+    assert response.status_code == 403
+
+    _, lines = _bulk_invite(client, {"role": "technician", "hub_user_ids": ["weber"]})
+    assert {line["hub_user_id"]: line["status"] for line in lines[:-1]} == {
+        "weber": "not_found", "schmidt": "joined",
+    }
+    assert lines[-1] == {"done": True, "joined": 1, "failed": 0, "not_found": 1}
+    assert invited == ["schmidt"]
+
+
+def test_admin_bulk_invites_across_tenants(client, make_user, invited):
+    admin = make_user("admin", tenant_id=1, role="admin")
+    make_user("weber", tenant_id=2, role="technician")
+    client.as_user(admin)
+
+    _, lines = _bulk_invite(client, {"tenant_id": 2})
+
+    assert lines[-1]["joined"] == 1
+    assert invited == ["weber"]
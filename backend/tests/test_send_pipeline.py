@@ -0,0 +1,103 @@
+"""Accept-then-deliver pipeline and outbox retention."""
+
+import time
+from datetime import datetime, timedelta, timezone
+
+import anyio
+import pytest
+
+from app.models import MessageOutbox, OutboxStatus
+from app.services import notification_retention, send_pipeline
+from app.services.matrix_client import MatrixClientError, matrix_client
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+async def pipeline(monkeypatch):
+    """Running pipeline whose Matrix sends are recorded in ``sent``."""
+    sent = []
+    failures = {}  # body -> number of attempts that fail
+
+    async def send_message_event(access_token, room_id, content, txn_id):
+        body = content["body"]
+        if failures.get(body, 0) > 0:
+            failures[body] -= 1
+            raise MatrixClientError("Send failed: 502")
+        sent.append((time.monotonic(), room_id, body))
+        return f"$event-{body}"
+
+    async def notify(*args, **kwargs):
+        pass
+
+    monkeypatch.setattr(matrix_client, "send_message_event", send_message_event)
+    monkeypatch.setattr(send_pipeline, "notify_room_members", notify)
+    await send_pipeline.start()
+    pipeline = type("Pipeline", (), {"sent": sent, "failures": failures})
+    try:
+        yield pipeline
+    finally:
+        await send_pipeline.stop()
+
+
+async def _wait_until(condition, timeout=5.0):
+    with anyio.fail_after(timeout):
+        while not condition():
+            await anyio.sleep(0.02)
+
+
+async def test_failed_send_is_retried_in_order_without_blocking_other_rooms(db, make_user, pipeline):
+    user = make_user("mueller")
+    pipeline.failures["a1"] = 1
+    started = time.monotonic()
+    for room, body in [("!a", "a1"), ("!a", "a2"), ("!b", "b1")]:
+        send_pipeline.enqueue_message(room, user, {"msgtype": "m.text", "body": body}, db)
+
+    await _wait_until(lambda: len(pipeline.sent) == 3)
+
+    sent_at = {body: at - started for at, _room, body in pipeline.sent}
+    assert [body for _at, room, body in pipeline.sent if room == "!a"] == ["a1", "a2"]
+    # Room b went out while room a waited for its one-second backoff
+    assert sent_at["b1"] < 0.5 <= sent_at["a1"]
+    db.expire_all()
+    rows = {row.provisional_id: row for row in db.query(MessageOutbox)}
+    assert {row.status for row in rows.values()} == {OutboxStatus.sent}
+    assert sorted(row.attempts for row in rows.values()) == [1, 1, 2]
+
+
+async def test_send_is_marked_failed_after_the_last_attempt(db, make_user, pipeline, monkeypatch):
+    monkeypatch.setattr(send_pipeline, "MESSAGE_SEND_MAX_ATTEMPTS", 1)
+    user = make_user("mueller")
+    pipeline.failures["lost"] = 1
+    entry = send_pipeline.enqueue_message("!a", user, {"msgtype": "m.text", "body": "lost"}, db)
+
+    def failed():
+        db.expire_all()
+        return db.get(MessageOutbox, entry.id).status == OutboxStatus.failed
+
+    await _wait_until(failed)
+    assert pipeline.sent == []
+
+
+async def test_retention_deletes_finished_outbox_rows_only(db, monkeypatch):
+    monkeypatch.setattr(notification_retention, "MESSAGE_OUTBOX_RETENTION_SECONDS", 3600)
+    old = datetime.now(timezone.utc) - timedelta(hours=2)
+    for provisional_id, status, created_at in [
+        ("old-sent", OutboxStatus.sent, old),
+        ("old-failed", OutboxStatus.failed, old),
+        ("old-pending", OutboxStatus.pending, old),
+        ("new-sent", OutboxStatus.sent, datetime.now(timezone.utc)),
+    ]:
+        db.add(MessageOutbox(
+            provisional_id=provisional_id,
+            room_id="!a",
+            sender_hub_user_id="mueller",
+            content="{}",
+            status=status,
+            created_at=created_at,
+        ))
+    db.commit()
+
+    assert await notification_retention.purge_outbox() == 2
+    remaining = {provisional_id for (provisional_id,) in db.query(MessageOutbox.provisional_id)}
+    assert remaining == {"old-pending", "new-sent"}
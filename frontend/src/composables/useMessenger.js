@@ -40,9 +40,18 @@ export function useMessenger() {
     // Reset unread count for this room
     const room = rooms.value.find(r => r.matrix_room_id === roomId)
     if (room) room.unread_count = 0
+    markRead(roomId)
     await fetchMessages(roomId)
   }
 
+  async function markRead(roomId) {
+    try {
+      await api.post(`/api/v1/rooms/${encodeURIComponent(roomId)}/read`)
+    } catch (err) {
+      console.error('Failed to mark room as read:', err)
+    }
+  }
+
   async function fetchMessages(roomId, fromToken = null) {
     loading.value = true
     try {
@@ -197,6 +206,8 @@ export function useMessenger() {
       room.last_message_ts = msg.timestamp
       if (msg.room_id !== currentRoomId.value) {
         room.unread_count = (room.unread_count || 0) + 1
+      } else {
+        markRead(msg.room_id)
       }
     } else {
       // Unknown room — reload rooms and then auto-select if no room is active